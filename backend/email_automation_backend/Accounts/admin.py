@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import User, Company, Invitation, RefreshToken
+from .models import User, Company, Invitation, RefreshToken, RevokedAccessToken
 
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Company)
 admin.site.register(Invitation)
 admin.site.register(RefreshToken)
+admin.site.register(RevokedAccessToken)
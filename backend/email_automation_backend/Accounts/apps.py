@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Accounts'
+    
+    def ready(self):
+        # Drop cached token authentication when users, tokens or profiles change
+        from . import signals  # noqa: F401
@@ -0,0 +1,191 @@
+from functools import wraps
+
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from email_automation_backend.caching import cache_is_shared
+from .models import User
+from .tokens import decode_access_token, decode_events_ticket, is_access_token_revoked
+
+# Related objects most views reach through request.user; loading them with the
+# user keeps them out of per-request lazy queries
+AUTH_USER_RELATED = ('company', 'hubspot_account', 'ai_settings')
+
+# Authorization header keywords accepted for signed access tokens. "Token" is
+# kept so clients written for DRF tokens keep working with the new tokens.
+ACCESS_TOKEN_KEYWORDS = (b'bearer', b'token')
+
+
+def _auth_cache_key(token_key):
+    return f'auth_token:{token_key}'
+
+
+def _user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def invalidate_cached_auth(**user_filter):
+    """
+    Drop cached authentication so the next request reloads it.
+    Takes User filters, e.g. pk=... or company_id=...
+    """
+    keys = []
+    for user_id, token_key in User.objects.filter(**user_filter).values_list('pk', 'auth_token__key'):
+        keys.append(_user_cache_key(user_id))
+        if token_key:
+            keys.append(_auth_cache_key(token_key))
+    cache.delete_many(keys)
+
+
+def invalidate_cached_token(token_key):
+    cache.delete(_auth_cache_key(token_key))
+
+
+def get_cached_user(user_id):
+    """
+    Active user with its related objects, cached for AUTH_CACHE_TIMEOUT seconds; None if unknown.
+    Only a shared cache is used: invalidations run in the process that saved the
+    change, and other processes of a per-process cache would keep the stale user.
+    """
+    shared = cache_is_shared()
+    cache_key = _user_cache_key(user_id)
+    user = cache.get(cache_key) if shared else None
+    if user is None:
+        user = User.objects.select_related(*AUTH_USER_RELATED).filter(pk=user_id).first()
+        if user is None:
+            return None
+        if shared:
+            cache.set(cache_key, user, settings.AUTH_CACHE_TIMEOUT)
+    return user if user.is_active else None
+
+
+def authenticate_access_token(raw_token):
+    """Resolve (user, payload) from a signed access token, raising AuthenticationFailed if it is not usable"""
+    try:
+        payload = decode_access_token(raw_token)
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed('Access token expired.')
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed('Invalid access token.')
+
+    if is_access_token_revoked(payload):
+        raise exceptions.AuthenticationFailed('Access token revoked.')
+
+    user = get_cached_user(payload['sub'])
+    if user is None:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return user, payload
+
+
+def looks_like_access_token(value):
+    """Signed access tokens have three dot-separated parts; DRF token keys are plain hex"""
+    return value.count('.') == 2
+
+
+class AccessTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates signed access tokens (JWT) sent as "Bearer <token>" or "Token <token>".
+    Signature, expiry and revocation are checked without a database read; the
+    user comes from the auth cache when it is shared. Credentials that are not
+    JWTs are left to the next authentication class.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() not in ACCESS_TOKEN_KEYWORDS:
+            return None
+
+        try:
+            raw_token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        if not looks_like_access_token(raw_token):
+            return None
+
+        return authenticate_access_token(raw_token)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the resolved token and user, together with
+    the user's company, HubSpot account and AI settings, for AUTH_CACHE_TIMEOUT seconds.
+    Without a shared cache they are loaded in one query per request instead.
+    """
+
+    def authenticate_credentials(self, key):
+        shared = cache_is_shared()
+        cache_key = _auth_cache_key(key)
+        token = cache.get(cache_key) if shared else None
+
+        if token is None:
+            try:
+                token = Token.objects.select_related(
+                    'user', *(f'user__{name}' for name in AUTH_USER_RELATED)
+                ).get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            if shared:
+                cache.set(cache_key, token, settings.AUTH_CACHE_TIMEOUT)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return (token.user, token)
+
+
+def authenticate_events_ticket(raw_ticket):
+    """User of an event stream ticket, or None if the ticket is not usable"""
+    try:
+        payload = decode_events_ticket(raw_ticket)
+    except jwt.InvalidTokenError:
+        return None
+    return get_cached_user(payload['sub'])
+
+
+async def aauthenticate_request(request, allow_query_ticket=False):
+    """
+    Resolve the user of a plain async Django view from its Authorization header,
+    or from an event stream ?ticket= when allow_query_ticket is set (EventSource
+    cannot send headers). Returns None when credentials are missing or invalid.
+    """
+    ticket = request.GET.get('ticket', '') if allow_query_ticket else ''
+    if ticket:
+        return await sync_to_async(authenticate_events_ticket)(ticket)
+
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower().encode() not in ACCESS_TOKEN_KEYWORDS:
+        return None
+    token_key = auth[1]
+
+    try:
+        if looks_like_access_token(token_key):
+            user, _ = await sync_to_async(authenticate_access_token)(token_key)
+        else:
+            user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(token_key)
+    except exceptions.AuthenticationFailed:
+        return None
+    return user
+
+
+def async_auth_required(view_func):
+    """Authenticate an async function view like IsAuthenticated would, setting request.user"""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await aauthenticate_request(request)
+        if user is None:
+            return JsonResponse({
+                'message': 'Authentication credentials were not provided or are invalid'
+            }, status=401)
+        request.user = user
+        return await view_func(request, *args, **kwargs)
+    return wrapper
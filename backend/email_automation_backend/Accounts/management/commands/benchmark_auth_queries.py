@@ -0,0 +1,91 @@
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from Accounts.authentication import AccessTokenAuthentication, CachedTokenAuthentication, invalidate_cached_token
+from Accounts.models import Company, User
+from Accounts.tokens import issue_access_token
+from Ai_processing.models import AIProcessingSettings
+from User.models import EmailAccount
+
+DEFAULT_PATHS = [
+    '/api/accounts/auth/verify/',
+    '/api/email-accounts/',
+    '/api/get-emails/',
+    '/api/ai/settings/',
+    '/api/ai/stats/',
+    '/api/hubspot/status/',
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Count SQL queries per request with stock token authentication, cached tokens and signed access tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS,
+                            help='GET endpoints to measure')
+
+    def handle(self, *args, **options):
+        # Synthetic data lives only inside this transaction and is rolled back
+        try:
+            with transaction.atomic():
+                token = self._create_fixture()
+                access_token = issue_access_token(token.user)
+                backends = [
+                    (TokenAuthentication, token.key),
+                    (CachedTokenAuthentication, token.key),
+                    (AccessTokenAuthentication, access_token),
+                ]
+                self.stdout.write(f"{'endpoint':<32}  {'token auth':>10}  {'cached auth':>11}  {'access token':>12}")
+                totals = [0, 0, 0]
+                for path in options['paths']:
+                    counts = [self._count_queries(path, credentials, backend) for backend, credentials in backends]
+                    totals = [total + count for total, count in zip(totals, counts)]
+                    self.stdout.write(f"{path:<32}  {counts[0]:>10}  {counts[1]:>11}  {counts[2]:>12}")
+                self.stdout.write(f"{'total':<32}  {totals[0]:>10}  {totals[1]:>11}  {totals[2]:>12}")
+                invalidate_cached_token(token.key)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_fixture(self):
+        suffix = uuid.uuid4().hex[:8]
+        company = Company.objects.create(name=f'Benchmark {suffix}', domain=f'benchmark-{suffix}.example.com')
+        user = User.objects.create_user(
+            username=f'benchmark-{suffix}',
+            email=f'benchmark-{suffix}@example.com',
+            password=uuid.uuid4().hex,
+            company=company
+        )
+        AIProcessingSettings.objects.create(user=user)
+        EmailAccount.objects.create(user=user, email_address=user.email)
+        return Token.objects.create(user=user)
+
+    def _count_queries(self, path, credentials, authentication_class):
+        """Queries of one warm request to path, authenticated with authentication_class"""
+        match = resolve(path)
+        view_class = match.func.cls
+        original = view_class.authentication_classes
+        view_class.authentication_classes = [authentication_class]
+        try:
+            factory = APIRequestFactory()
+            # The first request warms caches (auth, mailbox version, inbox pages) alike for both backends
+            for _ in range(2):
+                request = factory.get(path, HTTP_AUTHORIZATION=f'Token {credentials}')
+                with CaptureQueriesContext(connection) as queries:
+                    response = match.func(request, *match.args, **match.kwargs)
+                    if hasattr(response, 'render'):
+                        response.render()
+            return len(queries.captured_queries)
+        finally:
+            view_class.authentication_classes = original
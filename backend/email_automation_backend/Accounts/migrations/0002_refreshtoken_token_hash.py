@@ -0,0 +1,32 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_refresh_tokens(apps, schema_editor):
+    """Replace stored refresh tokens with their SHA-256 hash so issued tokens keep working"""
+    RefreshToken = apps.get_model('Accounts', 'RefreshToken')
+    for refresh_token in RefreshToken.objects.all().iterator():
+        refresh_token.token = hashlib.sha256(refresh_token.token.encode()).hexdigest()
+        refresh_token.save(update_fields=['token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_refresh_tokens, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='refreshtoken',
+            old_name='token',
+            new_name='token_hash',
+        ),
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Accounts', '0003_revokedaccesstoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshtoken',
+            name='rotated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
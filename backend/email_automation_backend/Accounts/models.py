@@ -80,13 +80,21 @@ class Invitation(models.Model):
 
 
 class RefreshToken(models.Model):
-    """Refresh tokens for authentication"""
+    """Refresh tokens for authentication; only a SHA-256 hash of the token is stored"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='refresh_tokens')
-    token = models.CharField(max_length=500, unique=True, default=secrets.token_urlsafe)
+    token_hash = models.CharField(max_length=64, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    # Set when the token was spent by a refresh, as opposed to revoked by logout
+    rotated_at = models.DateTimeField(blank=True, null=True)
     
     class Meta:
         ordering = ['-created_at']
+
+
+class RevokedAccessToken(models.Model):
+    """Access tokens revoked before they expire (logout), shared by every process"""
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
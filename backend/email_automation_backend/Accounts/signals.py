@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_cached_auth, invalidate_cached_token
+from .models import Company, User
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    invalidate_cached_auth(pk=instance.pk)
+
+
+@receiver(post_save, sender=Company)
+def company_changed(sender, instance, **kwargs):
+    invalidate_cached_auth(company_id=instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    invalidate_cached_token(instance.key)
+
+
+@receiver(post_save, sender='Ai_processing.AIProcessingSettings')
+@receiver(post_delete, sender='Ai_processing.AIProcessingSettings')
+@receiver(post_save, sender='hubspot_integration.HubSpotAccount')
+@receiver(post_delete, sender='hubspot_integration.HubSpotAccount')
+def user_profile_changed(sender, instance, **kwargs):
+    invalidate_cached_auth(pk=instance.user_id)
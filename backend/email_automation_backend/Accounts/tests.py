@@ -1,3 +1,132 @@
-from django.test import TestCase
+import tempfile
+import time
+import uuid
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import exceptions
+
+from .authentication import authenticate_access_token, authenticate_events_ticket
+from .models import RefreshToken, User
+from .tokens import (
+    RefreshTokenError, hash_refresh_token, is_access_token_revoked, issue_access_token, issue_events_ticket,
+    issue_token_pair, revoke_access_token, rotate_refresh_token
+)
+
+
+class RefreshTokenRotationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='secret')
+
+    def test_rotation_spends_the_presented_token(self):
+        _, refresh_token = issue_token_pair(self.user)
+
+        user, access_token, new_refresh_token = rotate_refresh_token(refresh_token)
+
+        self.assertEqual(user, self.user)
+        self.assertTrue(access_token)
+        self.assertNotEqual(new_refresh_token, refresh_token)
+        self.assertEqual(RefreshToken.objects.filter(user=self.user, is_active=True).count(), 1)
+        rotate_refresh_token(new_refresh_token)
+
+    def test_second_login_keeps_the_first_session(self):
+        _, laptop_token = issue_token_pair(self.user)
+        _, phone_token = issue_token_pair(self.user)
+
+        rotate_refresh_token(laptop_token)
+        rotate_refresh_token(phone_token)
+
+    def test_reuse_within_grace_is_refused_without_signing_out(self):
+        _, refresh_token = issue_token_pair(self.user)
+        _, _, new_refresh_token = rotate_refresh_token(refresh_token)
+
+        with self.assertRaisesMessage(RefreshTokenError, 'Refresh token already used'):
+            rotate_refresh_token(refresh_token)
+        rotate_refresh_token(new_refresh_token)
+
+    @override_settings(JWT_REFRESH_REUSE_GRACE=0)
+    def test_reuse_after_grace_deactivates_every_session(self):
+        _, refresh_token = issue_token_pair(self.user)
+        _, other_session_token = issue_token_pair(self.user)
+        _, _, new_refresh_token = rotate_refresh_token(refresh_token)
+        RefreshToken.objects.filter(rotated_at__isnull=False).update(
+            rotated_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        with self.assertRaisesMessage(RefreshTokenError, 'Refresh token already used'):
+            rotate_refresh_token(refresh_token)
+        for token in (new_refresh_token, other_session_token):
+            with self.assertRaisesMessage(RefreshTokenError, 'Refresh token revoked'):
+                rotate_refresh_token(token)
+
+    def test_revoked_token_is_refused_without_touching_other_sessions(self):
+        _, revoked_token = issue_token_pair(self.user)
+        _, other_session_token = issue_token_pair(self.user)
+        RefreshToken.objects.filter(token_hash=hash_refresh_token(revoked_token)).update(is_active=False)
+
+        with self.assertRaisesMessage(RefreshTokenError, 'Refresh token revoked'):
+            rotate_refresh_token(revoked_token)
+        rotate_refresh_token(other_session_token)
+
+    def test_expired_token_is_refused(self):
+        _, refresh_token = issue_token_pair(self.user)
+        RefreshToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        with self.assertRaisesMessage(RefreshTokenError, 'Refresh token expired'):
+            rotate_refresh_token(refresh_token)
+
+    def test_unknown_token_is_refused(self):
+        with self.assertRaisesMessage(RefreshTokenError, 'Invalid refresh token'):
+            rotate_refresh_token('not-a-token')
+
+
+class AccessTokenRevocationTests(TestCase):
+    def _payload(self):
+        return {'jti': uuid.uuid4().hex, 'exp': time.time() + 60}
+
+    def test_revoked_token_is_seen_without_further_queries(self):
+        payload, other = self._payload(), self._payload()
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke_access_token(payload)
+
+        self.assertTrue(is_access_token_revoked(payload))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_access_token_revoked(payload))
+            self.assertFalse(is_access_token_revoked(other))
+
+    def test_shared_cache_eviction_keeps_tokens_revoked(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        }):
+            payload = self._payload()
+            self.assertFalse(is_access_token_revoked(payload))
+            with self.captureOnCommitCallbacks(execute=True):
+                revoke_access_token(payload)
+            with self.assertNumQueries(1):
+                self.assertTrue(is_access_token_revoked(payload))
+            with self.assertNumQueries(0):
+                self.assertTrue(is_access_token_revoked(payload))
+
+            cache.clear()
+            self.assertTrue(is_access_token_revoked(payload))
+
+
+class EventsTicketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='secret')
+
+    def test_ticket_authenticates_the_stream(self):
+        self.assertEqual(authenticate_events_ticket(issue_events_ticket(self.user)), self.user)
+
+    def test_access_token_is_not_a_ticket(self):
+        self.assertIsNone(authenticate_events_ticket(issue_access_token(self.user)))
+
+    def test_ticket_is_not_an_access_token(self):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authenticate_access_token(issue_events_ticket(self.user))
+
+    @override_settings(JWT_EVENTS_TICKET_LIFETIME=-1)
+    def test_expired_ticket_is_refused(self):
+        self.assertIsNone(authenticate_events_ticket(issue_events_ticket(self.user)))
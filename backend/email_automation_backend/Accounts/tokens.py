@@ -0,0 +1,208 @@
+import hashlib
+import secrets
+import time
+import uuid
+from datetime import timedelta
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from email_automation_backend.caching import cache_is_shared
+from .models import RefreshToken, RevokedAccessToken
+
+JWT_ALGORITHM = 'HS256'
+
+# Revocations each process holds in memory: (live revoked jtis, revocation version
+# they were loaded at, time.monotonic() of the load)
+_revocations = (frozenset(), None, 0.0)
+
+REVOCATIONS_VERSION_KEY = 'revoked_access_tokens:version'
+
+
+def issue_access_token(user):
+    """Signed, short-lived access token for a user"""
+    now = int(time.time())
+    payload = {
+        'sub': str(user.pk),
+        'jti': uuid.uuid4().hex,
+        'type': 'access',
+        'iat': now,
+        'exp': now + settings.JWT_ACCESS_TOKEN_LIFETIME,
+    }
+    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def decode_access_token(raw_token):
+    """Verify signature and expiry; raises jwt.InvalidTokenError subclasses"""
+    payload = jwt.decode(
+        raw_token,
+        settings.JWT_SECRET_KEY,
+        algorithms=[JWT_ALGORITHM],
+        options={'require': ['sub', 'jti', 'exp']}
+    )
+    if payload.get('type') != 'access':
+        raise jwt.InvalidTokenError('Not an access token')
+    return payload
+
+
+def issue_events_ticket(user):
+    """
+    Signed ticket that only opens the event stream, valid for JWT_EVENTS_TICKET_LIFETIME
+    seconds. EventSource cannot send headers, so the stream is authenticated from
+    the URL, and access logs record URLs: the ticket is useless anywhere else.
+    """
+    now = int(time.time())
+    payload = {
+        'sub': str(user.pk),
+        'type': 'events',
+        'iat': now,
+        'exp': now + settings.JWT_EVENTS_TICKET_LIFETIME,
+    }
+    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def decode_events_ticket(raw_ticket):
+    """Verify an event stream ticket; raises jwt.InvalidTokenError subclasses"""
+    payload = jwt.decode(
+        raw_ticket,
+        settings.JWT_SECRET_KEY,
+        algorithms=[JWT_ALGORITHM],
+        options={'require': ['sub', 'exp']}
+    )
+    if payload.get('type') != 'events':
+        raise jwt.InvalidTokenError('Not an event stream ticket')
+    return payload
+
+
+def revoke_access_token(payload):
+    """
+    Add an access token to the revocation list. Rows are stored in the database
+    so every process sees them, and expired rows are pruned on each revocation,
+    so the list never holds more than one access-token lifetime of revocations.
+    """
+    remaining = int(payload['exp'] - time.time())
+    if remaining <= 0:
+        return
+    now = timezone.now()
+    RevokedAccessToken.objects.filter(expires_at__lte=now).delete()
+    RevokedAccessToken.objects.get_or_create(
+        jti=payload['jti'],
+        defaults={'expires_at': now + timedelta(seconds=remaining)}
+    )
+    transaction.on_commit(_revocations_changed)
+
+
+def _revocations_changed():
+    """Make every process reload its revocations: this one now, the others through the shared version"""
+    global _revocations
+    _revocations = (_revocations[0], None, 0.0)
+    if cache_is_shared():
+        try:
+            cache.incr(REVOCATIONS_VERSION_KEY)
+        except ValueError:
+            # Evicted: the next reader sets a new version and reloads anyway
+            pass
+
+
+def _revocations_version():
+    """Current revocation version in the shared cache; a missing (evicted) key gets a new one"""
+    version = cache.get(REVOCATIONS_VERSION_KEY)
+    if version is None:
+        cache.add(REVOCATIONS_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(REVOCATIONS_VERSION_KEY)
+    return version
+
+
+def is_access_token_revoked(payload):
+    """
+    Whether an access token was revoked, from the revocations held in memory.
+    They are reloaded from the database when the version in the shared cache
+    moves or disappears, so an eviction never un-revokes a token; without a
+    shared cache they are reloaded every JWT_REVOCATION_RELOAD_SECONDS.
+    """
+    global _revocations
+    jtis, loaded_version, loaded_at = _revocations
+    if cache_is_shared():
+        version = _revocations_version()
+        stale = version != loaded_version
+    else:
+        version = None
+        stale = not loaded_at or time.monotonic() - loaded_at > settings.JWT_REVOCATION_RELOAD_SECONDS
+    if stale:
+        jtis = frozenset(
+            RevokedAccessToken.objects.filter(expires_at__gt=timezone.now()).values_list('jti', flat=True)
+        )
+        _revocations = (jtis, version, time.monotonic())
+    return payload['jti'] in jtis
+
+
+def hash_refresh_token(raw_token):
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+def issue_refresh_token(user):
+    """Create a refresh token; only its hash is stored, the raw value is returned once"""
+    raw_token = secrets.token_urlsafe(48)
+    RefreshToken.objects.create(
+        user=user,
+        token_hash=hash_refresh_token(raw_token),
+        expires_at=timezone.now() + timedelta(seconds=settings.JWT_REFRESH_TOKEN_LIFETIME)
+    )
+    return raw_token
+
+
+def issue_token_pair(user):
+    """Access token plus a fresh refresh token; the user's other sessions keep theirs"""
+    return issue_access_token(user), issue_refresh_token(user)
+
+
+class RefreshTokenError(Exception):
+    pass
+
+
+def rotate_refresh_token(raw_token):
+    """
+    Exchange a refresh token for a new token pair. Returns (user, access_token, refresh_token).
+    Presenting a token that was already rotated away deactivates every refresh token
+    of its user, since the token has most likely leaked. Within JWT_REFRESH_REUSE_GRACE
+    seconds of its rotation the token is only refused, so two tabs refreshing with the
+    same token do not sign the user out. Tokens revoked by logout are only refused.
+    """
+    with transaction.atomic():
+        refresh_token = (
+            RefreshToken.objects.select_for_update()
+            .select_related('user')
+            .filter(token_hash=hash_refresh_token(raw_token))
+            .first()
+        )
+        if refresh_token is None:
+            raise RefreshTokenError('Invalid refresh token')
+
+        # Deactivations below must commit, so failures are raised after the block
+        user = refresh_token.user
+        now = timezone.now()
+        error = None
+        if refresh_token.rotated_at is not None:
+            if now > refresh_token.rotated_at + timedelta(seconds=settings.JWT_REFRESH_REUSE_GRACE):
+                RefreshToken.objects.filter(user=user, is_active=True).update(is_active=False)
+            error = 'Refresh token already used'
+        elif not refresh_token.is_active:
+            error = 'Refresh token revoked'
+        elif now > refresh_token.expires_at:
+            refresh_token.is_active = False
+            refresh_token.save(update_fields=['is_active'])
+            error = 'Refresh token expired'
+        elif not user.is_active:
+            error = 'User inactive or deleted'
+        else:
+            refresh_token.is_active = False
+            refresh_token.rotated_at = now
+            refresh_token.save(update_fields=['is_active', 'rotated_at'])
+            access_token, new_refresh_token = issue_token_pair(user)
+
+    if error:
+        raise RefreshTokenError(error)
+    return user, access_token, new_refresh_token
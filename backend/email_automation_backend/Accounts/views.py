@@ -11,6 +11,8 @@ from rest_framework.views import APIView
 
 import uuid
 
+from .authentication import invalidate_cached_auth
+from .tokens import issue_token_pair, rotate_refresh_token, revoke_access_token, RefreshTokenError
 from .models import User, Company, Invitation, RefreshToken
 from .serializers import UserSerializer, CompanySerializer, InvitationSerializer
 
@@ -60,12 +62,13 @@ class CompanySignupView(APIView):
                 status='active'
             )
             
-            # Generate auth token
-            token, created = Token.objects.get_or_create(user=user)
+            # Issue signed access token and refresh token
+            access_token, refresh_token = issue_token_pair(user)
             
             return Response({
                 'message': 'Company and admin account created successfully',
-                'token': token.key,
+                'token': access_token,
+                'refresh_token': refresh_token,
                 'user': UserSerializer(user).data
             }, status=status.HTTP_201_CREATED)
             
@@ -120,12 +123,13 @@ class EmployeeSignupView(APIView):
             invitation.accepted_by = user
             invitation.save()
             
-            # Generate auth token
-            token, created = Token.objects.get_or_create(user=user)
+            # Issue signed access token and refresh token
+            access_token, refresh_token = issue_token_pair(user)
             
             return Response({
                 'message': 'Account created successfully',
-                'token': token.key,
+                'token': access_token,
+                'refresh_token': refresh_token,
                 'user': UserSerializer(user).data
             }, status=status.HTTP_201_CREATED)
             
@@ -155,23 +159,14 @@ class LoginView(APIView):
             # Authenticate
             user = authenticate(username=user.username, password=password)
             if user:
-                # Get or create access token
-                token, created = Token.objects.get_or_create(user=user)
-                
-                # Create refresh token
-                # Deactivate existing refresh tokens for this user
-                RefreshToken.objects.filter(user=user, is_active=True).update(is_active=False)
-                
-                # Create new refresh token (expires in 30 days)
-                refresh_token = RefreshToken.objects.create(
-                    user=user,
-                    expires_at=timezone.now() + timedelta(days=30)
-                )
+                # Issue signed access token and refresh token
+                access_token, refresh_token = issue_token_pair(user)
+                invalidate_cached_auth(pk=user.pk)
                 
                 return Response({
                     'message': 'Login successful',
-                    'token': token.key,
-                    'refresh_token': refresh_token.token,
+                    'token': access_token,
+                    'refresh_token': refresh_token,
                     'user': UserSerializer(user).data
                 })
             else:
@@ -239,42 +234,21 @@ class RefreshTokenView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             try:
-                refresh_token = RefreshToken.objects.get(
-                    token=refresh_token_value,
-                    is_active=True
-                )
-                
-                if timezone.now() > refresh_token.expires_at:
-                    refresh_token.is_active = False
-                    refresh_token.save()
-                    return Response({
-                        'message': 'Refresh token expired'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                
-                # Generate new access token
-                access_token, created = Token.objects.get_or_create(user=refresh_token.user)
-                
-                # Optionally create new refresh token (rotate refresh tokens)
-                # Deactivate existing refresh tokens for this user
-                RefreshToken.objects.filter(user=refresh_token.user, is_active=True).update(is_active=False)
-                
-                # Create new refresh token (expires in 30 days)
-                new_refresh_token = RefreshToken.objects.create(
-                    user=refresh_token.user,
-                    expires_at=timezone.now() + timedelta(days=30)
-                )
-                
+                # Rotate: the presented refresh token is spent and a new pair is issued
+                user, access_token, new_refresh_token = rotate_refresh_token(refresh_token_value)
+            except RefreshTokenError as e:
                 return Response({
-                    'message': 'Token refreshed successfully',
-                    'token': access_token.key,
-                    'refresh_token': new_refresh_token.token,
-                    'user': UserSerializer(refresh_token.user).data
-                })
-                
-            except RefreshToken.DoesNotExist:
-                return Response({
-                    'message': 'Invalid refresh token'
+                    'message': str(e)
                 }, status=status.HTTP_400_BAD_REQUEST)
+            
+            invalidate_cached_auth(pk=user.pk)
+            
+            return Response({
+                'message': 'Token refreshed successfully',
+                'token': access_token,
+                'refresh_token': new_refresh_token,
+                'user': UserSerializer(user).data
+            })
                 
         except Exception as e:
             return Response({
@@ -289,11 +263,9 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             # Invalidate access token
-            try:
-                token = Token.objects.get(user=request.user)
-                token.delete()
-            except Token.DoesNotExist:
-                pass
+            if isinstance(request.auth, dict):
+                revoke_access_token(request.auth)
+            Token.objects.filter(user=request.user).delete()
             
             # Invalidate all refresh tokens for this user
             RefreshToken.objects.filter(user=request.user, is_active=True).update(is_active=False)
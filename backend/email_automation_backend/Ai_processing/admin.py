@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AIProcessingSettings, EmailProcessingLog
+from .models import AIProcessingSettings, EmailProcessingLog, DailyStat, AIBatchJob
 
 @admin.register(AIProcessingSettings)
 class AIProcessingSettingsAdmin(admin.ModelAdmin):
@@ -33,7 +33,7 @@ class EmailProcessingLogAdmin(admin.ModelAdmin):
         'email_message__subject', 'email_message__sender', 'ai_category', 'ai_summary'
     ]
     readonly_fields = [
-        'created_at', 'updated_at', 'processing_duration', 'tokens_used'
+        'created_at', 'updated_at', 'processing_duration', 'tokens_used', 'cache_hit', 'tokens_saved'
     ]
     
     fieldsets = (
@@ -52,7 +52,7 @@ class EmailProcessingLogAdmin(admin.ModelAdmin):
             'classes': ('wide',)
         }),
         ('Performance Metrics', {
-            'fields': ('processing_duration', 'tokens_used'),
+            'fields': ('processing_duration', 'tokens_used', 'cache_hit', 'tokens_saved'),
             'classes': ('collapse',)
         }),
         ('Error Information', {
@@ -65,3 +65,18 @@ class EmailProcessingLogAdmin(admin.ModelAdmin):
         })
     )
 
+
+@admin.register(DailyStat)
+class DailyStatAdmin(admin.ModelAdmin):
+    list_display = ['user', 'date', 'metric', 'value', 'updated_at']
+    list_filter = ['date']
+    search_fields = ['user__email', 'metric']
+
+
+@admin.register(AIBatchJob)
+class AIBatchJobAdmin(admin.ModelAdmin):
+    list_display = ['provider_batch_id', 'user', 'processing_type', 'status', 'attempt',
+                    'succeeded_count', 'failed_count', 'retried_count', 'created_at', 'ingested_at']
+    list_filter = ['status', 'processing_type', 'created_at']
+    search_fields = ['user__email', 'provider_batch_id']
+    readonly_fields = ['id', 'created_at', 'updated_at', 'ingested_at']
@@ -1,74 +1,215 @@
 import os
 import json
+import re
 import time
+import asyncio
 import logging
+import threading
+import weakref
+from functools import lru_cache
 from typing import Dict, Optional, Tuple, Any
-from openai import OpenAI
+from asgiref.sync import sync_to_async
+from openai import AsyncOpenAI, BadRequestError, OpenAI
 from django.conf import settings
+from django.core.cache import cache
+from email_automation_backend.caching import cache_is_shared
+from email_automation_backend.http import get_async_client, get_sync_client
+from email_automation_backend.events import publish_event_on_commit
+from .llm_cache import aget_cached_result, astore_result, llm_cache_key
 from .models import AIProcessingSettings
+from .llm_limits import LLMUnavailable, acall_llm, asettle_streamed_tokens, provider_id
+from .prompt_input import count_tokens, prepare_email_body
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+DEFAULT_PROMPT = """You are a professional email assistant. Your task is to analyze the incoming email and generate an appropriate response.
+
+Please follow these guidelines:
+1. Analyze the email content, tone, and intent
+2. Determine the appropriate response tone (professional, friendly, formal)
+3. Generate a helpful, accurate, and contextually appropriate reply
+4. Keep responses concise but complete
+5. Be polite and professional in all communications
+6. If the email requires specific information you don't have, politely indicate that you'll need to gather more details
+
+Always respond in a helpful and professional manner."""
+
+FALLBACK_ANALYSIS_SUMMARY = "Failed to parse AI analysis"
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# LLM clients are shared per process (sync) or per event loop (async) and per
+# provider, so every email reuses the same keep-alive connections
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+_async_llm_clients = weakref.WeakKeyDictionary()
+
+# (base_url, model) pairs that rejected response_format; asked without it from then on
+_json_mode_unsupported = set()
+# A 400 that is about response_format, not some other problem with the request
+_JSON_MODE_ERROR = re.compile(r'response_format|json[ _]?(mode|object)|structured output', re.IGNORECASE)
+
+
+def get_llm_client(api_key, base_url=OPENROUTER_BASE_URL):
+    """Process-wide OpenAI-compatible client for a provider, on the pooled HTTP client"""
+    key = (api_key, base_url, os.getpid())
+    client = _llm_clients.get(key)
+    if client is None:
+        with _llm_clients_lock:
+            client = _llm_clients.get(key)
+            if client is None:
+                # No client-side retries: llm_limits retries in step with every other worker
+                client = OpenAI(api_key=api_key, base_url=base_url, http_client=get_sync_client(), max_retries=0)
+                _llm_clients[key] = client
+    return client
+
+
+def get_async_llm_client(api_key, base_url=OPENROUTER_BASE_URL):
+    """AsyncOpenAI client for a provider on the running event loop's pooled HTTP client"""
+    clients = _async_llm_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get((api_key, base_url))
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_async_client(), max_retries=0)
+        clients[(api_key, base_url)] = client
+    return client
+
+
+def _ai_settings_cache_key(user_id):
+    return f'ai_settings:{user_id}'
+
+
+def get_ai_settings(user):
+    """
+    A user's AI settings, created on first use and cached until they are saved
+    again. Only a shared cache is used: the save invalidates the web process's
+    entry, and a per-process cache would leave workers on the old settings.
+    """
+    shared = cache_is_shared()
+    cache_key = _ai_settings_cache_key(user.pk)
+    ai_settings = cache.get(cache_key) if shared else None
+    if ai_settings is None:
+        ai_settings, created = AIProcessingSettings.objects.get_or_create(
+            user=user,
+            defaults={
+                'is_enabled': True,
+                'auto_reply_enabled': True,
+                'default_prompt': DEFAULT_PROMPT
+            }
+        )
+        if created:
+            logger.info(f"Created new AI settings for user {user.get_full_name()}")
+        if shared:
+            cache.set(cache_key, ai_settings, settings.AI_SETTINGS_CACHE_TIMEOUT)
+    return ai_settings
+
+
+def invalidate_ai_settings(user_id):
+    cache.delete(_ai_settings_cache_key(user_id))
+
+
+def is_model_analysis(analysis_result):
+    """Whether an analysis was answered by the model, not a fallback, the LLM cache or a reused analysis"""
+    return (
+        bool(analysis_result.get('tokens_used'))
+        and 'error' not in analysis_result
+        and analysis_result.get('summary') != FALLBACK_ANALYSIS_SUMMARY
+    )
+
+
+@lru_cache(maxsize=1024)
+def compile_reply_prompt(default_prompt, response_tone, max_response_length):
+    """
+    Reply instructions for one version of a user's settings, as (head, tail):
+    the per-email analysis context goes between them. Cached by content, so
+    each settings version is built once per process.
+    """
+    head = default_prompt or DEFAULT_PROMPT
+    
+    # Add user's preferred tone if specified
+    if response_tone:
+        head += f"\n\nPlease respond in a {response_tone} tone."
+    
+    # Add response length limit if specified
+    tail = f"\n\nKeep your response under {max_response_length} characters." if max_response_length else ''
+    return head, tail
+
+
 class AIEmailProcessor:
     """
     AI service for processing emails using OpenRouter (which provides access to OpenAI and other models).
     Handles email analysis, reply generation, and automated responses.
+    Cheap to construct: clients are shared and settings come from the cache.
     """
     
     def __init__(self, user=None):
         self.user = user
         
-        # Initialize OpenRouter client (uses OpenAI library with custom base URL)
+        # OpenRouter key; clients are shared per event loop (OpenAI library with custom base URL)
         api_key = os.getenv('OPENAI_API_KEY')  # OpenRouter uses same env var name for compatibility
+        self.api_key = api_key
+        # Rate limits and the circuit breaker are kept per provider key
+        self.provider = provider_id(api_key, OPENROUTER_BASE_URL)
         if not api_key:
             logger.error("OpenRouter API key not found in environment variables")
-            self.client = None
-        else:
-            try:
-                # OpenRouter configuration
-                self.client = OpenAI(
-                    api_key=api_key,
-                    base_url="https://openrouter.ai/api/v1",
-                )
-                logger.info("OpenRouter client initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize OpenRouter client: {str(e)}")
-                self.client = None
             
         # Use OpenAI models through OpenRouter (more cost-effective)
         self.model = os.getenv('OPENAI_MODEL', 'openai/gpt-4o-mini')  # OpenRouter format
         
         # Get or create AI settings for the user
-        if user:
-            self.ai_settings, created = AIProcessingSettings.objects.get_or_create(
-                user=user,
-                defaults={
-                    'is_enabled': True,
-                    'auto_reply_enabled': True,
-                    'default_prompt': self._get_default_prompt()
-                }
-            )
-            if created:
-                logger.info(f"Created new AI settings for user {user.get_full_name()}")
-        else:
-            self.ai_settings = None
+        self.ai_settings = get_ai_settings(user) if user else None
+        
+        # LLM cache use of the current processing run, recorded on its log
+        self.cache_hits = 0
+        self.tokens_saved = 0
+    
+    def _get_async_client(self):
+        """AsyncOpenAI client sharing the pooled HTTP client of the running loop"""
+        if not self.api_key:
+            return None
+        return get_async_llm_client(self.api_key)
     
     def _get_default_prompt(self) -> str:
         """Get default AI prompt for email processing"""
-        return """You are a professional email assistant. Your task is to analyze the incoming email and generate an appropriate response.
-
-Please follow these guidelines:
-1. Analyze the email content, tone, and intent
-2. Determine the appropriate response tone (professional, friendly, formal)
-3. Generate a helpful, accurate, and contextually appropriate reply
-4. Keep responses concise but complete
-5. Be polite and professional in all communications
-6. If the email requires specific information you don't have, politely indicate that you'll need to gather more details
-
-Always respond in a helpful and professional manner."""
+        return DEFAULT_PROMPT
     
-    def analyze_email_content(self, email_subject: str, email_body: str, sender: str) -> Dict[str, Any]:
+    def _completion_kwargs(self, messages, max_tokens, temperature):
+        kwargs = {
+            'model': self.model,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+        }
+        # All prompts ask for JSON; JSON mode makes the provider guarantee it
+        if settings.AI_JSON_RESPONSE_FORMAT and (OPENROUTER_BASE_URL, self.model) not in _json_mode_unsupported:
+            kwargs['response_format'] = {'type': 'json_object'}
+        return kwargs
+    
+    def _without_json_mode(self, kwargs, error):
+        """Retry arguments after a rejected request, or None if JSON mode was not the cause"""
+        if 'response_format' not in kwargs or not _JSON_MODE_ERROR.search(str(error)):
+            # Context length and other bad requests fail the same way without JSON mode
+            return None
+        logger.warning(f"Model {self.model} rejected JSON mode, parsing plain responses instead: {str(error)}")
+        _json_mode_unsupported.add((OPENROUTER_BASE_URL, self.model))
+        return {name: value for name, value in kwargs.items() if name != 'response_format'}
+    
+    def _estimated_tokens(self, messages, max_tokens):
+        """Tokens a call may use, reserved against the per-minute quota until its usage is known"""
+        return sum(count_tokens(message['content']) for message in messages) + max_tokens
+    
+    async def _acreate_completion(self, client, messages, max_tokens, temperature):
+        kwargs = self._completion_kwargs(messages, max_tokens, temperature)
+        tokens = self._estimated_tokens(messages, max_tokens)
+        try:
+            return await acall_llm(self.provider, tokens, lambda: client.chat.completions.create(**kwargs))
+        except BadRequestError as e:
+            retry_kwargs = self._without_json_mode(kwargs, e)
+            if retry_kwargs is None:
+                raise
+            return await acall_llm(self.provider, tokens, lambda: client.chat.completions.create(**retry_kwargs))
+    
+    async def aanalyze_email_content(self, email_subject: str, email_body: str, sender: str) -> Dict[str, Any]:
         """
         Analyze email content using AI to extract insights and metadata.
         
@@ -82,89 +223,140 @@ Always respond in a helpful and professional manner."""
         """
         logger.info(f"Starting AI analysis for email from {sender}")
         
-        if not self.client:
+        client = self._get_async_client()
+        if not client:
             logger.error("OpenRouter client not initialized")
             return self._get_fallback_analysis(email_subject, email_body, sender, "Client not initialized")
         
         try:
             start_time = time.time()
-            
-            # Prepare analysis prompt
-            analysis_prompt = f"""
-            Please analyze this email and provide a structured response in JSON format:
-
-            Email Subject: {email_subject}
-            From: {sender}
-            Email Body: {email_body}
-
-            Provide analysis in this exact JSON format:
-            {{
-                "summary": "Brief summary of the email content",
-                "sentiment": "positive/neutral/negative/urgent",
-                "category": "Category of the email (e.g., inquiry, complaint, request, information)",
-                "priority": "low/medium/high/urgent",
-                "key_points": ["key point 1", "key point 2"],
-                "requires_response": true/false,
-                "suggested_actions": ["action 1", "action 2"],
-                "tone": "professional/friendly/formal/casual"
-            }}
-            """
-            
-            # Make API call through OpenRouter
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert email analysis assistant. Always respond with valid JSON."},
-                    {"role": "user", "content": analysis_prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3
-            )
-            
-            # Process response
-            ai_response = response.choices[0].message.content.strip()
-            logger.info(f"Raw AI analysis response: {ai_response}")
-            
-            # Try to parse JSON response
-            try:
-                analysis_result = json.loads(ai_response)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, extract content between {}
-                import re
-                json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                if json_match:
-                    try:
-                        analysis_result = json.loads(json_match.group())
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse AI response as JSON: {ai_response}")
-                        analysis_result = self._get_fallback_analysis_data()
-                else:
-                    logger.error(f"No JSON found in AI response: {ai_response}")
-                    analysis_result = self._get_fallback_analysis_data()
-            
-            # Calculate processing time and tokens
-            processing_time = time.time() - start_time
-            tokens_used = response.usage.total_tokens if hasattr(response, 'usage') else 0
-            
-            analysis_result.update({
-                "processing_duration": processing_time,
-                "tokens_used": tokens_used,
-                "ai_model": self.model
-            })
-            
-            logger.info(f"Email analysis completed in {processing_time:.2f}s using {tokens_used} tokens")
-            logger.info(f"Analysis result: {analysis_result}")
-            
+            messages = self._analysis_messages(email_subject, email_body, sender)
+            cache_key = self._llm_cache_key('analysis', messages)
+            cached = await aget_cached_result(cache_key)
+            if cached is not None:
+                return self._analysis_from_cache(cached, start_time)
+            
+            response = await self._acreate_completion(client, messages, max_tokens=1000, temperature=0.3)
+            analysis_result, parsed = self._analysis_from_response(response, start_time)
+            if parsed:
+                await astore_result(cache_key, analysis_result)
             return analysis_result
             
+        except LLMUnavailable:
+            # No placeholder result while the provider is down; the caller retries later
+            raise
         except Exception as e:
             logger.error(f"Error analyzing email: {str(e)}")
             return self._get_fallback_analysis(email_subject, email_body, sender, str(e))
     
+    def _analysis_from_response(self, response, start_time: float) -> Tuple[Dict[str, Any], bool]:
+        """
+        Parsed analysis of a completion, with timing and token usage added, and
+        whether the answer parsed (placeholder analyses are not worth caching)
+        """
+        ai_response = response.choices[0].message.content.strip()
+        logger.info(f"Raw AI analysis response: {ai_response}")
+        
+        analysis_result = self._parse_json_object(ai_response)
+        parsed = analysis_result is not None
+        if not parsed:
+            analysis_result = self._get_fallback_analysis_data()
+        
+        # Calculate processing time and tokens
+        processing_time = time.time() - start_time
+        tokens_used = response.usage.total_tokens if hasattr(response, 'usage') else 0
+        
+        analysis_result.update({
+            "processing_duration": processing_time,
+            "tokens_used": tokens_used,
+            "ai_model": self.model
+        })
+        
+        logger.info(f"Email analysis completed in {processing_time:.2f}s using {tokens_used} tokens")
+        logger.info(f"Analysis result: {analysis_result}")
+        
+        return analysis_result, parsed
+    
+    def _llm_cache_key(self, kind, messages):
+        """Cache key of a completion: the prompts carry the email, the user's reply settings and any analysis context"""
+        return llm_cache_key(kind, self.model, *(message['content'] for message in messages))
+    
+    def _count_cache_hit(self, tokens_saved):
+        self.cache_hits += 1
+        self.tokens_saved += tokens_saved or 0
+    
+    def _analysis_from_cache(self, cached, start_time: float) -> Dict[str, Any]:
+        """Analysis from the LLM cache, accounted as saved rather than used tokens"""
+        analysis_result = dict(cached)
+        self._count_cache_hit(analysis_result.get('tokens_used'))
+        analysis_result.update({
+            "processing_duration": time.time() - start_time,
+            "tokens_used": 0,
+            "cache_hit": True
+        })
+        logger.info(f"Email analysis served from cache, saving {cached.get('tokens_used') or 0} tokens")
+        return analysis_result
+    
+    def _analysis_from_log(self, processing_log) -> Dict[str, Any]:
+        """Analysis of another email's processing log, accounted like a cache hit"""
+        analysis_result = dict(processing_log.ai_analysis or {})
+        self._count_cache_hit(processing_log.tokens_used)
+        analysis_result.update({
+            "processing_duration": 0.0,
+            "tokens_used": 0,
+            "reused_from_email_id": str(processing_log.email_message_id)
+        })
+        return analysis_result
+    
+    def _analysis_messages(self, email_subject: str, email_body: str, sender: str):
+        """Chat messages asking the model for a JSON analysis of an email"""
+        analysis_prompt = f"""
+        Please analyze this email and provide a structured response in JSON format:
+
+        Email Subject: {email_subject}
+        From: {sender}
+        Email Body: {email_body}
+
+        Provide analysis in this exact JSON format:
+        {{
+            "summary": "Brief summary of the email content",
+            "sentiment": "positive/neutral/negative/urgent",
+            "category": "Category of the email (e.g., inquiry, complaint, request, information)",
+            "priority": "low/medium/high/urgent",
+            "key_points": ["key point 1", "key point 2"],
+            "requires_response": true/false,
+            "suggested_actions": ["action 1", "action 2"],
+            "tone": "professional/friendly/formal/casual"
+        }}
+        """
+        return [
+            {"role": "system", "content": "You are an expert email analysis assistant. Always respond with valid JSON."},
+            {"role": "user", "content": analysis_prompt}
+        ]
+    
+    def _parse_json_object(self, ai_response: str) -> Optional[Dict[str, Any]]:
+        """JSON object in the model's answer, or None if there is none"""
+        # Try to parse JSON response
+        try:
+            parsed = json.loads(ai_response)
+        except json.JSONDecodeError:
+            # If JSON parsing fails, extract content between {}
+            import re
+            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
+            if not json_match:
+                logger.error(f"No JSON found in AI response: {ai_response}")
+                return None
+            try:
+                parsed = json.loads(json_match.group())
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse AI response as JSON: {ai_response}")
+                return None
+        return parsed if isinstance(parsed, dict) else None
+    
     def _get_fallback_analysis_data(self):
         """Get fallback analysis data structure"""
         return {
-            "summary": "Failed to parse AI analysis",
+            "summary": FALLBACK_ANALYSIS_SUMMARY,
             "sentiment": "neutral",
             "category": "general",
             "priority": "medium",
@@ -188,8 +380,107 @@ Always respond in a helpful and professional manner."""
             "error": error
         }
     
-    def generate_reply(self, email_subject: str, email_body: str, sender: str, 
-                      analysis_result: Optional[Dict] = None) -> Tuple[str, str]:
+    async def aanalyze_and_reply(self, email_subject: str, email_body: str,
+                                 sender: str) -> Tuple[Dict[str, Any], Optional[Tuple[str, str]]]:
+        """
+        Analyze an email and draft its reply in a single LLM call.
+        
+        Returns:
+            Tuple of (analysis_result, reply) where reply is (reply_subject, reply_body),
+            or None when the answer held no usable reply and agenerate_reply should be used
+        """
+        logger.info(f"Starting combined AI analysis and reply for email from {sender}")
+        
+        client = self._get_async_client()
+        if not client:
+            logger.error("OpenRouter client not initialized")
+            return self._get_fallback_analysis(email_subject, email_body, sender, "Client not initialized"), None
+        
+        try:
+            start_time = time.time()
+            messages = self._combined_messages(email_subject, email_body, sender)
+            cache_key = self._llm_cache_key('combined', messages)
+            cached = await aget_cached_result(cache_key)
+            if cached is not None:
+                return self._analysis_from_cache(cached['analysis'], start_time), tuple(cached['reply'])
+            
+            response = await self._acreate_completion(client, messages, max_tokens=2000, temperature=0.5)
+            analysis_result, reply = self._combined_from_response(response, email_subject, start_time)
+            if reply is not None:
+                await astore_result(cache_key, {'analysis': analysis_result, 'reply': reply})
+            return analysis_result, reply
+            
+        except LLMUnavailable:
+            # No placeholder result while the provider is down; the caller retries later
+            raise
+        except Exception as e:
+            logger.error(f"Error in combined analysis and reply: {str(e)}")
+            return self._get_fallback_analysis(email_subject, email_body, sender, str(e)), None
+    
+    def _combined_messages(self, email_subject: str, email_body: str, sender: str):
+        """Chat messages asking for the analysis and the reply as one JSON object"""
+        prompt = self._get_reply_prompt(email_subject, email_body, sender)
+        
+        combined_prompt = f"""
+        Please analyze this email and write a reply to it. Base the reply on your analysis.
+
+        Email Subject: {email_subject}
+        From: {sender}
+        Email Body: {email_body}
+
+        Instructions for the reply:
+        {prompt}
+
+        Respond with a single JSON object in this exact format:
+        {{
+            "summary": "Brief summary of the email content",
+            "sentiment": "positive/neutral/negative/urgent",
+            "category": "Category of the email (e.g., inquiry, complaint, request, information)",
+            "priority": "low/medium/high/urgent",
+            "key_points": ["key point 1", "key point 2"],
+            "requires_response": true/false,
+            "suggested_actions": ["action 1", "action 2"],
+            "tone": "professional/friendly/formal/casual",
+            "reply_subject": "Appropriate reply subject (start with 'Re: ' if not already present)",
+            "reply_body": "Complete reply body in professional format"
+        }}
+        """
+        return [
+            {"role": "system", "content": "You are an expert email assistant who analyzes emails and writes helpful, accurate, and appropriate replies. Always respond with valid JSON."},
+            {"role": "user", "content": combined_prompt}
+        ]
+    
+    def _combined_from_response(self, response, email_subject: str, start_time: float):
+        """(analysis_result, reply or None) from a combined completion"""
+        ai_response = response.choices[0].message.content.strip()
+        logger.info(f"Raw AI combined response: {ai_response}")
+        
+        parsed = self._parse_json_object(ai_response)
+        reply = None
+        if parsed is None:
+            analysis_result = self._get_fallback_analysis_data()
+        else:
+            reply_subject = parsed.pop('reply_subject', None)
+            reply_body = parsed.pop('reply_body', None)
+            analysis_result = parsed
+            if isinstance(reply_body, str) and reply_body.strip():
+                if not reply_subject:
+                    reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
+                reply = (reply_subject, reply_body)
+        
+        processing_time = time.time() - start_time
+        tokens_used = response.usage.total_tokens if hasattr(response, 'usage') else 0
+        analysis_result.update({
+            "processing_duration": processing_time,
+            "tokens_used": tokens_used,
+            "ai_model": self.model
+        })
+        
+        logger.info(f"Combined analysis and reply completed in {processing_time:.2f}s using {tokens_used} tokens")
+        return analysis_result, reply
+    
+    async def agenerate_reply(self, email_subject: str, email_body: str, sender: str,
+                              analysis_result: Optional[Dict] = None) -> Tuple[str, str]:
         """
         Generate an AI reply to an email.
         
@@ -204,208 +495,501 @@ Always respond in a helpful and professional manner."""
         """
         logger.info(f"Generating AI reply for email from {sender}")
         
-        if not self.client:
+        client = self._get_async_client()
+        if not client:
             logger.error("OpenRouter client not initialized")
-            reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
-            reply_body = "Thank you for your email. I've received your message and will respond soon.\n\nBest regards"
-            return reply_subject, reply_body
+            return self._fallback_reply(email_subject)
         
         try:
             start_time = time.time()
+            messages = self._reply_messages(email_subject, email_body, sender, analysis_result)
+            cache_key = self._llm_cache_key('reply', messages)
+            cached = await aget_cached_result(cache_key)
+            if cached is not None:
+                return self._reply_from_cache(cached)
+            
+            response = await self._acreate_completion(client, messages, max_tokens=1500, temperature=0.7)
+            reply_subject, reply_body, parsed = self._reply_from_response(response, email_subject, start_time)
+            if parsed:
+                await astore_result(cache_key, self._reply_cache_entry(response, reply_subject, reply_body))
+            return reply_subject, reply_body
             
-            # Get appropriate prompt
-            prompt = self._get_reply_prompt(email_subject, email_body, sender, analysis_result)
-            
-            # Prepare reply generation request
-            reply_prompt = f"""
-            Based on this email, generate an appropriate reply:
-
-            Original Email:
-            Subject: {email_subject}
-            From: {sender}
-            Body: {email_body}
-            
-            {prompt}
-
-            Please provide your response in this exact JSON format:
-            {{
-                "reply_subject": "Appropriate reply subject (start with 'Re: ' if not already present)",
-                "reply_body": "Complete reply body in professional format"
-            }}
-            """
-            
-            # Make API call through OpenRouter
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a professional email assistant. Generate helpful, accurate, and appropriate email replies. Always respond with valid JSON."},
-                    {"role": "user", "content": reply_prompt}
-                ],
-                max_tokens=1500,
-                temperature=0.7
+        except LLMUnavailable:
+            # No placeholder result while the provider is down; the caller retries later
+            raise
+        except Exception as e:
+            logger.error(f"Error generating reply: {str(e)}")
+            return self._fallback_reply(email_subject)
+    
+    def _reply_subject(self, email_subject: str) -> str:
+        return f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
+    
+    def _fallback_reply(self, email_subject: str) -> Tuple[str, str]:
+        """Safe reply used when the model cannot be reached"""
+        reply_subject = self._reply_subject(email_subject)
+        reply_body = "Thank you for your email. I've received your message and will respond soon.\n\nBest regards"
+        return reply_subject, reply_body
+    
+    def _reply_messages(self, email_subject: str, email_body: str, sender: str,
+                        analysis_result: Optional[Dict] = None):
+        """Chat messages asking the model for a JSON reply to an email"""
+        # Get appropriate prompt
+        prompt = self._get_reply_prompt(email_subject, email_body, sender, analysis_result)
+        
+        # Prepare reply generation request
+        reply_prompt = f"""
+        Based on this email, generate an appropriate reply:
+
+        Original Email:
+        Subject: {email_subject}
+        From: {sender}
+        Body: {email_body}
+        
+        {prompt}
+
+        Please provide your response in this exact JSON format:
+        {{
+            "reply_subject": "Appropriate reply subject (start with 'Re: ' if not already present)",
+            "reply_body": "Complete reply body in professional format"
+        }}
+        """
+        return [
+            {"role": "system", "content": "You are a professional email assistant. Generate helpful, accurate, and appropriate email replies. Always respond with valid JSON."},
+            {"role": "user", "content": reply_prompt}
+        ]
+    
+    def _reply_from_response(self, response, email_subject: str, start_time: float) -> Tuple[str, str, bool]:
+        """
+        (reply_subject, reply_body, parsed) from a completion, tolerating answers
+        that are not JSON; parsed tells whether the reply came from a JSON answer
+        """
+        ai_response = response.choices[0].message.content.strip()
+        logger.info(f"Raw AI reply response: {ai_response}")
+        
+        # Parse JSON response
+        parsed = True
+        try:
+            reply_result = json.loads(ai_response)
+            reply_subject = reply_result.get("reply_subject", f"Re: {email_subject}")
+            reply_body = reply_result.get("reply_body", "Thank you for your email. I'll get back to you soon.")
+        except json.JSONDecodeError:
+            # If JSON parsing fails, try to extract content
+            import re
+            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
+            if json_match:
+                try:
+                    reply_result = json.loads(json_match.group())
+                    reply_subject = reply_result.get("reply_subject", f"Re: {email_subject}")
+                    reply_body = reply_result.get("reply_body", "Thank you for your email. I'll get back to you soon.")
+                except json.JSONDecodeError:
+                    logger.error(f"Failed to parse AI reply as JSON: {ai_response}")
+                    parsed = False
+                    reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
+                    reply_body = "Thank you for your email. I've received your message and will respond appropriately."
+            else:
+                # Use the raw response as body if no JSON structure
+                parsed = False
+                reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
+                reply_body = ai_response.strip()
+        
+        processing_time = time.time() - start_time
+        logger.info(f"Reply generated in {processing_time:.2f}s")
+        logger.info(f"Generated subject: {reply_subject}")
+        logger.info(f"Generated body preview: {reply_body[:200]}...")
+        
+        return reply_subject, reply_body, parsed
+    
+    def _reply_cache_entry(self, response, reply_subject: str, reply_body: str):
+        return {
+            'reply_subject': reply_subject,
+            'reply_body': reply_body,
+            'tokens_used': response.usage.total_tokens if hasattr(response, 'usage') else 0
+        }
+    
+    def _reply_from_cache(self, cached) -> Tuple[str, str]:
+        self._count_cache_hit(cached['tokens_used'])
+        logger.info(f"Reply served from cache, saving {cached['tokens_used'] or 0} tokens")
+        return cached['reply_subject'], cached['reply_body']
+    
+    async def astream_reply(self, email_message):
+        """
+        Write a reply draft for interactive use, yielding (event, data) pairs as it
+        is written: "start", one "delta" per chunk of text, then "done" with the
+        saved draft or "error". The analysis runs alongside the reply instead of
+        before it, and both are saved to the processing log once the stream ends.
+        """
+        start_time = time.time()
+        log_entry = self._new_processing_log(email_message, 'reply_generation')
+        email_body = prepare_email_body(email_message)
+        reply_subject = self._reply_subject(email_message.subject)
+        
+        yield 'start', {
+            'log_id': str(log_entry.id),
+            'email_id': str(email_message.id),
+            'subject': reply_subject
+        }
+        
+        client = self._get_async_client()
+        if not client:
+            logger.error("OpenRouter client not initialized")
+            result = await sync_to_async(self._fail_processing_log)(
+                log_entry, email_message, 'reply_generation', 'Client not initialized'
             )
-            
-            # Process response
-            ai_response = response.choices[0].message.content.strip()
-            logger.info(f"Raw AI reply response: {ai_response}")
-            
-            # Parse JSON response
-            try:
-                reply_result = json.loads(ai_response)
-                reply_subject = reply_result.get("reply_subject", f"Re: {email_subject}")
-                reply_body = reply_result.get("reply_body", "Thank you for your email. I'll get back to you soon.")
-            except json.JSONDecodeError:
-                # If JSON parsing fails, try to extract content
-                import re
-                json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                if json_match:
-                    try:
-                        reply_result = json.loads(json_match.group())
-                        reply_subject = reply_result.get("reply_subject", f"Re: {email_subject}")
-                        reply_body = reply_result.get("reply_body", "Thank you for your email. I'll get back to you soon.")
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse AI reply as JSON: {ai_response}")
-                        reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
-                        reply_body = "Thank you for your email. I've received your message and will respond appropriately."
+            yield 'error', result
+            return
+        
+        analysis_task = asyncio.ensure_future(
+            self.aanalyze_email_content(email_message.subject, email_body, email_message.sender)
+        )
+        try:
+            messages = self._stream_reply_messages(email_message.subject, email_body, email_message.sender)
+            cache_key = self._llm_cache_key('reply_stream', messages)
+            cached = await aget_cached_result(cache_key)
+            first_token_time = None
+            
+            if cached is not None:
+                self._count_cache_hit(cached['tokens_used'])
+                reply_body = cached['reply_body']
+                reply_tokens = 0
+                first_token_time = time.time()
+                yield 'delta', {'text': reply_body}
+            else:
+                chunks = []
+                reply_tokens = 0
+                reserved_tokens = self._estimated_tokens(messages, 1500)
+                stream = await acall_llm(
+                    self.provider,
+                    reserved_tokens,
+                    lambda: client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=1500,
+                        temperature=0.7,
+                        stream=True,
+                        # Usage only arrives in a final chunk when asked for
+                        stream_options={'include_usage': True}
+                    )
+                )
+                async for chunk in stream:
+                    if getattr(chunk, 'usage', None):
+                        reply_tokens = chunk.usage.total_tokens
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if not text:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                        logger.info(f"First reply token after {first_token_time - start_time:.2f}s")
+                    chunks.append(text)
+                    yield 'delta', {'text': text}
+                
+                if reply_tokens:
+                    await asettle_streamed_tokens(self.provider, reserved_tokens, reply_tokens)
+                
+                reply_body = ''.join(chunks).strip()
+                if reply_body:
+                    await astore_result(cache_key, {'reply_body': reply_body, 'tokens_used': reply_tokens})
                 else:
-                    # Use the raw response as body if no JSON structure
-                    reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
-                    reply_body = ai_response.strip()
+                    reply_body = self._fallback_reply(email_message.subject)[1]
+            
+            analysis_result = dict(await analysis_task)
+            analysis_result.update({
+                "processing_duration": time.time() - start_time,
+                "tokens_used": (analysis_result.get('tokens_used') or 0) + reply_tokens
+            })
             
-            processing_time = time.time() - start_time
-            logger.info(f"Reply generated in {processing_time:.2f}s")
-            logger.info(f"Generated subject: {reply_subject}")
-            logger.info(f"Generated body preview: {reply_body[:200]}...")
+            result = {}
+            self._record_analysis(result, log_entry, analysis_result)
+            self._record_reply(result, log_entry, reply_subject, reply_body)
+            await sync_to_async(self._complete_processing_log)(log_entry, analysis_result)
             
-            return reply_subject, reply_body
+            yield 'done', {
+                'log_id': str(log_entry.id),
+                'email_id': str(email_message.id),
+                'analysis': analysis_result,
+                'generated_reply': result['generated_reply'],
+                'time_to_first_token': round(first_token_time - start_time, 3) if first_token_time else None
+            }
             
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away mid-stream; nothing was saved as a draft
+            analysis_task.cancel()
+            await asyncio.shield(sync_to_async(self._fail_processing_log)(
+                log_entry, email_message, 'reply_generation', 'Stream closed before the reply was complete'
+            ))
+            raise
+        except LLMUnavailable as e:
+            # Deferred, not failed: no processing log is written, the user can try again shortly
+            analysis_task.cancel()
+            yield 'error', {
+                'status': 'deferred',
+                'email_id': str(email_message.id),
+                'error': f"AI provider unavailable: {str(e)}",
+                'retry_after': round(e.retry_after)
+            }
         except Exception as e:
-            logger.error(f"Error generating reply: {str(e)}")
-            # Return a safe fallback reply
-            reply_subject = f"Re: {email_subject}" if not email_subject.startswith('Re:') else email_subject
-            reply_body = f"Thank you for your email. I've received your message and will respond soon.\n\nBest regards"
-            return reply_subject, reply_body
+            analysis_task.cancel()
+            yield 'error', await sync_to_async(self._fail_processing_log)(
+                log_entry, email_message, 'reply_generation', e
+            )
+    
+    def _stream_reply_messages(self, email_subject: str, email_body: str, sender: str):
+        """Chat messages asking for the reply body as plain text, so it can be shown while it is written"""
+        prompt = self._get_reply_prompt(email_subject, email_body, sender)
+        
+        reply_prompt = f"""
+        Based on this email, write an appropriate reply:
+
+        Original Email:
+        Subject: {email_subject}
+        From: {sender}
+        Body: {email_body}
+        
+        {prompt}
+
+        Respond with the body of the reply only, as plain text: no subject line, no JSON and no preamble.
+        """
+        return [
+            {"role": "system", "content": "You are a professional email assistant. Write helpful, accurate, and appropriate email replies."},
+            {"role": "user", "content": reply_prompt}
+        ]
     
     def _get_reply_prompt(self, email_subject: str, email_body: str, sender: str, 
                          analysis_result: Optional[Dict] = None) -> str:
         """Get the appropriate prompt for reply generation based on user settings"""
         
-        # Use user's custom prompt from settings or fallback to default
-        if self.ai_settings and self.ai_settings.default_prompt:
-            prompt = self.ai_settings.default_prompt
+        # Prompt, tone and length limit only change with the user's settings
+        if self.ai_settings:
+            head, tail = compile_reply_prompt(
+                self.ai_settings.default_prompt,
+                self.ai_settings.response_tone,
+                self.ai_settings.max_response_length
+            )
         else:
-            prompt = self._get_default_prompt()
-        
-        # Add user's preferred tone if specified
-        if self.ai_settings and self.ai_settings.response_tone:
-            prompt += f"\n\nPlease respond in a {self.ai_settings.response_tone} tone."
+            head, tail = compile_reply_prompt('', '', None)
         
         # Add analysis context if available
+        context = ''
         if analysis_result:
             sentiment = analysis_result.get('sentiment', 'neutral')
             category = analysis_result.get('category', 'general')
             priority = analysis_result.get('priority', 'medium')
             
-            prompt += f"\n\nEmail Analysis Context:\n- Sentiment: {sentiment}\n- Category: {category}\n- Priority: {priority}"
+            context = f"\n\nEmail Analysis Context:\n- Sentiment: {sentiment}\n- Category: {category}\n- Priority: {priority}"
         
-        # Add response length limit if specified
-        if self.ai_settings and self.ai_settings.max_response_length:
-            prompt += f"\n\nKeep your response under {self.ai_settings.max_response_length} characters."
-        
-        return prompt
+        return head + context + tail
     
     
-    def process_email_with_ai(self, email_message, processing_type='analysis'):
+    async def aprocess_email_with_ai(self, email_message, processing_type='analysis', reuse_log=None):
         """
         Main method to process an email with AI (analysis and/or reply generation).
+        The model calls are awaited and only the processing log writes run in a thread.
         
         Args:
             email_message: EmailMessage instance
             processing_type: 'analysis', 'reply_generation', or 'auto_reply'
+            reuse_log: Optional completed EmailProcessingLog of a near-identical
+                email whose analysis is reused instead of asking the model
             
         Returns:
             Dict with processing results
         """
-        from .models import EmailProcessingLog
-        
-        logger.info(f"Starting AI processing for email: {email_message.subject}")
-        logger.info(f"Email from: {email_message.sender}")
-        logger.info(f"Processing type: {processing_type}")
-        logger.info(f"Using model: {self.model} via OpenRouter")
-        
-        # Create processing log
-        log_entry = EmailProcessingLog.objects.create(
-            email_message=email_message,
-            processing_type=processing_type,
-            status='processing'
-        )
-        
+        # Saved once the run ends: a run deferred by LLMUnavailable leaves no log behind,
+        # however often its task is retried during an outage
+        log_entry = self._new_processing_log(email_message, processing_type)
+        result = await self._arun_processing(email_message, processing_type, log_entry, reuse_log)
+        await sync_to_async(self.save_processing_log)(log_entry)
+        return result
+    
+    async def aprocess_email_unsaved(self, email_message, processing_type='analysis', reuse_log=None):
+        """
+        aprocess_email_with_ai for batch runs: returns (result, log_entry) with the
+        processing log filled in but not saved, so many can be written at once.
+        """
+        log_entry = self._new_processing_log(email_message, processing_type)
+        result = await self._arun_processing(email_message, processing_type, log_entry, reuse_log)
+        return result, log_entry
+    
+    async def _arun_processing(self, email_message, processing_type, log_entry, reuse_log=None):
+        """Model calls of one processing run, recorded on log_entry without saving it"""
         try:
             result = {
                 'status': 'success',
                 'email_id': str(email_message.id),
-                'processing_type': processing_type
+                'processing_type': processing_type,
+                'processing_log_id': str(log_entry.id)
             }
             
-            # Step 1: Analyze email content
-            logger.info("Step 1: Analyzing email content...")
-            analysis_result = self.analyze_email_content(
-                email_message.subject,
-                email_message.body_plain or email_message.body_html,
-                email_message.sender
-            )
-            
-            result['analysis'] = analysis_result
-            
-            # Update log with analysis
-            log_entry.ai_analysis = analysis_result
-            log_entry.ai_summary = analysis_result.get('summary', '')
-            log_entry.ai_sentiment = analysis_result.get('sentiment', '')
-            log_entry.ai_category = analysis_result.get('category', '')
-            log_entry.ai_priority = analysis_result.get('priority', '')
-            
-            # Step 2: Generate reply if requested
-            if processing_type in ['reply_generation', 'auto_reply']:
-                logger.info("Step 2: Generating reply...")
-                reply_subject, reply_body = self.generate_reply(
-                    email_message.subject,
-                    email_message.body_plain or email_message.body_html,
-                    email_message.sender,
-                    analysis_result
+            email_body = prepare_email_body(email_message)
+            wants_reply = processing_type in ['reply_generation', 'auto_reply']
+            reply = None
+            
+            if reuse_log is not None:
+                logger.info(f"Step 1: Reusing analysis of near-identical email {reuse_log.email_message_id}")
+                analysis_result = self._analysis_from_log(reuse_log)
+            elif wants_reply and settings.AI_COMBINED_REPLY_MODE:
+                logger.info("Analyzing email and generating reply in one call...")
+                analysis_result, reply = await self.aanalyze_and_reply(
+                    email_message.subject, email_body, email_message.sender
                 )
-                
-                result['generated_reply'] = {
-                    'subject': reply_subject,
-                    'body': reply_body
-                }
-                
-                # Update log with reply
-                log_entry.generated_reply_subject = reply_subject
-                log_entry.generated_reply_body = reply_body
+            else:
+                logger.info("Step 1: Analyzing email content...")
+                analysis_result = await self.aanalyze_email_content(
+                    email_message.subject, email_body, email_message.sender
+                )
+            self._record_analysis(result, log_entry, analysis_result)
+            
+            if wants_reply:
+                if reply is None:
+                    logger.info("Step 2: Generating reply...")
+                    reply = await self.agenerate_reply(
+                        email_message.subject, email_body, email_message.sender, analysis_result
+                    )
+                self._record_reply(result, log_entry, *reply)
             
-            # Update processing log as completed
-            log_entry.status = 'completed'
-            log_entry.processing_duration = analysis_result.get('processing_duration', 0)
-            log_entry.tokens_used = analysis_result.get('tokens_used', 0)
-            log_entry.save()
+            self._finish_processing_log(log_entry, analysis_result)
             
             logger.info(f"AI processing completed successfully for email: {email_message.subject}")
             return result
             
+        except LLMUnavailable:
+            # No log and no placeholder result; the caller retries later
+            raise
         except Exception as e:
-            logger.error(f"Error in AI processing: {str(e)}")
-            
-            # Update processing log as failed
-            log_entry.status = 'failed'
-            log_entry.error_message = str(e)
-            log_entry.save()
-            
-            return {
-                'status': 'error',
-                'error': str(e),
-                'email_id': str(email_message.id),
-                'processing_type': processing_type
-            }
+            return self._mark_processing_failed(log_entry, email_message, processing_type, e)
+    
+    def batch_request(self, email_message, processing_type='analysis'):
+        """
+        Chat completion arguments for an email in an offline batch: its analysis,
+        or for reply processing types the analysis and reply in one answer
+        """
+        email_body = prepare_email_body(email_message)
+        if processing_type in ['reply_generation', 'auto_reply']:
+            messages = self._combined_messages(email_message.subject, email_body, email_message.sender)
+            return self._completion_kwargs(messages, max_tokens=2000, temperature=0.5)
+        messages = self._analysis_messages(email_message.subject, email_body, email_message.sender)
+        return self._completion_kwargs(messages, max_tokens=1000, temperature=0.3)
+    
+    def process_batch_response(self, email_message, processing_type, response):
+        """
+        (result, log_entry) for an email from its batch completion, with the
+        processing log filled in but not saved. Raises ValueError when the
+        answer is unusable, so the request can be retried.
+        """
+        log_entry = self._new_processing_log(email_message, processing_type)
+        result = {
+            'status': 'success',
+            'email_id': str(email_message.id),
+            'processing_type': processing_type,
+            'processing_log_id': str(log_entry.id)
+        }
+        start_time = time.time()
+        
+        if processing_type in ['reply_generation', 'auto_reply']:
+            analysis_result, reply = self._combined_from_response(response, email_message.subject, start_time)
+            if reply is None:
+                raise ValueError("Batch answer held no usable reply")
+            self._record_analysis(result, log_entry, analysis_result)
+            self._record_reply(result, log_entry, *reply)
+        else:
+            analysis_result, parsed = self._analysis_from_response(response, start_time)
+            if not parsed:
+                raise ValueError("Batch answer was not valid JSON")
+            self._record_analysis(result, log_entry, analysis_result)
+        
+        self._finish_processing_log(log_entry, analysis_result)
+        return result, log_entry
+    
+    def process_batch_failure(self, email_message, processing_type, error):
+        """(result, log_entry) for an email whose batch request failed, the log not saved"""
+        log_entry = self._new_processing_log(email_message, processing_type)
+        return self._mark_processing_failed(log_entry, email_message, processing_type, error), log_entry
+    
+    def _new_processing_log(self, email_message, processing_type):
+        """Processing log of a new run, not saved until the run has finished or failed"""
+        from .models import EmailProcessingLog
+        
+        logger.info(f"Starting AI processing for email: {email_message.subject}")
+        logger.info(f"Email from: {email_message.sender}")
+        logger.info(f"Processing type: {processing_type}")
+        logger.info(f"Using model: {self.model} via OpenRouter")
+        
+        self.cache_hits = 0
+        self.tokens_saved = 0
+        return EmailProcessingLog(
+            email_message=email_message,
+            processing_type=processing_type,
+            status='processing'
+        )
+    
+    def _record_analysis(self, result, log_entry, analysis_result):
+        result['analysis'] = analysis_result
+        
+        # Update log with analysis
+        log_entry.ai_analysis = analysis_result
+        log_entry.ai_summary = analysis_result.get('summary', '')
+        log_entry.ai_sentiment = analysis_result.get('sentiment', '')
+        log_entry.ai_category = analysis_result.get('category', '')
+        log_entry.ai_priority = analysis_result.get('priority', '')
+    
+    def _record_reply(self, result, log_entry, reply_subject, reply_body):
+        result['generated_reply'] = {
+            'subject': reply_subject,
+            'body': reply_body
+        }
+        
+        # Update log with reply
+        log_entry.generated_reply_subject = reply_subject
+        log_entry.generated_reply_body = reply_body
+    
+    def _complete_processing_log(self, log_entry, analysis_result):
+        self._finish_processing_log(log_entry, analysis_result)
+        self.save_processing_log(log_entry)
+    
+    def _finish_processing_log(self, log_entry, analysis_result):
+        # Update processing log as completed
+        log_entry.status = 'completed'
+        log_entry.processing_duration = analysis_result.get('processing_duration', 0)
+        log_entry.tokens_used = analysis_result.get('tokens_used', 0)
+        log_entry.cache_hit = self.cache_hits > 0
+        log_entry.tokens_saved = self.tokens_saved
+    
+    def save_processing_log(self, log_entry):
+        """Write a finished processing log and tell the user's dashboards"""
+        log_entry.save()
+        self._publish_processing_event(log_entry)
+    
+    def _fail_processing_log(self, log_entry, email_message, processing_type, error):
+        result = self._mark_processing_failed(log_entry, email_message, processing_type, error)
+        self.save_processing_log(log_entry)
+        return result
+    
+    def _mark_processing_failed(self, log_entry, email_message, processing_type, error):
+        logger.error(f"Error in AI processing: {str(error)}")
+        
+        # Update processing log as failed
+        log_entry.status = 'failed'
+        log_entry.error_message = str(error)
+        
+        return {
+            'status': 'error',
+            'error': str(error),
+            'email_id': str(email_message.id),
+            'processing_type': processing_type
+        }
+
+    def _publish_processing_event(self, log_entry):
+        """Let the user's open dashboards know a processing run finished"""
+        user_id = self.user.pk if self.user else log_entry.email_message.email_account.user_id
+        publish_event_on_commit(user_id, 'ai.analysis_completed', {
+            'email_id': log_entry.email_message_id,
+            'log_id': log_entry.id,
+            'processing_type': log_entry.processing_type,
+            'status': log_entry.status,
+            'summary': log_entry.ai_summary,
+            'sentiment': log_entry.ai_sentiment,
+            'category': log_entry.ai_category,
+            'priority': log_entry.ai_priority,
+        })
 
     def is_processing_enabled(self) -> bool:
         """Check if AI processing is enabled for the user"""
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AiProcessingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Ai_processing'
+    
+    def ready(self):
+        # Keep the daily processing rollups and cached AI settings current
+        from . import signals  # noqa: F401
@@ -0,0 +1,223 @@
+import copy
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from openai.types.chat import ChatCompletion
+
+from User.models import EmailMessage
+from .ai_service import AIEmailProcessor, get_llm_client
+from .models import AIBatchJob, EmailProcessingLog
+
+logger = logging.getLogger(__name__)
+
+# Offline batch inference for backlog processing: one JSONL file of chat
+# completion requests in the OpenAI batch format, keyed by email id, answered
+# by the provider within AI_BATCH_COMPLETION_WINDOW at batch prices.
+# Requests that fail are submitted again in a follow-up batch until
+# AI_BATCH_MAX_ATTEMPTS; only then do they get a failed processing log.
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+# A claim older than this is taken to belong to a worker that died mid-ingest
+INGEST_CLAIM_TIMEOUT = timedelta(hours=1)
+
+
+def get_batch_client():
+    """OpenAI-compatible client for the batch API (OpenRouter has none)"""
+    return get_llm_client(settings.AI_BATCH_API_KEY, settings.AI_BATCH_BASE_URL)
+
+
+def get_batch_processor(user):
+    ai_processor = AIEmailProcessor(user=user)
+    ai_processor.model = settings.AI_BATCH_MODEL
+    return ai_processor
+
+
+def build_batch_file(ai_processor, email_messages, processing_type):
+    """Batch input file: one JSON line per email with its chat completion request"""
+    lines = []
+    for email_message in email_messages:
+        lines.append(json.dumps({
+            'custom_id': str(email_message.id),
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': ai_processor.batch_request(email_message, processing_type),
+        }))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def submit_batch(user, email_messages, processing_type, attempt=1):
+    """Upload a batch file for the emails and start the batch; returns its AIBatchJob"""
+    email_messages = list(email_messages)
+    client = get_batch_client()
+    batch_file = build_batch_file(get_batch_processor(user), email_messages, processing_type)
+
+    input_file = client.files.create(file=('email_batch.jsonl', batch_file), purpose='batch')
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=settings.AI_BATCH_COMPLETION_WINDOW,
+        metadata={'user_id': str(user.id), 'processing_type': processing_type, 'attempt': str(attempt)}
+    )
+
+    batch_job = AIBatchJob.objects.create(
+        user=user,
+        processing_type=processing_type,
+        status=batch.status,
+        provider_batch_id=batch.id,
+        input_file_id=input_file.id,
+        email_ids=[str(email_message.id) for email_message in email_messages],
+        attempt=attempt
+    )
+    logger.info(f"Submitted AI batch {batch.id} with {len(email_messages)} emails (attempt {attempt})")
+    return batch_job
+
+
+def pending_batch_email_ids(user):
+    """Ids of the user's emails in batches whose results are not ingested yet"""
+    email_ids = set()
+    for ids in AIBatchJob.objects.filter(user=user, ingested_at__isnull=True).values_list('email_ids', flat=True):
+        email_ids.update(ids)
+    return email_ids
+
+
+def poll_batch(batch_job):
+    """
+    Refresh a job from the provider. Returns None while the batch runs (or
+    while another poll ingests it), or once it has ended the outcome of ingest_batch.
+    """
+    batch = get_batch_client().batches.retrieve(batch_job.provider_batch_id)
+    batch_job.status = batch.status
+    batch_job.output_file_id = batch.output_file_id or ''
+    batch_job.error_file_id = batch.error_file_id or ''
+    if batch.errors and batch.errors.data:
+        batch_job.error_message = '; '.join(error.message or error.code or '' for error in batch.errors.data)
+    # Only the provider's fields: a full save could undo another poll's ingest claim
+    batch_job.save(update_fields=['status', 'output_file_id', 'error_file_id', 'error_message', 'updated_at'])
+
+    if batch.status in ('validating', 'in_progress', 'finalizing', 'cancelling'):
+        return None
+    return ingest_batch(batch_job)
+
+
+def _read_batch_file(client, file_id):
+    if not file_id:
+        return []
+    content = client.files.content(file_id).text
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def _batch_answers(client, batch_job):
+    """{email id: (completion body or None, error or None)} from the output and error files"""
+    answers = {}
+    for line in _read_batch_file(client, batch_job.output_file_id) + _read_batch_file(client, batch_job.error_file_id):
+        response = line.get('response') or {}
+        body = response.get('body') or {}
+        if line.get('error'):
+            error = line['error'].get('message') or line['error'].get('code')
+            answers[line['custom_id']] = (None, error)
+        elif response.get('status_code') != 200:
+            error = (body.get('error') or {}).get('message') or f"HTTP {response.get('status_code')}"
+            answers[line['custom_id']] = (None, error)
+        else:
+            answers[line['custom_id']] = (body, None)
+    return answers
+
+
+def claim_batch_ingest(batch_job):
+    """
+    Atomically claim an ended batch for ingesting. Polls can overlap (a slow
+    ingest and the next beat tick, or a redelivered task), and only the one
+    holding the claim may write logs and queue replies.
+    """
+    now = timezone.now()
+    claimed = AIBatchJob.objects.filter(
+        Q(ingest_claimed_at__isnull=True) | Q(ingest_claimed_at__lt=now - INGEST_CLAIM_TIMEOUT),
+        id=batch_job.id,
+        ingested_at__isnull=True,
+    ).update(ingest_claimed_at=now)
+    if claimed:
+        batch_job.ingest_claimed_at = now
+    return bool(claimed)
+
+
+def ingest_batch(batch_job):
+    """
+    Write the results of an ended batch to processing logs. Failed requests
+    go into a follow-up batch while attempts remain. Returns (results of the
+    successful emails, follow-up AIBatchJob or None), or None if the batch is
+    ingested already or being ingested by another poll.
+    """
+    if batch_job.ingested_at or not claim_batch_ingest(batch_job):
+        return None
+
+    try:
+        return _ingest_claimed_batch(batch_job)
+    except Exception:
+        # Let the next poll try again
+        AIBatchJob.objects.filter(id=batch_job.id, ingested_at__isnull=True).update(ingest_claimed_at=None)
+        raise
+
+
+def _ingest_claimed_batch(batch_job):
+    answers = _batch_answers(get_batch_client(), batch_job)
+    email_messages = {
+        str(email_message.id): email_message
+        for email_message in EmailMessage.objects.filter(id__in=batch_job.email_ids).select_related('email_account')
+    }
+    # Emails processed some other way while the batch ran keep that result
+    done = {
+        str(email_id) for email_id in EmailProcessingLog.objects.filter(
+            email_message_id__in=batch_job.email_ids, status='completed'
+        ).values_list('email_message_id', flat=True)
+    }
+    can_retry = batch_job.attempt < settings.AI_BATCH_MAX_ATTEMPTS
+    ai_processor = get_batch_processor(batch_job.user)
+
+    results, log_entries, retry = [], [], []
+    for email_id in batch_job.email_ids:
+        email_message = email_messages.get(email_id)
+        if email_message is None or email_id in done:
+            continue
+        body, error = answers.get(email_id, (None, f"No result before the batch was {batch_job.status}"))
+        # Own copy per email: cache hit counters are per processing run
+        processor = copy.copy(ai_processor)
+        if body is not None:
+            try:
+                result, log_entry = processor.process_batch_response(
+                    email_message, batch_job.processing_type, ChatCompletion.model_validate(body)
+                )
+                results.append(result)
+                log_entries.append((processor, log_entry))
+                continue
+            except Exception as e:
+                error = str(e)
+        if can_retry:
+            retry.append(email_message)
+        else:
+            _, log_entry = processor.process_batch_failure(email_message, batch_job.processing_type, error)
+            log_entries.append((processor, log_entry))
+
+    with transaction.atomic():
+        for processor, log_entry in log_entries:
+            processor.save_processing_log(log_entry)
+        batch_job.succeeded_count = len(results)
+        batch_job.failed_count = len(log_entries) - len(results)
+        batch_job.retried_count = len(retry)
+        batch_job.ingested_at = timezone.now()
+        batch_job.save()
+
+    logger.info(
+        f"Ingested AI batch {batch_job.provider_batch_id}: {batch_job.succeeded_count} succeeded, "
+        f"{batch_job.failed_count} failed, {batch_job.retried_count} to retry"
+    )
+
+    retry_job = None
+    if retry:
+        retry_job = submit_batch(batch_job.user, retry, batch_job.processing_type, attempt=batch_job.attempt + 1)
+    return results, retry_job
@@ -0,0 +1,122 @@
+import asyncio
+import copy
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .llm_limits import LLMUnavailable
+
+logger = logging.getLogger(__name__)
+
+# AI processing from Celery tasks runs on one event loop thread per worker
+# process. Model calls are network waits, so the loop keeps up to
+# AI_ENGINE_CONCURRENCY of them in flight over its pooled clients instead of one
+# per worker slot. Tasks submitting to it should run on a thread pool
+# (celery worker -P threads) so that many of them can wait on the loop at once.
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_semaphore = None
+
+
+def _get_loop():
+    global _loop, _loop_pid, _semaphore
+    pid = os.getpid()
+    if _loop is None or _loop_pid != pid:
+        with _loop_lock:
+            if _loop is None or _loop_pid != pid:
+                # A forked worker starts its own: the parent's loop thread does not exist in the child
+                _loop = asyncio.new_event_loop()
+                _semaphore = asyncio.Semaphore(settings.AI_ENGINE_CONCURRENCY)
+                threading.Thread(target=_loop.run_forever, name='ai-engine', daemon=True).start()
+                _loop_pid = pid
+    return _loop
+
+
+def run_ai(coroutine):
+    """Run a coroutine on the AI engine loop from sync code and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+
+async def limited(coroutine):
+    """Await a coroutine once one of the AI_ENGINE_CONCURRENCY slots is free"""
+    async with _semaphore:
+        return await coroutine
+
+
+def process_email(ai_processor, email_message, processing_type, reuse_log=None):
+    """aprocess_email_with_ai for one email, run on the engine within its concurrency limit"""
+    return run_ai(limited(ai_processor.aprocess_email_with_ai(email_message, processing_type, reuse_log=reuse_log)))
+
+
+def process_emails(ai_processor, email_messages, processing_type):
+    """
+    aprocess_email_with_ai for many emails at once, at most AI_ENGINE_CONCURRENCY
+    in flight. Processing logs are written AI_ENGINE_WRITE_BATCH_SIZE at a time.
+    Returns the results in the order of email_messages.
+    """
+    return run_ai(_aprocess_emails(ai_processor, list(email_messages), processing_type))
+
+
+async def _aprocess_emails(ai_processor, email_messages, processing_type):
+    writer = ProcessingLogWriter()
+
+    async def process(email_message):
+        # Own copy per email: cache hit counters are per run, clients and settings are shared
+        processor = copy.copy(ai_processor)
+        result, log_entry = await limited(processor.aprocess_email_unsaved(email_message, processing_type))
+        await writer.add(processor, log_entry)
+        return result
+
+    outcomes = await asyncio.gather(*(process(email) for email in email_messages), return_exceptions=True)
+    await writer.flush()
+
+    results = []
+    for email_message, outcome in zip(email_messages, outcomes):
+        if isinstance(outcome, LLMUnavailable):
+            # Left unprocessed; bulk_process_emails_with_ai retries once the provider is back
+            outcome = {'status': 'deferred', 'email_id': str(email_message.id), 'retry_after': outcome.retry_after}
+        elif isinstance(outcome, Exception):
+            logger.error(f"Error processing email {email_message.subject}: {str(outcome)}")
+            outcome = {'status': 'error', 'email_id': str(email_message.id), 'error': str(outcome)}
+        results.append(outcome)
+    return results
+
+
+class ProcessingLogWriter:
+    """
+    Collects finished processing logs and writes them in batches, one
+    transaction and one hop to the database thread per batch
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.AI_ENGINE_WRITE_BATCH_SIZE
+        self.pending = []
+
+    async def add(self, ai_processor, log_entry):
+        self.pending.append((ai_processor, log_entry))
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if batch:
+            await sync_to_async(_write_processing_logs)(batch)
+
+
+def _write_processing_logs(batch):
+    # The engine's database thread lives as long as the worker; drop stale connections like a request would
+    close_old_connections()
+    try:
+        with transaction.atomic():
+            for ai_processor, log_entry in batch:
+                # Saved one by one so the daily stat rollups see each of them
+                ai_processor.save_processing_log(log_entry)
+        logger.info(f"Wrote {len(batch)} AI processing logs")
+    finally:
+        close_old_connections()
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Bump when the analysis/reply prompt templates change, so older results stop matching
+LLM_PROMPT_VERSION = 1
+
+LLM_CACHE_ALIAS = 'llm'
+
+# Query strings of links differ per recipient (tracking ids) in otherwise identical mail
+_URL_QUERY = re.compile(r'(https?://[^\s?#"\'<>]+)[?#][^\s"\'<>]*')
+
+
+def normalize_for_cache(value):
+    """Case, whitespace and link tracking parameters do not change what the model answers"""
+    value = _URL_QUERY.sub(r'\1', value or '')
+    return ' '.join(value.split()).casefold()
+
+
+def llm_cache_key(kind, model, *parts):
+    """Key for one kind of LLM result ('analysis', 'reply', ...) from its normalized inputs"""
+    payload = json.dumps(
+        [LLM_PROMPT_VERSION, kind, model] + [normalize_for_cache(part) if isinstance(part, str) else part for part in parts],
+        sort_keys=True,
+        default=str
+    )
+    return f'{kind}:{hashlib.sha256(payload.encode()).hexdigest()}'
+
+
+async def aget_cached_result(key):
+    """Cached result or None. A hit restarts the entry's TTL, so unused results expire first."""
+    cache = caches[LLM_CACHE_ALIAS]
+    try:
+        result = await cache.aget(key)
+        if result is not None:
+            await cache.atouch(key, settings.LLM_CACHE_TIMEOUT)
+        return result
+    except Exception as e:
+        # The cache only saves work; never fail processing because of it
+        logger.warning(f"LLM cache lookup failed: {str(e)}")
+        return None
+
+
+async def astore_result(key, result):
+    try:
+        await caches[LLM_CACHE_ALIAS].aset(key, result, settings.LLM_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"LLM cache store failed: {str(e)}")
@@ -0,0 +1,237 @@
+import asyncio
+import email.utils
+import hashlib
+import logging
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# Calls to an LLM provider go through a limiter shared by every worker (through
+# the default cache, so Redis when CACHE_REDIS_URL is set and per process
+# otherwise). It keeps requests and tokens per minute under the provider key's
+# quota, pauses all callers for a 429's Retry-After, and opens a circuit after
+# AI_CIRCUIT_FAILURE_THRESHOLD outage errors in a row. While the circuit is open
+# calls fail fast with LLMUnavailable instead of falling back to placeholder
+# analyses; after the cooldown one caller probes the provider and closes it again.
+
+RATE_WINDOW_SECONDS = 60
+HALF_OPEN_RETRY_SECONDS = 5
+
+# Provider errors that mean an outage rather than a bad request
+OUTAGE_ERRORS = (APIConnectionError, InternalServerError)
+
+
+class LLMUnavailable(Exception):
+    """The provider cannot be called now; retry after retry_after seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def provider_id(api_key, base_url):
+    """Short id of a provider key, used in cache keys instead of the key itself"""
+    return hashlib.sha256(f'{base_url}:{api_key}'.encode()).hexdigest()[:16]
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: anywhere up to base * 2^(attempt - 1), at most cap"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retry_countdown(error, retries, base=30, cap=600):
+    """
+    Seconds before a Celery task retries after error: past the provider's
+    pause for LLMUnavailable, otherwise jittered backoff, so failed tasks do not
+    all come back at the same moment
+    """
+    if isinstance(error, LLMUnavailable):
+        return error.retry_after + random.uniform(0, error.retry_after / 2 + 1)
+    return max(1, backoff_delay(retries + 1, base, cap))
+
+
+def unavailable_for(provider):
+    """Seconds until the provider may be called again (429 pause or open circuit), 0 if it may now"""
+    state = cache.get_many([f'llm_pause:{provider}', f'llm_circuit:{provider}'])
+    until = max(state.get(f'llm_pause:{provider}') or 0, state.get(f'llm_circuit:{provider}') or 0)
+    return max(0, until - time.time())
+
+
+def _incr(key, delta, timeout):
+    if cache.add(key, delta, timeout):
+        return delta
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Expired between add and incr
+        cache.add(key, delta, timeout)
+        return delta
+
+
+def _blocked_for(provider):
+    """Seconds callers must hold off because of a 429 pause or an open circuit, or 0"""
+    now = time.time()
+    state = cache.get_many([f'llm_pause:{provider}', f'llm_circuit:{provider}'])
+    pause_until = state.get(f'llm_pause:{provider}')
+    open_until = state.get(f'llm_circuit:{provider}')
+    wait = max(0, (pause_until or 0) - now)
+    if open_until is not None:
+        if open_until > now:
+            wait = max(wait, open_until - now)
+        elif not cache.add(f'llm_probe:{provider}', 1, settings.AI_CIRCUIT_COOLDOWN_SECONDS):
+            # Half open: another caller is already probing the provider
+            wait = max(wait, HALF_OPEN_RETRY_SECONDS)
+    return wait
+
+
+def _reserve(provider, tokens):
+    """Count a call in the current minute; seconds until the next window if over quota, else 0"""
+    window = int(time.time() // RATE_WINDOW_SECONDS)
+    requests_key = f'llm_rate:{provider}:{window}:requests'
+    tokens_key = f'llm_rate:{provider}:{window}:tokens'
+    timeout = RATE_WINDOW_SECONDS * 2
+
+    requests_used = _incr(requests_key, 1, timeout)
+    tokens_used = _incr(tokens_key, tokens, timeout)
+    over_requests = settings.AI_RATE_LIMIT_REQUESTS_PER_MINUTE and requests_used > settings.AI_RATE_LIMIT_REQUESTS_PER_MINUTE
+    # A call larger than the whole quota is still let through on its own
+    over_tokens = (settings.AI_RATE_LIMIT_TOKENS_PER_MINUTE and tokens_used > settings.AI_RATE_LIMIT_TOKENS_PER_MINUTE
+                   and tokens_used > tokens)
+    if not (over_requests or over_tokens):
+        return 0
+
+    _incr(requests_key, -1, timeout)
+    _incr(tokens_key, -tokens, timeout)
+    return (window + 1) * RATE_WINDOW_SECONDS - time.time() + random.uniform(0, 1)
+
+
+def _refund(provider, tokens):
+    """Give back reserved tokens the provider did not use"""
+    if tokens:
+        window = int(time.time() // RATE_WINDOW_SECONDS)
+        _incr(f'llm_rate:{provider}:{window}:tokens', -tokens, RATE_WINDOW_SECONDS * 2)
+
+
+def _admit(provider, tokens, waited):
+    """Seconds to sleep before trying again, 0 once the call is admitted. Raises LLMUnavailable."""
+    wait = _blocked_for(provider)
+    if not wait:
+        wait = _reserve(provider, tokens)
+    if wait and waited + wait > settings.AI_RATE_LIMIT_MAX_WAIT_SECONDS:
+        raise LLMUnavailable(f"LLM provider unavailable for {wait:.0f}s", retry_after=wait)
+    return wait
+
+
+def _retry_after(error):
+    """Seconds from a 429's Retry-After (or retry-after-ms) header, or None"""
+    headers = error.response.headers if getattr(error, 'response', None) is not None else {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _record_rate_limited(provider, error, attempt):
+    pause = _retry_after(error)
+    if pause is None:
+        pause = backoff_delay(attempt, 2, 60) + 1
+    until = time.time() + pause
+    cache.set(f'llm_pause:{provider}', until, int(pause) + 1)
+    logger.warning(f"LLM provider rate limited, pausing calls for {pause:.1f}s")
+
+
+def _record_failure(provider, error):
+    circuit_key = f'llm_circuit:{provider}'
+    half_open = cache.get(circuit_key) is not None
+    failures = _incr(f'llm_failures:{provider}', 1, settings.AI_CIRCUIT_MAX_COOLDOWN_SECONDS)
+    if not half_open and failures < settings.AI_CIRCUIT_FAILURE_THRESHOLD:
+        return
+
+    # Each reopening without a success in between waits twice as long
+    openings = _incr(f'llm_openings:{provider}', 1, settings.AI_CIRCUIT_MAX_COOLDOWN_SECONDS * 4)
+    cooldown = min(settings.AI_CIRCUIT_MAX_COOLDOWN_SECONDS, settings.AI_CIRCUIT_COOLDOWN_SECONDS * 2 ** (openings - 1))
+    cooldown *= random.uniform(0.8, 1.2)
+    cache.set(circuit_key, time.time() + cooldown, settings.AI_CIRCUIT_MAX_COOLDOWN_SECONDS * 4)
+    cache.delete_many([f'llm_failures:{provider}', f'llm_probe:{provider}'])
+    logger.error(f"LLM circuit opened for {cooldown:.0f}s after {failures} outage errors: {str(error)}")
+
+
+def _record_success(provider, reserved_tokens, response):
+    usage = getattr(response, 'usage', None)
+    if usage is not None and getattr(usage, 'total_tokens', None) is not None:
+        _refund(provider, reserved_tokens - usage.total_tokens)
+    if cache.get(f'llm_circuit:{provider}') is not None:
+        cache.delete_many([f'llm_circuit:{provider}', f'llm_probe:{provider}', f'llm_openings:{provider}'])
+        logger.info("LLM circuit closed, provider answered again")
+    cache.delete(f'llm_failures:{provider}')
+
+
+def _handle_error(provider, error, attempt, reserved_tokens):
+    """Seconds to back off before the next attempt; re-raises errors that are not retried"""
+    _refund(provider, reserved_tokens)
+    if isinstance(error, RateLimitError):
+        _record_rate_limited(provider, error, attempt)
+        delay = 0  # the next admission waits out the pause
+    elif isinstance(error, OUTAGE_ERRORS):
+        _record_failure(provider, error)
+        delay = backoff_delay(attempt, 1, 30)
+    else:
+        raise error
+
+    if attempt >= settings.AI_LLM_MAX_ATTEMPTS:
+        raise LLMUnavailable(f"LLM provider unavailable: {str(error)}", retry_after=max(delay, _blocked_for(provider), 1))
+    return delay
+
+
+async def acall_llm(provider, tokens, create):
+    """
+    Result of awaiting create() once the limiter admits a call of about tokens
+    tokens. Rate limits and outage errors are retried up to AI_LLM_MAX_ATTEMPTS
+    times with jittered backoff; beyond that, or when admission would wait longer
+    than AI_RATE_LIMIT_MAX_WAIT_SECONDS, LLMUnavailable is raised.
+    """
+    # The limiter's cache round trips run in worker threads, off the event loop
+    admit = sync_to_async(_admit, thread_sensitive=False)
+    handle_error = sync_to_async(_handle_error, thread_sensitive=False)
+    record_success = sync_to_async(_record_success, thread_sensitive=False)
+    waited = 0
+    attempt = 1
+    while True:
+        wait = await admit(provider, tokens, waited)
+        if wait:
+            await asyncio.sleep(wait)
+            waited += wait
+            continue
+        try:
+            response = await create()
+        except Exception as e:
+            delay = await handle_error(provider, e, attempt, tokens)
+            attempt += 1
+            await asyncio.sleep(delay)
+            waited += delay
+            continue
+        await record_success(provider, tokens, response)
+        return response
+
+
+async def asettle_streamed_tokens(provider, reserved_tokens, used_tokens):
+    """
+    Settle a streamed call's token reservation once its usage is known. The
+    stream object acall_llm gets back has no usage, so the final usage chunk is
+    reported here instead.
+    """
+    await sync_to_async(_refund, thread_sensitive=False)(provider, reserved_tokens - used_tokens)
@@ -0,0 +1,74 @@
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from Ai_processing.models import DailyStat, EmailProcessingLog
+from Ai_processing.stats import CONTACT_METRIC_PREFIX, PROCESSING_LOG_STAT_FIELDS, processing_log_counters
+from hubspot_integration.models import HubSpotContact
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild daily stats rollups from processing logs and HubSpot contacts. '
+        'Processing counters are rebuilt from each user\'s oldest retained log onwards, '
+        'so rollups of days whose logs were already cleaned up are kept. '
+        'Run while no processing is in flight, or counts written meanwhile may be lost.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this user id')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Processing logs read per batch')
+
+    def handle(self, *args, **options):
+        logs = EmailProcessingLog.objects.all()
+        contacts = HubSpotContact.objects.all()
+        if options['user']:
+            logs = logs.filter(email_message__email_account__user_id=options['user'])
+            contacts = contacts.filter(hubspot_account__user_id=options['user'])
+
+        counters = defaultdict(Counter)
+        log_count = 0
+        rows = logs.values(*PROCESSING_LOG_STAT_FIELDS, user_id=F('email_message__email_account__user_id'))
+        for row in rows.iterator(chunk_size=max(1, options['batch_size'])):
+            counters[(row['user_id'], timezone.localdate(row['created_at']))].update(processing_log_counters(row))
+            log_count += 1
+            if log_count % 10000 == 0:
+                self.stdout.write(f'Read {log_count} processing logs')
+
+        first_days = {}
+        for user_id, day in counters:
+            first_days[user_id] = min(day, first_days.get(user_id, day))
+
+        today = timezone.localdate()
+        contact_counts = contacts.values(
+            'sync_status', user_id=F('hubspot_account__user_id')
+        ).annotate(total=Count('id'))
+
+        stats = [
+            DailyStat(user_id=user_id, date=day, metric=metric, value=value)
+            for (user_id, day), counter in counters.items()
+            for metric, value in counter.items() if value
+        ] + [
+            DailyStat(user_id=row['user_id'], date=today, metric=f"{CONTACT_METRIC_PREFIX}{row['sync_status']}", value=row['total'])
+            for row in contact_counts
+        ]
+
+        with transaction.atomic():
+            for user_id, first_day in first_days.items():
+                DailyStat.objects.filter(user_id=user_id, date__gte=first_day).exclude(
+                    metric__startswith=CONTACT_METRIC_PREFIX
+                ).delete()
+            contact_stats = DailyStat.objects.filter(metric__startswith=CONTACT_METRIC_PREFIX)
+            if options['user']:
+                contact_stats = contact_stats.filter(user_id=options['user'])
+            contact_stats.delete()
+            DailyStat.objects.bulk_create(stats, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(stats)} daily counters from {log_count} processing logs '
+            f'for {len(first_days)} users'
+        ))
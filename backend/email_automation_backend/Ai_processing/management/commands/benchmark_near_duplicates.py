@@ -0,0 +1,205 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from Ai_processing.near_duplicates import SimHashIndex, normalize_email_words, simhash
+
+FIRST_NAMES = ['Alice', 'Bilal', 'Chen', 'Dana', 'Emeka', 'Farah', 'Gustavo', 'Hana', 'Ivan', 'Jia', 'Kofi', 'Lena']
+LAST_NAMES = ['Ahmed', 'Brown', 'Costa', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Iqbal', 'Jensen']
+PRODUCTS = ['wireless mouse', 'standing desk', 'USB-C hub', 'noise cancelling headphones', 'desk lamp',
+            'mechanical keyboard', 'webcam', 'monitor arm', 'laptop sleeve', 'office chair']
+CITIES = ['Lahore', 'Berlin', 'Austin', 'Nairobi', 'Lisbon', 'Osaka', 'Toronto', 'Dubai']
+
+# Templated mail: the same text sent to many mailboxes with different fills.
+# Some templates share a sender and most of their wording (shipped/delivered),
+# which is where false matches would come from.
+TEMPLATES = {
+    'order_confirmation': (
+        'Your order #{order} has been confirmed',
+        'Hi {first},\n\nThank you for shopping with us! We have received your order #{order} placed on {date} '
+        'and it is now being prepared. Order summary: {qty} x {product}, total {amount} USD including taxes. '
+        'You will receive another email with tracking details as soon as your package leaves our warehouse. '
+        'You can review your order at any time here: https://shop.example.com/orders/{order}?utm_source=email&uid={uid}\n\n'
+        'If you have questions about your purchase, reply to this email or contact support@shop.example.com.\n\n'
+        'Thanks,\nThe Example Shop team'
+    ),
+    'order_shipped': (
+        'Your order #{order} is on its way',
+        'Hi {first},\n\nGood news! Your order #{order} placed on {date} has shipped and is on its way to {city}. '
+        'Order summary: {qty} x {product}, total {amount} USD including taxes. Your tracking number is {tracking}. '
+        'You can follow your package here: https://track.example.com/{tracking}?uid={uid}\n\n'
+        'If you have questions about your purchase, reply to this email or contact support@shop.example.com.\n\n'
+        'Thanks,\nThe Example Shop team'
+    ),
+    'order_delivered': (
+        'Your order #{order} was delivered',
+        'Hi {first},\n\nYour order #{order} placed on {date} was delivered in {city} today at {time}. '
+        'Order summary: {qty} x {product}, total {amount} USD including taxes. We hope you enjoy it! '
+        'Tell us what you think and rate your purchase here: https://shop.example.com/review/{order}?uid={uid}\n\n'
+        'If you have questions about your purchase, reply to this email or contact support@shop.example.com.\n\n'
+        'Thanks,\nThe Example Shop team'
+    ),
+    'password_reset': (
+        'Reset your password',
+        'Hello {first} {last},\n\nWe received a request to reset the password for the account {email}. '
+        'Use the link below to choose a new password. The link expires in {qty} hours and can only be used once.\n\n'
+        'https://accounts.example.com/reset?token={uid}\n\nIf you did not request a password reset, you can safely '
+        'ignore this email; your password will not change. For security, never share this link with anyone.\n\n'
+        'Example Accounts'
+    ),
+    'invoice': (
+        'Invoice INV-{order} for {month}',
+        'Dear {first} {last},\n\nPlease find attached invoice INV-{order} for your subscription in {month}. '
+        'The amount of {amount} USD will be charged to the card ending in {card} on {date}. '
+        'No action is needed if your payment details are up to date. You can download all past invoices '
+        'from your billing dashboard: https://billing.example.com/invoices/{order}?session={uid}\n\n'
+        'Questions about billing? Contact billing@example.com and quote your customer number {tracking}.\n\n'
+        'Kind regards,\nExample Billing'
+    ),
+    'meeting_reminder': (
+        'Reminder: {product} review on {date}',
+        'Hi {first},\n\nThis is a reminder that the {product} review is scheduled for {date} at {time} in the '
+        '{city} office, meeting room {qty}. The agenda covers the current status, open issues and next steps. '
+        'Please join via https://meet.example.com/{uid} if you cannot attend in person, and send any documents '
+        'you want to discuss to {email} before the meeting.\n\nSee you there,\nCalendar Bot'
+    ),
+    'newsletter': (
+        'This week at Example: {month} edition',
+        'Hi {first},\n\nHere is what happened this week. Our team shipped a faster search, a redesigned settings '
+        'page and dozens of small fixes. Customers in {city} can now use same-day delivery for orders above '
+        '{amount} USD. Read the full story on our blog: https://blog.example.com/weekly?ref={uid}\n\n'
+        'Coming up next: a live session about productivity tips on {date}. Save your seat and bring your '
+        'questions.\n\nYou receive this email because you subscribed at {email}. Unsubscribe at any time: '
+        'https://example.com/unsubscribe?u={uid}'
+    ),
+    'support_ticket': (
+        'Ticket #{order} received: {product}',
+        'Hello {first},\n\nThanks for contacting Example Support about your {product}. Your request has been '
+        'logged as ticket #{order} and assigned priority {qty}. One of our agents will get back to you within '
+        'one business day. You can add details or attachments to the ticket by replying to this email, or '
+        'view its status at https://support.example.com/tickets/{order}?key={uid}\n\nExample Support'
+    ),
+}
+
+# One-off personal mail is built from sentence parts, so no two emails are the
+# same but they share plenty of everyday wording; none of it should match
+PERSONAL_OPENERS = [
+    'Could we', 'I think we should', 'Please', 'Can you', 'We still need to', 'I would like to',
+    'Do you have time to', 'Let us', 'I forgot to', 'It would help to', 'Remember to', 'We could',
+]
+PERSONAL_ACTIONS = [
+    'move our call', 'review the draft', 'check the numbers in section two', 'share the slides',
+    'sign the contract', 'book the venue', 'hire a second designer', 'discuss the discount',
+    'plan the server migration', 'finish the proposal', 'grab lunch', 'call the accountant',
+    'fix the prototype', 'update the budget', 'meet the new intern', 'send the photos',
+]
+PERSONAL_TIMES = [
+    'later this week', 'before Friday', 'next Monday', 'after the holidays', 'tomorrow morning',
+    'by the end of the month', 'when you are back in town', 'before the board meeting', 'tonight',
+]
+PERSONAL_ASIDES = [
+    'My flight lands around noon.', 'The client is getting impatient.', 'Happy birthday, by the way!',
+    'The kids say hello.', 'Legal has not replied yet.', 'Our budget is tighter than expected.',
+    'I am out of office on Thursday.', 'Thanks again for the introduction.', 'The weather here is awful.',
+    'No rush on this one.', 'This is blocking the launch.', 'I attached last year\'s version.',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark near-duplicate detection on a synthetic corpus of templated mail '
+        '(receipts, shipping notices, invoices, newsletters, ...) mixed with one-off personal mail. '
+        'Reports the share of templated emails that could reuse an earlier analysis and the share '
+        'of matches that point at a different template.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=5000,
+                            help='Emails in the corpus')
+        parser.add_argument('--personal-share', type=float, default=0.3,
+                            help='Share of one-off personal emails')
+        parser.add_argument('--distances', nargs='+', type=int, default=[1, 3, 5, 7],
+                            help='Maximum SimHash distances to evaluate; above 5 the banded index can miss matches')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        corpus = [self._email(rng, options['personal_share']) for _ in range(options['emails'])]
+
+        start = time.perf_counter()
+        hashes = [simhash(normalize_email_words(subject, body)) for _, subject, body in corpus]
+        hash_time = time.perf_counter() - start
+        self.stdout.write(
+            f"{len(corpus)} emails, {sum(1 for label, _, _ in corpus if label is None)} personal; "
+            f"fingerprinting {hash_time * 1e6 / len(corpus):.0f} us/email"
+        )
+        self.stdout.write(
+            f"{'distance':>8}  {'reusable':>8}  {'reused':>6}  {'reuse rate':>10}  "
+            f"{'false matches':>13}  {'false-match rate':>16}  {'lookup us':>9}"
+        )
+
+        for max_distance in options['distances']:
+            self._evaluate(corpus, hashes, max_distance)
+
+    def _evaluate(self, corpus, hashes, max_distance):
+        index = SimHashIndex(max_distance)
+        seen_templates = set()
+        reusable = reused = false_matches = 0
+
+        start = time.perf_counter()
+        for position, ((label, _, _), value) in enumerate(zip(corpus, hashes)):
+            match = index.nearest(value)
+            if label is not None and label in seen_templates:
+                reusable += 1
+            if match is not None:
+                if label is not None and corpus[match[0]][0] == label:
+                    reused += 1
+                else:
+                    false_matches += 1
+            else:
+                # Like process_new_email_with_ai: only emails analysed by the model are indexed
+                index.add(position, value)
+            seen_templates.add(label)
+        lookup_time = time.perf_counter() - start
+
+        matches = reused + false_matches
+        self.stdout.write(
+            f"{max_distance:>8}  {reusable:>8}  {reused:>6}  {reused / reusable if reusable else 0:>10.1%}  "
+            f"{false_matches:>13}  {false_matches / matches if matches else 0:>16.2%}  "
+            f"{lookup_time * 1e6 / len(corpus):>9.1f}"
+        )
+
+    def _email(self, rng, personal_share):
+        """(template name or None for personal mail, subject, body)"""
+        if rng.random() < personal_share:
+            sentences = []
+            for _ in range(rng.randint(3, 6)):
+                sentences.append(
+                    f'{rng.choice(PERSONAL_OPENERS)} {rng.choice(PERSONAL_ACTIONS)} {rng.choice(PERSONAL_TIMES)}?'
+                )
+                if rng.random() < 0.5:
+                    sentences.append(rng.choice(PERSONAL_ASIDES))
+            body = f"Hi {rng.choice(FIRST_NAMES)},\n\n{' '.join(sentences)}\n\nBest,\n{rng.choice(FIRST_NAMES)}"
+            return None, sentences[0].rstrip('?').capitalize(), body
+
+        label = rng.choice(list(TEMPLATES))
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        fills = {
+            'first': first,
+            'last': last,
+            'email': f'{first}.{last}{rng.randint(1, 99)}@mail.example.org'.lower(),
+            'order': rng.randint(100000, 999999),
+            'uid': f'{rng.getrandbits(64):016x}',
+            'tracking': f'1Z{rng.getrandbits(40):010X}',
+            'date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'time': f'{rng.randint(8, 18)}:{rng.choice(["00", "15", "30", "45"])}',
+            'month': rng.choice(['January', 'February', 'March', 'April', 'May', 'June']),
+            'qty': rng.randint(1, 5),
+            'amount': f'{rng.randint(5, 900)}.{rng.randint(0, 99):02d}',
+            'card': rng.randint(1000, 9999),
+            'product': rng.choice(PRODUCTS),
+            'city': rng.choice(CITIES),
+        }
+        subject, body = TEMPLATES[label]
+        return label, subject.format(**fills), body.format(**fills)
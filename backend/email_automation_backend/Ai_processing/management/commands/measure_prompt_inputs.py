@@ -0,0 +1,52 @@
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Ai_processing.prompt_input import clean_email_body, count_tokens, get_encoding, truncate_to_budget
+from User.models import EmailMessage
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure prompt body tokens of stored received emails: raw, after cleaning '
+        '(HTML to text, no quoted history, signatures or disclaimers) and after the token budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only emails of this user id')
+        parser.add_argument('--limit', type=int, default=1000, help='Most recent emails measured')
+        parser.add_argument('--budget', type=int, default=settings.AI_PROMPT_BODY_TOKEN_BUDGET,
+                            help='Token budget per body')
+
+    def handle(self, *args, **options):
+        emails = EmailMessage.objects.filter(message_type='received')
+        if options['user']:
+            emails = emails.filter(email_account__user_id=options['user'])
+        rows = emails.order_by('-received_at').values_list('body_plain', 'body_html')[:options['limit']]
+
+        raw, cleaned, budgeted = [], [], []
+        for body_plain, body_html in rows:
+            body = body_plain or body_html
+            text = clean_email_body(body, html=not body_plain)
+            raw.append(count_tokens(body))
+            cleaned.append(count_tokens(text))
+            budgeted.append(count_tokens(truncate_to_budget(text, options['budget'])))
+
+        if not raw:
+            self.stdout.write('No received emails to measure')
+            return
+
+        self.stdout.write(
+            f"{len(raw)} emails, budget {options['budget']} tokens, "
+            f"{'tiktoken o200k_base' if get_encoding() else 'estimated'} counts"
+        )
+        self.stdout.write(f"{'stage':<10}  {'total':>10}  {'mean':>8}  {'median':>8}  {'p95':>8}  {'max':>8}  {'saved':>7}")
+        for stage, counts in (('raw', raw), ('cleaned', cleaned), ('budgeted', budgeted)):
+            ordered = sorted(counts)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            saved = 1 - sum(counts) / sum(raw) if sum(raw) else 0
+            self.stdout.write(
+                f"{stage:<10}  {sum(counts):>10}  {statistics.mean(counts):>8.0f}  {statistics.median(counts):>8.0f}  "
+                f"{p95:>8}  {ordered[-1]:>8}  {saved:>7.1%}"
+            )
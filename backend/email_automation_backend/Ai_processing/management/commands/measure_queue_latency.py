@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from email_automation_backend.celery import app, queue_probe
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how long interactive AI tasks wait in their queue while a bulk AI job runs. '
+        'Needs the broker and workers for the ai_interactive and ai_bulk queues running '
+        '(see the worker commands in requirements.txt). Sends probe tasks only, no emails are processed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk-tasks', type=int, default=200, help='Probe tasks flooding the bulk queue')
+        parser.add_argument('--bulk-seconds', type=float, default=1.0, help='Work time of each bulk task')
+        parser.add_argument('--probes', type=int, default=20, help='Interactive probes per scenario')
+        parser.add_argument('--interval', type=float, default=0.25, help='Seconds between interactive probes')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stdout.write(f"{'scenario':<44}  {'median':>8}  {'p95':>8}  {'max':>8}")
+        self._scenario('idle', 'ai_interactive', settings.TASK_PRIORITY_NORMAL, bulk=False)
+        self._scenario('bulk job running, own queue', 'ai_interactive', settings.TASK_PRIORITY_NORMAL)
+        self._scenario('bulk job running, shared queue', 'ai_bulk', settings.TASK_PRIORITY_NORMAL)
+        self._scenario('bulk job running, shared queue, high priority', 'ai_bulk', settings.TASK_PRIORITY_HIGH)
+
+    def _scenario(self, name, probe_queue, priority, bulk=True):
+        bulk_results = []
+        if bulk:
+            bulk_results = [
+                queue_probe.apply_async(
+                    (time.time(), self.options['bulk_seconds']), queue='ai_bulk', priority=settings.TASK_PRIORITY_LOW
+                )
+                for _ in range(self.options['bulk_tasks'])
+            ]
+            # Let the bulk workers fill every slot before probing
+            time.sleep(1)
+
+        probes = []
+        for _ in range(self.options['probes']):
+            probes.append(queue_probe.apply_async((time.time(),), queue=probe_queue, priority=priority))
+            time.sleep(self.options['interval'])
+        waits = sorted(probe.get(timeout=600) for probe in probes)
+
+        # Drop the bulk tasks still queued so the next scenario starts clean
+        app.control.revoke([result.id for result in bulk_results])
+        for result in bulk_results:
+            try:
+                result.get(timeout=600, propagate=False)
+            except Exception:
+                pass
+
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+        self.stdout.write(
+            f"{name:<44}  {statistics.median(waits) * 1000:>6.0f}ms  {p95 * 1000:>6.0f}ms  {waits[-1] * 1000:>6.0f}ms"
+        )
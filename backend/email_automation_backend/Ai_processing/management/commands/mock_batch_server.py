@@ -0,0 +1,179 @@
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+# Local stand-in for an OpenAI-compatible batch API, enough for batch.py:
+# file upload and download, batch create and retrieve. Batches finish after
+# --delay seconds with canned answers; --failure-rate of the requests fail
+# (half as request errors, half as unparseable answers) to exercise retries.
+# Run it and set AI_BATCH_BASE_URL=http://localhost:<port>/v1 (and any AI_BATCH_API_KEY).
+
+ANALYSIS = {
+    "summary": "Mock analysis of the email",
+    "sentiment": "neutral",
+    "category": "information",
+    "priority": "medium",
+    "key_points": ["Mock key point"],
+    "requires_response": True,
+    "suggested_actions": ["Review the email"],
+    "tone": "professional"
+}
+
+
+class MockBatchState:
+    def __init__(self, delay, failure_rate):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = content
+        return {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(content),
+            'created_at': int(time.time()),
+            'filename': f"{file_id}.jsonl",
+            'purpose': purpose,
+            'status': 'processed'
+        }
+
+    def create_batch(self, params):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        requests = [json.loads(line) for line in self.files[params['input_file_id']].decode().splitlines() if line.strip()]
+        batch = {
+            'id': batch_id,
+            'object': 'batch',
+            'endpoint': params['endpoint'],
+            'input_file_id': params['input_file_id'],
+            'completion_window': params['completion_window'],
+            'status': 'in_progress',
+            'output_file_id': None,
+            'error_file_id': None,
+            'errors': None,
+            'created_at': int(time.time()),
+            'metadata': params.get('metadata'),
+            'request_counts': {'total': len(requests), 'completed': 0, 'failed': 0},
+        }
+        self.batches[batch_id] = (batch, requests)
+        return batch
+
+    def get_batch(self, batch_id):
+        with self.lock:
+            batch, requests = self.batches[batch_id]
+            if batch['status'] == 'in_progress' and time.time() - batch['created_at'] >= self.delay:
+                self._complete(batch, requests)
+            return batch
+
+    def _complete(self, batch, requests):
+        output, errors = [], []
+        for request in requests:
+            line = {'id': f"batch_req_{uuid.uuid4().hex}", 'custom_id': request['custom_id']}
+            roll = random.random()
+            if roll < self.failure_rate / 2:
+                line['response'] = {'status_code': 500, 'body': {'error': {'message': 'Mock server error'}}}
+                line['error'] = None
+                errors.append(line)
+                continue
+            content = '{not json' if roll < self.failure_rate else json.dumps(self._answer(request['body']))
+            line['response'] = {'status_code': 200, 'body': self._completion(request['body'], content)}
+            line['error'] = None
+            output.append(line)
+
+        if output:
+            batch['output_file_id'] = self.add_file(self._jsonl(output), 'batch_output')['id']
+        if errors:
+            batch['error_file_id'] = self.add_file(self._jsonl(errors), 'batch_output')['id']
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+        batch['request_counts'] = {'total': len(requests), 'completed': len(output), 'failed': len(errors)}
+
+    def _answer(self, body):
+        answer = dict(ANALYSIS)
+        if 'reply_body' in body['messages'][-1]['content']:
+            answer['reply_subject'] = "Re: your email"
+            answer['reply_body'] = "Thank you for your email. This is a mock reply."
+        return answer
+
+    def _completion(self, body, content):
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 200, 'completion_tokens': 100, 'total_tokens': 300}
+        }
+
+    def _jsonl(self, lines):
+        return ('\n'.join(json.dumps(line) for line in lines) + '\n').encode()
+
+
+def make_handler(state):
+    class MockBatchHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path == '/v1/files':
+                form = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+                )
+                fields = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                          for part in form.iter_parts()}
+                self._send(state.add_file(fields['file'], fields['purpose'].decode()))
+            elif self.path == '/v1/batches':
+                self._send(state.create_batch(json.loads(body)))
+            else:
+                self._send({'error': {'message': f"Unknown path {self.path}"}}, status=404)
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts[:2] == ['v1', 'batches'] and len(parts) == 3 and parts[2] in state.batches:
+                self._send(state.get_batch(parts[2]))
+            elif parts[:2] == ['v1', 'files'] and len(parts) == 4 and parts[3] == 'content' and parts[2] in state.files:
+                self._send_bytes(state.files[parts[2]], 'application/jsonl')
+            else:
+                self._send({'error': {'message': f"Unknown path {self.path}"}}, status=404)
+
+        def _send(self, payload, status=200):
+            self._send_bytes(json.dumps(payload).encode(), 'application/json', status)
+
+        def _send_bytes(self, content, content_type, status=200):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return MockBatchHandler
+
+
+class Command(BaseCommand):
+    help = 'Run a local mock of the OpenAI batch API for testing offline batch processing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--delay', type=float, default=5.0, help='Seconds until a batch completes')
+        parser.add_argument('--failure-rate', type=float, default=0.1, help='Share of requests that fail')
+
+    def handle(self, *args, **options):
+        state = MockBatchState(options['delay'], options['failure_rate'])
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), make_handler(state))
+        self.stdout.write(f"Mock batch API on http://127.0.0.1:{options['port']}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ai_processing', '0003_dailystat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailprocessinglog',
+            name='cache_hit',
+            field=models.BooleanField(default=False, help_text='At least one AI result came from the LLM cache'),
+        ),
+        migrations.AddField(
+            model_name='emailprocessinglog',
+            name='tokens_saved',
+            field=models.IntegerField(default=0, help_text='AI tokens the cached results originally cost'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ai_processing', '0004_emailprocessinglog_cache_hit_tokens_saved'),
+        ('User', '0007_emailmessage_is_archived'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('simhash', models.BigIntegerField()),
+                ('band_0', models.IntegerField()),
+                ('band_1', models.IntegerField()),
+                ('band_2', models.IntegerField()),
+                ('band_3', models.IntegerField()),
+                ('band_4', models.IntegerField()),
+                ('band_5', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('email_message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint', to='User.emailmessage')),
+                ('processing_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Ai_processing.emailprocessinglog')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_fingerprints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'band_0'], name='Ai_processi_user_id_17b04a_idx'), models.Index(fields=['user', 'band_1'], name='Ai_processi_user_id_c282e9_idx'), models.Index(fields=['user', 'band_2'], name='Ai_processi_user_id_6c25e9_idx'), models.Index(fields=['user', 'band_3'], name='Ai_processi_user_id_f1ceba_idx'), models.Index(fields=['user', 'band_4'], name='Ai_processi_user_id_627ee2_idx'), models.Index(fields=['user', 'band_5'], name='Ai_processi_user_id_a3d3ea_idx')],
+            },
+        ),
+    ]
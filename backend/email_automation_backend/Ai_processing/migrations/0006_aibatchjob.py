@@ -0,0 +1,37 @@
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ai_processing', '0005_emailfingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIBatchJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('processing_type', models.CharField(default='analysis', max_length=20)),
+                ('status', models.CharField(default='validating', help_text='Batch status reported by the provider', max_length=20)),
+                ('provider_batch_id', models.CharField(max_length=255)),
+                ('input_file_id', models.CharField(max_length=255)),
+                ('output_file_id', models.CharField(blank=True, max_length=255)),
+                ('error_file_id', models.CharField(blank=True, max_length=255)),
+                ('email_ids', models.JSONField(default=list, help_text='Emails in the batch; request custom_ids are these ids')),
+                ('attempt', models.IntegerField(default=1, help_text='1 for a first submission, higher for retries of failed requests')),
+                ('succeeded_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('retried_count', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ingested_at', models.DateTimeField(blank=True, help_text='When the results were written to processing logs', null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_batch_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Ai_processing', '0006_aibatchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aibatchjob',
+            name='ingest_claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When a poll claimed the ended batch for ingesting; only that poll ingests it', null=True),
+        ),
+    ]
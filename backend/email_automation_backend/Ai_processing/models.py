@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 from User.models import EmailAccount, EmailMessage
 from Accounts.models import User
@@ -66,9 +67,84 @@ class EmailProcessingLog(models.Model):
     reply_sent_at = models.DateTimeField(blank=True, null=True)
     processing_duration = models.FloatField(blank=True, null=True, help_text="Processing duration in seconds")
     tokens_used = models.IntegerField(blank=True, null=True, help_text="AI tokens consumed")
+    cache_hit = models.BooleanField(default=False, help_text="At least one AI result came from the LLM cache")
+    tokens_saved = models.IntegerField(default=0, help_text="AI tokens the cached results originally cost")
     error_message = models.TextField(blank=True)
     error_details = models.JSONField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
 
+
+
+class DailyStat(models.Model):
+    """
+    One per-user daily counter (e.g. "status:completed", "tokens") for AI processing
+    and HubSpot contact sync. Kept current as logs and contacts are saved; see stats.py.
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    metric = models.CharField(max_length=64)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        unique_together = ['user', 'date', 'metric']
+
+
+class EmailFingerprint(models.Model):
+    """
+    SimHash of an email whose analysis came from the model, split into indexed
+    bands so near-duplicates can reuse that analysis; see near_duplicates.py.
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='email_fingerprints')
+    email_message = models.OneToOneField(EmailMessage, on_delete=models.CASCADE, related_name='fingerprint')
+    processing_log = models.ForeignKey(EmailProcessingLog, on_delete=models.CASCADE, related_name='+')
+    simhash = models.BigIntegerField()
+    band_0 = models.IntegerField()
+    band_1 = models.IntegerField()
+    band_2 = models.IntegerField()
+    band_3 = models.IntegerField()
+    band_4 = models.IntegerField()
+    band_5 = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'band_0']),
+            models.Index(fields=['user', 'band_1']),
+            models.Index(fields=['user', 'band_2']),
+            models.Index(fields=['user', 'band_3']),
+            models.Index(fields=['user', 'band_4']),
+            models.Index(fields=['user', 'band_5']),
+        ]
+
+
+class AIBatchJob(models.Model):
+    """
+    Offline batch of AI requests for bulk processing, one per email, submitted
+    to the provider's batch API and ingested into processing logs; see batch.py.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_batch_jobs')
+    processing_type = models.CharField(max_length=20, default='analysis')
+    status = models.CharField(max_length=20, default='validating', help_text="Batch status reported by the provider")
+    provider_batch_id = models.CharField(max_length=255)
+    input_file_id = models.CharField(max_length=255)
+    output_file_id = models.CharField(max_length=255, blank=True)
+    error_file_id = models.CharField(max_length=255, blank=True)
+    email_ids = models.JSONField(default=list, help_text="Emails in the batch; request custom_ids are these ids")
+    attempt = models.IntegerField(default=1, help_text="1 for a first submission, higher for retries of failed requests")
+    succeeded_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    retried_count = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    ingest_claimed_at = models.DateTimeField(
+        blank=True, null=True, help_text="When a poll claimed the ended batch for ingesting; only that poll ingests it"
+    )
+    ingested_at = models.DateTimeField(blank=True, null=True, help_text="When the results were written to processing logs")
@@ -0,0 +1,161 @@
+import hashlib
+import re
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from User.utils import split_quoted_history
+from .models import EmailFingerprint
+
+# Near-duplicate emails (templated mail differing in names, order numbers or
+# tracking links) are found with a 64-bit SimHash of word pairs. The hash is
+# split into six bands; two hashes at most five bits apart agree on at least
+# one whole band, so candidates come from exact lookups on indexed bands and
+# only those are compared bit by bit. benchmark_near_duplicates measures the
+# reuse and false-match rates these choices give.
+
+SIMHASH_BITS = 64
+BAND_WIDTHS = (11, 11, 11, 11, 10, 10)
+SIMHASH_BANDS = len(BAND_WIDTHS)
+MAX_INDEXED_DISTANCE = SIMHASH_BANDS - 1
+SHINGLE_SIZE = 2
+
+_URL = re.compile(r'https?://([^/\s?#"\'<>]+)[^\s"\'<>]*')
+_ADDRESS = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+_NUMBER = re.compile(r'\d+(?:[.,:/-]\d+)*')
+_WORD = re.compile(r'\w+')
+
+
+def normalize_email_words(subject, body, html=False):
+    """
+    Words of an email with the parts templates vary masked: quoted history is
+    dropped, links keep only their host, addresses and numbers become placeholders
+    """
+    body, _ = split_quoted_history(body or '', html=html)
+    if html:
+        body = strip_tags(body)
+    text = f'{subject or ""}\n{body}'.casefold()
+    text = _URL.sub(r' url \1 ', text)
+    text = _ADDRESS.sub(' address ', text)
+    text = _NUMBER.sub(' 0 ', text)
+    return _WORD.findall(text)
+
+
+def simhash(words):
+    """64-bit SimHash of the word shingles, each weighted by how often it occurs"""
+    if len(words) <= SHINGLE_SIZE:
+        shingles = Counter([' '.join(words)])
+    else:
+        shingles = Counter(' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def simhash_bands(value):
+    bands = []
+    for width in BAND_WIDTHS:
+        bands.append(value & ((1 << width) - 1))
+        value >>= width
+    return bands
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def to_signed(value):
+    """Unsigned 64-bit hash as stored in a BigIntegerField"""
+    return value - (1 << SIMHASH_BITS) if value >> (SIMHASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value % (1 << SIMHASH_BITS)
+
+
+def email_fingerprint(email_message):
+    """SimHash of an email, or None when it is too short for similarity to mean much"""
+    html = not email_message.body_plain
+    words = normalize_email_words(
+        email_message.subject, email_message.body_plain or email_message.body_html, html=html
+    )
+    if len(words) < settings.NEAR_DUPLICATE_MIN_WORDS:
+        return None
+    return simhash(words)
+
+
+class SimHashIndex:
+    """
+    In-memory banded SimHash index: one dict per band from band value to the
+    keys holding it. Used by the benchmark; EmailFingerprint is the persisted
+    equivalent queried by find_near_duplicate.
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.hashes = {}
+        self.buckets = [{} for _ in range(SIMHASH_BANDS)]
+
+    def add(self, key, value):
+        self.hashes[key] = value
+        for band, band_value in enumerate(simhash_bands(value)):
+            self.buckets[band].setdefault(band_value, []).append(key)
+
+    def nearest(self, value):
+        """(key, distance) of the closest indexed hash within max_distance, or None"""
+        candidates = set()
+        for band, band_value in enumerate(simhash_bands(value)):
+            candidates.update(self.buckets[band].get(band_value, ()))
+        best = None
+        for key in candidates:
+            distance = hamming_distance(value, self.hashes[key])
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (key, distance)
+        return best
+
+
+def find_near_duplicate(user_id, fingerprint):
+    """
+    Id of the processing log of the user's most similar email fingerprinted in
+    the last NEAR_DUPLICATE_WINDOW_DAYS, or None if none is close enough
+    """
+    max_distance = min(settings.NEAR_DUPLICATE_MAX_DISTANCE, MAX_INDEXED_DISTANCE)
+    since = timezone.now() - timedelta(days=settings.NEAR_DUPLICATE_WINDOW_DAYS)
+    band_match = reduce(or_, (
+        Q(**{f'band_{band}': band_value}) for band, band_value in enumerate(simhash_bands(fingerprint))
+    ))
+    candidates = EmailFingerprint.objects.filter(band_match, user_id=user_id, created_at__gte=since).order_by(
+        '-created_at'
+    ).values_list('simhash', 'processing_log_id')[:settings.NEAR_DUPLICATE_MAX_CANDIDATES]
+
+    best = None
+    for stored, log_id in candidates:
+        distance = hamming_distance(fingerprint, to_unsigned(stored))
+        # Candidates are newest first, so ties go to the most recent email
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (log_id, distance)
+    return best[0] if best else None
+
+
+def record_fingerprint(user_id, email_message_id, processing_log_id, fingerprint):
+    """Index an email whose analysis came from the model, so later near-duplicates can reuse it"""
+    bands = simhash_bands(fingerprint)
+    EmailFingerprint.objects.update_or_create(
+        email_message_id=email_message_id,
+        defaults={
+            'user_id': user_id,
+            'processing_log_id': processing_log_id,
+            'simhash': to_signed(fingerprint),
+            **{f'band_{band}': band_value for band, band_value in enumerate(bands)},
+        }
+    )
@@ -0,0 +1,184 @@
+import logging
+import re
+from html import unescape
+
+from django.conf import settings
+
+from User.utils import split_quoted_history
+
+try:
+    import tiktoken
+except ImportError:  # optional, token counts are estimated without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Email bodies are cleaned before they go into a prompt: HTML becomes text,
+# quoted history, signatures and disclaimers are dropped, whitespace is
+# collapsed, and what is left is cut to AI_PROMPT_BODY_TOKEN_BUDGET tokens,
+# keeping the head, the tail and the lines in between that ask for something.
+# measure_prompt_inputs reports the token counts before and after on stored mail.
+
+TRUNCATION_MARKER = '[...]'
+CHARS_PER_TOKEN = 4
+
+_INVISIBLE_BLOCKS = re.compile(r'<(head|style|script|title)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENTS = re.compile(r'<!--.*?-->', re.DOTALL)
+_LINE_BREAKS = re.compile(r'<br\s*/?>|</(p|div|li|tr|h[1-6]|table|blockquote)\s*>', re.IGNORECASE)
+_LIST_ITEMS = re.compile(r'<li\b[^>]*>', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>')
+_INVISIBLE_CHARS = re.compile('[\u200b\u200c\u200d\u2060\ufeff\u00ad\u034f]')
+_SPACES = re.compile('[ \t\f\v\u00a0]+')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+# A line that starts a signature or a legal footer; everything from it on is dropped
+_SIGNATURE_START = re.compile(
+    r'^(?:-- ?|__{5,}|sent from my \w+.*|get outlook for \w+.*|'
+    r'(?:confidentiality notice|disclaimer|this (?:e-?mail|message)(?: and any attachments)?'
+    r' (?:is|are|may be|contains?) (?:confidential|intended)).*)$',
+    re.IGNORECASE | re.MULTILINE
+)
+# Lines worth keeping from a truncated middle: questions, requests, dates and amounts
+_KEY_LINE = re.compile(
+    r'\?|\b(?:please|could you|can you|would you|need|asap|urgent|deadline|due|by (?:mon|tue|wed|thu|fri|sat|sun|'
+    r'tomorrow|today|end of)|invoice|order|payment|refund|meeting|call|schedule|confirm)\b|\d',
+    re.IGNORECASE
+)
+
+_encoding = None
+_encoding_loaded = False
+
+
+def get_encoding():
+    """
+    tiktoken's o200k encoding, or None to estimate counts. Loaded once: the
+    encoding file is downloaded on first use (unless TIKTOKEN_CACHE_DIR holds
+    it), and a host without network access falls back to estimates for good
+    instead of retrying the download on every count.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding('o200k_base')
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating token counts: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text):
+    """Tokens in a text with tiktoken's o200k encoding, or an estimate from its length"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def html_to_text(body):
+    """Readable text of an HTML body: block ends become line breaks, entities are decoded"""
+    body = _INVISIBLE_BLOCKS.sub('', body)
+    body = _COMMENTS.sub('', body)
+    body = _LIST_ITEMS.sub('\n- ', body)
+    body = _LINE_BREAKS.sub('\n', body)
+    body = _TAGS.sub('', body)
+    return unescape(body)
+
+
+def strip_signature(text):
+    """Text before the first signature or disclaimer line, unless nothing would be left"""
+    match = _SIGNATURE_START.search(text)
+    if match and text[:match.start()].strip():
+        return text[:match.start()]
+    return text
+
+
+def collapse_whitespace(text):
+    text = _INVISIBLE_CHARS.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    lines = [_SPACES.sub(' ', line).strip() for line in text.split('\n')]
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def truncate_to_budget(text, budget):
+    """
+    Text cut to about budget tokens: the first half of the budget from the head,
+    a quarter from the tail, and the rest filled with key lines from between them
+    in their original order. Cuts are marked with TRUNCATION_MARKER.
+    """
+    if count_tokens(text) <= budget:
+        return text
+
+    lines = text.split('\n')
+    if count_tokens(lines[0]) + 1 > budget // 2:
+        # A long first line (or no line breaks at all): cut by characters instead
+        chars = budget * CHARS_PER_TOKEN
+        return f"{text[:chars * 3 // 4]} {TRUNCATION_MARKER} {text[-chars // 4:]}"
+
+    head, head_tokens = _take_lines(lines, budget // 2)
+    tail, tail_tokens = _take_lines(reversed(lines[len(head):]), budget // 4)
+    tail.reverse()
+    middle = lines[len(head):len(lines) - len(tail)]
+
+    remaining = budget - head_tokens - tail_tokens
+    kept = set()
+    for index, line in enumerate(middle):
+        if not _KEY_LINE.search(line):
+            continue
+        tokens = count_tokens(line) + 1
+        if tokens > remaining:
+            continue
+        kept.add(index)
+        remaining -= tokens
+
+    parts = list(head)
+    skipped = False
+    for index, line in enumerate(middle):
+        if index in kept:
+            parts.append(line)
+            skipped = False
+        elif not skipped:
+            parts.append(TRUNCATION_MARKER)
+            skipped = True
+    return '\n'.join(parts + tail)
+
+
+def _take_lines(lines, budget):
+    """Leading lines that fit in budget tokens, and their token count"""
+    taken, used = [], 0
+    for line in lines:
+        tokens = count_tokens(line) + 1
+        if used + tokens > budget:
+            break
+        taken.append(line)
+        used += tokens
+    return taken, used
+
+
+def clean_email_body(body, html=False):
+    """Email body as prompt text, before budgeting"""
+    body, _ = split_quoted_history(body or '', html=html)
+    if html:
+        body = html_to_text(body)
+    return strip_signature(collapse_whitespace(body)).strip()
+
+
+def prepare_email_body(email_message, budget=None):
+    """
+    Body of an email ready for a prompt, within budget tokens (by default
+    AI_PROMPT_BODY_TOKEN_BUDGET). The raw body is used as is when
+    AI_PROMPT_PREPROCESSING is off.
+    """
+    raw_body = email_message.body_plain or email_message.body_html
+    if not settings.AI_PROMPT_PREPROCESSING:
+        return raw_body
+
+    body = clean_email_body(raw_body, html=not email_message.body_plain)
+    body = truncate_to_budget(body, budget or settings.AI_PROMPT_BODY_TOKEN_BUDGET)
+    if not body:
+        # Nothing readable survived (an image-only mail); let the model see the original
+        return raw_body
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Prompt body for email {email_message.id}: {count_tokens(raw_body)} -> {count_tokens(body)} tokens")
+    return body
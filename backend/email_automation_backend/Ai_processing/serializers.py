@@ -0,0 +1,36 @@
+from email_automation_backend.fieldsets import select_value_fields
+
+# Lightweight serializers for AI processing list endpoints, built on values()
+# projections in the same way as User.serializers.
+
+PROCESSING_LOG_FIELDS = (
+    'id', 'email_message__subject', 'email_message__sender', 'processing_type', 'status',
+    'ai_summary', 'ai_sentiment', 'ai_category', 'ai_priority', 'generated_reply_subject',
+    'reply_sent', 'reply_sent_at', 'processing_duration', 'tokens_used', 'cache_hit', 'tokens_saved',
+    'error_message', 'created_at',
+)
+
+
+# API fields read through the related email message
+PROCESSING_LOG_FIELD_SOURCES = {
+    'email_subject': ('email_message__subject',),
+    'email_sender': ('email_message__sender',),
+}
+
+PROCESSING_LOG_API_FIELDS = tuple(
+    {'email_message__subject': 'email_subject', 'email_message__sender': 'email_sender'}.get(name, name)
+    for name in PROCESSING_LOG_FIELDS
+)
+
+
+def serialize_processing_logs(queryset, fields=None):
+    """Serialize an EmailProcessingLog queryset for log listings; fields limits the output to those API fields"""
+    value_fields = PROCESSING_LOG_FIELDS if fields is None else select_value_fields(fields, PROCESSING_LOG_FIELD_SOURCES)
+    logs_data = []
+    for row in queryset.values(*value_fields):
+        if 'email_message__subject' in row:
+            row['email_subject'] = row.pop('email_message__subject')
+        if 'email_message__sender' in row:
+            row['email_sender'] = row.pop('email_message__sender')
+        logs_data.append(row)
+    return logs_data
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from User.models import EmailMessage
+from .ai_service import invalidate_ai_settings
+from .models import AIProcessingSettings, EmailProcessingLog
+from .stats import PROCESSING_LOG_STAT_FIELDS, counter_delta, processing_log_counters, record_daily_stats
+
+
+@receiver(post_save, sender=AIProcessingSettings)
+@receiver(post_delete, sender=AIProcessingSettings)
+def ai_settings_changed(sender, instance, **kwargs):
+    # AISettingsView.post and the admin both save through here
+    invalidate_ai_settings(instance.user_id)
+
+
+@receiver(pre_save, sender=EmailProcessingLog)
+def processing_log_before_save(sender, instance, raw=False, **kwargs):
+    """Remember what the stored row counted for, so post_save only applies the difference"""
+    if raw or instance._state.adding:
+        instance._stat_values = None
+        return
+    instance._stat_values = (
+        EmailProcessingLog.objects.filter(pk=instance.pk).values(*PROCESSING_LOG_STAT_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=EmailProcessingLog)
+def processing_log_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    
+    before = getattr(instance, '_stat_values', None)
+    if before is None:
+        after = {name: getattr(instance, name) for name in PROCESSING_LOG_STAT_FIELDS}
+    else:
+        # Fields left out of update_fields were not written, so they keep their stored values
+        changed = PROCESSING_LOG_STAT_FIELDS if update_fields is None else update_fields
+        after = {name: getattr(instance, name) if name in changed else before[name] for name in PROCESSING_LOG_STAT_FIELDS}
+    
+    deltas = counter_delta(processing_log_counters(before) if before else {}, processing_log_counters(after))
+    if not deltas:
+        return
+    
+    user_id = EmailMessage.objects.filter(pk=instance.email_message_id).values_list(
+        'email_account__user_id', flat=True
+    ).first()
+    if user_id is not None:
+        record_daily_stats(user_id, timezone.localdate(after['created_at']), deltas)
@@ -0,0 +1,163 @@
+import bisect
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import Case, F, Max, Sum, Value, When
+from django.utils import timezone
+
+from .models import DailyStat
+
+# Daily rollups are sets of named counters per user and day. Processing logs add
+# "processed", "status:<status>", "type:<processing_type>", "sentiment:<s>",
+# "priority:<p>", "tokens", "replies_sent", "cache_hits", "tokens_saved" and a
+# latency histogram; HubSpot contacts add "contacts:<sync_status>" on the day
+# their status changes, so the sum over all days is the current number of
+# contacts in each state.
+
+CONTACT_METRIC_PREFIX = 'contacts:'
+
+# Upper bounds (ms) of the latency histogram buckets. Percentiles are not
+# additive across days, bucket counts are.
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000)
+
+# Fields of EmailProcessingLog that feed the rollups
+PROCESSING_LOG_STAT_FIELDS = (
+    'created_at', 'status', 'processing_type', 'ai_sentiment', 'ai_priority',
+    'tokens_used', 'processing_duration', 'reply_sent', 'cache_hit', 'tokens_saved',
+)
+
+
+def _latency_bucket(duration_seconds):
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, duration_seconds * 1000)
+
+
+def processing_log_counters(values):
+    """Counters one processing log contributes, from a dict of PROCESSING_LOG_STAT_FIELDS"""
+    counters = Counter({'processed': 1})
+    counters[f"status:{values['status']}"] += 1
+    counters[f"type:{values['processing_type']}"] += 1
+    if values['ai_sentiment']:
+        counters[f"sentiment:{values['ai_sentiment']}"] += 1
+    if values['ai_priority']:
+        counters[f"priority:{values['ai_priority']}"] += 1
+    if values['tokens_used']:
+        counters['tokens'] += values['tokens_used']
+    if values['processing_duration'] is not None:
+        counters['latency_count'] += 1
+        counters['latency_ms_sum'] += round(values['processing_duration'] * 1000)
+        counters[f"latency_bucket:{_latency_bucket(values['processing_duration'])}"] += 1
+    if values['reply_sent']:
+        counters['replies_sent'] += 1
+    if values['cache_hit']:
+        counters['cache_hits'] += 1
+    if values['tokens_saved']:
+        counters['tokens_saved'] += values['tokens_saved']
+    return counters
+
+
+def counter_delta(before, after):
+    """after - before, keeping negative and dropping zero entries"""
+    delta = Counter(after)
+    delta.subtract(before)
+    return {metric: value for metric, value in delta.items() if value}
+
+
+def record_daily_stats(user_id, date, deltas):
+    """
+    Add deltas ({metric: amount}) to a user's counters for a day. Two queries
+    whatever the number of metrics: missing rows are inserted at zero, then all
+    rows are incremented in one UPDATE, so concurrent writers never lose counts.
+    """
+    if not deltas:
+        return
+
+    now = timezone.now()
+    DailyStat.objects.bulk_create(
+        [DailyStat(user_id=user_id, date=date, metric=metric, value=0, updated_at=now) for metric in deltas],
+        ignore_conflicts=True
+    )
+    DailyStat.objects.filter(user_id=user_id, date=date, metric__in=list(deltas)).update(
+        value=F('value') + Case(
+            *(When(metric=metric, then=Value(amount)) for metric, amount in deltas.items()),
+            default=Value(0)
+        ),
+        updated_at=now
+    )
+
+
+def _sum_metrics(queryset):
+    return dict(queryset.values('metric').annotate(total=Sum('value')).values_list('metric', 'total'))
+
+
+def _breakdown(totals, prefix, key):
+    return sorted(
+        ({key: metric[len(prefix):], 'count': count} for metric, count in totals.items()
+         if metric.startswith(prefix) and count),
+        key=lambda row: -row['count']
+    )
+
+
+def _latency_percentiles(totals):
+    """Approximate latency percentiles in seconds (bucket upper bounds)"""
+    counts = [totals.get(f'latency_bucket:{index}', 0) for index in range(len(LATENCY_BUCKETS_MS) + 1)]
+    total = sum(counts)
+    percentiles = {}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        if not total:
+            percentiles[name] = None
+            continue
+        running = 0
+        for index, count in enumerate(counts):
+            running += count
+            if running >= fraction * total:
+                break
+        percentiles[name] = LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)] / 1000
+    return percentiles
+
+
+def get_processing_stats(user, days):
+    """AI processing statistics over the last `days` days, read from the rollups in one query"""
+    since = timezone.localdate() - timedelta(days=days)
+    totals = _sum_metrics(
+        DailyStat.objects.filter(user=user, date__gt=since).exclude(metric__startswith=CONTACT_METRIC_PREFIX)
+    )
+    latency_count = totals.get('latency_count', 0)
+    processed = totals.get('processed', 0)
+    return {
+        'period_days': days,
+        'total_processed': processed,
+        'replies_sent': totals.get('replies_sent', 0),
+        'average_processing_time': round(totals['latency_ms_sum'] / latency_count / 1000, 2) if latency_count else 0,
+        'processing_time_percentiles': _latency_percentiles(totals),
+        'total_tokens_used': totals.get('tokens', 0),
+        'cache_hits': totals.get('cache_hits', 0),
+        'cache_hit_rate': round(totals.get('cache_hits', 0) / processed, 3) if processed else 0,
+        'total_tokens_saved': totals.get('tokens_saved', 0),
+        'status_breakdown': _breakdown(totals, 'status:', 'status'),
+        'processing_type_breakdown': _breakdown(totals, 'type:', 'processing_type'),
+        'sentiment_breakdown': _breakdown(totals, 'sentiment:', 'ai_sentiment'),
+        'priority_breakdown': _breakdown(totals, 'priority:', 'ai_priority'),
+    }
+
+
+def contact_stats_queryset(user):
+    return DailyStat.objects.filter(user=user, metric__startswith=CONTACT_METRIC_PREFIX)
+
+
+def get_contact_sync_counts(user):
+    """Number of HubSpot contacts per sync status, read from the rollups in one query"""
+    counts = {
+        metric[len(CONTACT_METRIC_PREFIX):]: total
+        for metric, total in _sum_metrics(contact_stats_queryset(user)).items()
+    }
+    return {
+        'total_contacts': sum(counts.values()),
+        'synced_contacts': counts.get('synced', 0),
+        'failed_contacts': counts.get('failed', 0),
+        'pending_contacts': counts.get('pending', 0),
+    }
+
+
+def get_contact_stats_version(user):
+    """When the user's contact counters last changed, for conditional GETs"""
+    return contact_stats_queryset(user).aggregate(last_updated=Max('updated_at'))['last_updated']
@@ -1,4 +1,5 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from datetime import datetime
 import logging
@@ -6,20 +7,28 @@ import json
 
 from User.models import EmailMessage, EmailAccount
 from User.views import GmailService
-from .models import EmailProcessingLog, AIProcessingSettings
-from .ai_service import AIEmailProcessor
+from User.utils import dump_address_list, load_address_list, record_message_addresses
+from email_automation_backend.events import publish_event_on_commit
+from .models import EmailProcessingLog, AIProcessingSettings, AIBatchJob
+from .ai_service import AIEmailProcessor, is_model_analysis
+from .batch import pending_batch_email_ids, poll_batch, submit_batch
+from .engine import process_email, process_emails
+from .llm_limits import LLMUnavailable, retry_countdown, unavailable_for
+from .near_duplicates import email_fingerprint, find_near_duplicate, record_fingerprint
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True)
-def process_new_email_with_ai(self, email_message_id):
+def process_new_email_with_ai(self, email_message_id, force=False):
     """
     Process a new email with AI analysis and potentially generate an automated reply.
     This task is triggered when a new email is received.
     
     Args:
         email_message_id: UUID of the EmailMessage to process
+        force: Process it even if the ingest pre-filter marked it as not needing AI
+            (a user asked for it); automated mail is still never auto-replied to
     """
     logger.info(f"Starting AI processing task for email ID: {email_message_id}")
     
@@ -48,6 +57,15 @@ def process_new_email_with_ai(self, email_message_id):
                 'email_id': str(email_message.id)
             }
         
+        if not email_message.needs_ai and not force:
+            logger.info(f"⏭️ Automated email ({email_message.automated_category}), skipping AI")
+            return {
+                'status': 'skipped',
+                'message': f'Automated email: {email_message.automated_reason}',
+                'automated_category': email_message.automated_category,
+                'email_id': str(email_message.id)
+            }
+        
         # Check if this email has already been processed
         existing_log = EmailProcessingLog.objects.filter(
             email_message=email_message,
@@ -63,12 +81,32 @@ def process_new_email_with_ai(self, email_message_id):
                 'existing_log_id': str(existing_log.id)
             }
         
-        # Determine processing type
-        processing_type = 'auto_reply' if ai_processor.is_auto_reply_enabled() else 'analysis'
+        # While the provider is rate limited or down, wait instead of calling it
+        blocked_for = unavailable_for(ai_processor.provider)
+        if blocked_for:
+            raise LLMUnavailable("AI provider paused", retry_after=blocked_for)
+        
+        # Determine processing type; automated senders never get an auto-reply, which could loop
+        auto_reply = ai_processor.is_auto_reply_enabled() and not email_message.automated_category
+        processing_type = 'auto_reply' if auto_reply else 'analysis'
+        
+        # Templated mail (receipts, notifications, ...) reuses the analysis of a
+        # near-identical email the model analysed recently
+        fingerprint = email_fingerprint(email_message) if settings.NEAR_DUPLICATE_REUSE else None
+        similar_log = None
+        if fingerprint is not None:
+            similar_log_id = find_near_duplicate(user.id, fingerprint)
+            if similar_log_id:
+                similar_log = EmailProcessingLog.objects.filter(id=similar_log_id, status='completed').first()
         
         # Process the email with AI
         logger.info(f"Processing email with type: {processing_type}")
-        processing_result = ai_processor.process_email_with_ai(email_message, processing_type)
+        processing_result = process_email(ai_processor, email_message, processing_type, reuse_log=similar_log)
+        
+        if (fingerprint is not None and similar_log is None and
+                processing_result.get('status') == 'success' and
+                is_model_analysis(processing_result['analysis'])):
+            record_fingerprint(user.id, email_message.id, processing_result['processing_log_id'], fingerprint)
         
         # If auto reply is enabled and we generated a reply, send it
         if (processing_type == 'auto_reply' and 
@@ -78,10 +116,11 @@ def process_new_email_with_ai(self, email_message_id):
             logger.info("Auto reply enabled, attempting to send reply...")
             
             # Trigger the send reply task
-            send_result = send_automated_reply.delay(
-                email_message_id,
-                processing_result['generated_reply']['subject'],
-                processing_result['generated_reply']['body']
+            send_result = send_automated_reply.apply_async(
+                (email_message_id,
+                 processing_result['generated_reply']['subject'],
+                 processing_result['generated_reply']['body']),
+                priority=settings.TASK_PRIORITY_HIGH
             )
             
             processing_result['reply_task_id'] = send_result.id
@@ -106,13 +145,19 @@ def process_new_email_with_ai(self, email_message_id):
         return processing_result
         
     except Exception as e:
+        if isinstance(e, LLMUnavailable):
+            logger.warning(f"AI provider unavailable, retrying email {email_message_id} later: {str(e)}")
+            raise self.retry(exc=e, countdown=retry_countdown(e, self.request.retries),
+                             max_retries=settings.AI_UNAVAILABLE_MAX_RETRIES)
+        
         error_msg = f"Critical error in AI processing task: {str(e)}"
         logger.error(f"{error_msg}")
         
-        # Retry the task in case of critical errors
-        raise self.retry(exc=e, countdown=60, max_retries=3)
+        # Retry the task in case of critical errors, jittered so failures do not retry in lockstep
+        raise self.retry(exc=e, countdown=retry_countdown(e, self.request.retries, base=60), max_retries=3)
 
-@shared_task(bind=True)
+# Acknowledged on receipt: a reply must never be sent twice, even if the worker dies
+@shared_task(bind=True, acks_late=False)
 def send_automated_reply(self, original_email_id, reply_subject, reply_body):
     """
     Send an automated AI-generated reply to an email.
@@ -135,6 +180,28 @@ def send_automated_reply(self, original_email_id, reply_subject, reply_body):
             logger.error(f"{error_msg}")
             return {'status': 'error', 'message': error_msg}
         
+        # Settings read fresh: the reply was queued after an analysis that may have
+        # used a cached copy, and turning auto-reply off must stop it
+        auto_reply_allowed = AIProcessingSettings.objects.filter(
+            user=original_email.email_account.user, is_enabled=True, auto_reply_enabled=True
+        ).exists()
+        if not auto_reply_allowed:
+            logger.info(f"⏭️ Auto-reply turned off for {original_email.email_account.user.email}, not replying")
+            return {
+                'status': 'skipped',
+                'message': 'Auto-reply is disabled',
+                'email_id': str(original_email.id)
+            }
+        
+        if original_email.automated_category:
+            # Last line of defence against reply loops with other auto-responders
+            logger.info(f"⏭️ Not replying to automated email ({original_email.automated_category})")
+            return {
+                'status': 'skipped',
+                'message': f'Automated email: {original_email.automated_reason}',
+                'email_id': str(original_email.id)
+            }
+        
         logger.info(f"Sending automated reply to: {original_email.sender}")
         logger.info(f"Reply subject: {reply_subject}")
         
@@ -155,8 +222,8 @@ def send_automated_reply(self, original_email_id, reply_subject, reply_body):
         original_email_data = {
             'subject': original_email.subject,
             'sender': original_email.sender,
-            'recipients': json.loads(original_email.recipients) if original_email.recipients else [],
-            'cc': json.loads(original_email.cc) if original_email.cc else [],
+            'recipients': load_address_list(original_email.recipients),
+            'cc': load_address_list(original_email.cc),
             'body_html': original_email.body_html,
             'body_plain': original_email.body_plain,
             'gmail_message_id': original_email.gmail_message_id,
@@ -223,8 +290,8 @@ def send_automated_reply(self, original_email_id, reply_subject, reply_body):
             gmail_thread_id=send_result.get('threadId', original_email.gmail_thread_id),
             subject=reply_message_data['subject'],
             sender=email_account.email_address,
-            recipients=json.dumps(reply_message_data['to_emails']),
-            cc=json.dumps(reply_message_data['cc_emails']) if reply_message_data['cc_emails'] else '',
+            recipients=dump_address_list(reply_message_data['to_emails']),
+            cc=dump_address_list(reply_message_data['cc_emails']),
             body_html=reply_message_data['body_html'],
             body_plain=reply_message_data['body_plain'],
             received_at=timezone.now(),
@@ -235,6 +302,13 @@ def send_automated_reply(self, original_email_id, reply_subject, reply_body):
             references=reply_message_data['references'],
             is_read=True  # Our own sent emails are marked as read
         )
+        record_message_addresses(reply_email)
+        publish_event_on_commit(email_account.user_id, 'email.reply_sent', {
+            'email_id': original_email.id,
+            'reply_id': reply_email.id,
+            'subject': reply_email.subject,
+            'automated': True,
+        })
         
         # Update the processing log to mark reply as sent
         processing_log = EmailProcessingLog.objects.filter(
@@ -283,7 +357,7 @@ def send_automated_reply(self, original_email_id, reply_subject, reply_body):
         raise self.retry(exc=e, countdown=120, max_retries=2)
 
 @shared_task(bind=True)
-def bulk_process_emails_with_ai(self, user_id, email_account_ids=None, processing_type='analysis'):
+def bulk_process_emails_with_ai(self, user_id, email_account_ids=None, processing_type='analysis', mode='interactive'):
     """
     Bulk process multiple emails with AI for a specific user.
     
@@ -291,6 +365,8 @@ def bulk_process_emails_with_ai(self, user_id, email_account_ids=None, processin
         user_id: UUID of the user
         email_account_ids: List of email account IDs to process (optional, processes all if None)
         processing_type: 'analysis', 'reply_generation', or 'auto_reply'
+        mode: 'interactive' to process now, or 'batch' to submit the backlog to the
+            provider's batch API; poll_ai_batches ingests the results when ready
     """
     logger.info(f"🔄 Starting bulk AI processing task for user ID: {user_id}")
     
@@ -337,11 +413,21 @@ def bulk_process_emails_with_ai(self, user_id, email_account_ids=None, processin
         # Get unprocessed emails from these accounts
         unprocessed_emails = EmailMessage.objects.filter(
             email_account__in=email_accounts,
-            message_type='received'  # Only process received emails
+            message_type='received',  # Only process received emails
+            needs_ai=True  # Automated mail the ingest pre-filter skipped
         ).exclude(
             # Exclude already processed emails
             processing_logs__status='completed'
-        ).order_by('-received_at')[:50]  # Limit to 50 emails per batch
+        ).order_by('-received_at')
+        
+        if mode == 'batch':
+            return _submit_bulk_batch(user, unprocessed_emails, processing_type)
+        
+        blocked_for = unavailable_for(ai_processor.provider)
+        if blocked_for:
+            raise LLMUnavailable("AI provider paused", retry_after=blocked_for)
+        
+        unprocessed_emails = unprocessed_emails[:50]  # Limit to 50 emails per batch
         
         if not unprocessed_emails:
             logger.info(f"📭 No unprocessed emails found")
@@ -353,44 +439,31 @@ def bulk_process_emails_with_ai(self, user_id, email_account_ids=None, processin
         
         logger.info(f"📧 Found {len(unprocessed_emails)} unprocessed emails")
         
-        # Process emails in batches
-        results = []
+        # Process all emails concurrently on the AI engine
+        results = process_emails(ai_processor, unprocessed_emails, processing_type)
         processed_count = 0
         error_count = 0
+        deferred = [result for result in results if result.get('status') == 'deferred']
         
-        for email in unprocessed_emails:
-            try:
-                logger.info(f"🔄 Processing email {processed_count + 1}/{len(unprocessed_emails)}: {email.subject}")
+        for email, result in zip(unprocessed_emails, results):
+            if result.get('status') == 'deferred':
+                continue
+            if result.get('status') == 'success':
+                processed_count += 1
                 
-                # Process with AI
-                result = ai_processor.process_email_with_ai(email, processing_type)
-                results.append(result)
-                
-                if result.get('status') == 'success':
-                    processed_count += 1
+                # If this is auto_reply and we have a generated reply, queue send task
+                if (processing_type == 'auto_reply' and 
+                    ai_processor.is_auto_reply_enabled() and 
+                    'generated_reply' in result):
                     
-                    # If this is auto_reply and we have a generated reply, queue send task
-                    if (processing_type == 'auto_reply' and 
-                        ai_processor.is_auto_reply_enabled() and 
-                        'generated_reply' in result):
-                        
-                        send_automated_reply.delay(
-                            str(email.id),
-                            result['generated_reply']['subject'],
-                            result['generated_reply']['body']
-                        )
-                        logger.info(f"🚀 Queued automated reply for email: {email.subject}")
-                else:
-                    error_count += 1
-                
-            except Exception as e:
-                logger.error(f"❌ Error processing email {email.subject}: {str(e)}")
+                    send_automated_reply.delay(
+                        str(email.id),
+                        result['generated_reply']['subject'],
+                        result['generated_reply']['body']
+                    )
+                    logger.info(f"🚀 Queued automated reply for email: {email.subject}")
+            else:
                 error_count += 1
-                results.append({
-                    'status': 'error',
-                    'email_id': str(email.id),
-                    'error': str(e)
-                })
         
         summary = {
             'status': 'completed',
@@ -403,14 +476,90 @@ def bulk_process_emails_with_ai(self, user_id, email_account_ids=None, processin
         }
         
         logger.info(f"✅ Bulk processing completed: {processed_count} successful, {error_count} errors")
+        if deferred:
+            # The rest stay unprocessed and are picked up by the retry
+            raise LLMUnavailable(
+                f"{len(deferred)} emails deferred, AI provider unavailable",
+                retry_after=max(result['retry_after'] for result in deferred)
+            )
         return summary
         
     except Exception as e:
+        if isinstance(e, LLMUnavailable):
+            logger.warning(f"⏸️ AI provider unavailable, retrying bulk processing later: {str(e)}")
+            raise self.retry(exc=e, countdown=retry_countdown(e, self.request.retries),
+                             max_retries=settings.AI_UNAVAILABLE_MAX_RETRIES)
+        
         error_msg = f"Critical error in bulk processing task: {str(e)}"
         logger.error(f"❌ {error_msg}")
         
         # Retry the task in case of critical errors
-        raise self.retry(exc=e, countdown=300, max_retries=1)
+        raise self.retry(exc=e, countdown=retry_countdown(e, self.request.retries, base=300), max_retries=1)
+
+def _submit_bulk_batch(user, unprocessed_emails, processing_type):
+    """Submit unprocessed emails not already waiting in a batch as one offline batch"""
+    if not settings.AI_BATCH_API_KEY:
+        error_msg = "Batch mode is not configured (AI_BATCH_API_KEY is not set)"
+        logger.error(f"❌ {error_msg}")
+        return {'status': 'error', 'message': error_msg, 'user_id': str(user.id)}
+    
+    pending_ids = pending_batch_email_ids(user)
+    email_messages = list(unprocessed_emails.exclude(id__in=pending_ids)[:settings.AI_BATCH_MAX_EMAILS])
+    
+    if not email_messages:
+        logger.info(f"📭 No unprocessed emails outside pending batches")
+        return {
+            'status': 'no_emails',
+            'message': 'No unprocessed emails found',
+            'user_id': str(user.id)
+        }
+    
+    batch_job = submit_batch(user, email_messages, processing_type)
+    logger.info(f"📦 Submitted {len(email_messages)} emails to AI batch {batch_job.provider_batch_id}")
+    return {
+        'status': 'submitted',
+        'user_id': str(user.id),
+        'processing_type': processing_type,
+        'total_emails': len(email_messages),
+        'batch_job_id': str(batch_job.id),
+        'provider_batch_id': batch_job.provider_batch_id
+    }
+
+@shared_task
+def poll_ai_batches():
+    """
+    Check every offline AI batch still waiting on results and ingest the ended
+    ones. Runs periodically; auto-reply batches queue their replies here.
+    """
+    batch_jobs = AIBatchJob.objects.filter(ingested_at__isnull=True).select_related('user')
+    ingested_count = 0
+    
+    for batch_job in batch_jobs:
+        try:
+            outcome = poll_batch(batch_job)
+        except Exception as e:
+            logger.error(f"❌ Error polling AI batch {batch_job.provider_batch_id}: {str(e)}")
+            continue
+        if outcome is None:
+            continue
+        
+        ingested_count += 1
+        results, _ = outcome
+        if batch_job.processing_type == 'auto_reply':
+            ai_processor = AIEmailProcessor(user=batch_job.user)
+            if ai_processor.is_auto_reply_enabled():
+                for result in results:
+                    if 'generated_reply' in result:
+                        send_automated_reply.delay(
+                            result['email_id'],
+                            result['generated_reply']['subject'],
+                            result['generated_reply']['body']
+                        )
+    
+    return {
+        'status': 'success',
+        'ingested_batches': ingested_count
+    }
 
 @shared_task
 def cleanup_old_processing_logs():
@@ -477,11 +626,19 @@ def generate_ai_reply_for_email(email_message_id):
                 'email_id': str(email_message.id)
             }
         
-        result = ai_processor.process_email_with_ai(email_message, 'reply_generation')
+        result = process_email(ai_processor, email_message, 'reply_generation')
         
         logger.info(f"✅ AI reply generation completed for email: {email_message.subject}")
         return result
         
+    except LLMUnavailable as e:
+        logger.warning(f"⏸️ AI provider unavailable, reply not generated: {str(e)}")
+        return {
+            'status': 'unavailable',
+            'error': str(e),
+            'retry_after': round(e.retry_after),
+            'email_id': email_message_id
+        }
     except Exception as e:
         error_msg = f"Error generating AI reply: {str(e)}"
         logger.error(f"❌ {error_msg}")
@@ -3,7 +3,8 @@ from .views import (
     AISettingsView,
     ProcessEmailWithAIView,
     GetProcessingLogsView,
-    GenerateReplyView,
+    generate_reply,
+    stream_reply,
     BulkProcessEmailsView,
     EmailAnalysisView,
     AIProcessingStatsView
@@ -15,7 +16,8 @@ urlpatterns = [
     
     # Email Processing
     path('process-email/<uuid:email_id>/', ProcessEmailWithAIView.as_view(), name='process_email_with_ai'),
-    path('generate-reply/<uuid:email_id>/', GenerateReplyView.as_view(), name='generate_ai_reply'),
+    path('generate-reply/<uuid:email_id>/', generate_reply, name='generate_ai_reply'),
+    path('generate-reply/<uuid:email_id>/stream/', stream_reply, name='stream_ai_reply'),
     path('bulk-process/', BulkProcessEmailsView.as_view(), name='bulk_process_emails'),
     
     # Analysis and Logs
@@ -1,20 +1,47 @@
 from django.shortcuts import render
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
+from Accounts.authentication import async_auth_required
+from email_automation_backend.caching import conditional_get
+from email_automation_backend.db_router import read_from_replica
+from email_automation_backend.events import sse_frame
+from email_automation_backend.fieldsets import requested_fields
 import logging
 import json
+from contextlib import aclosing
 
 from .models import AIProcessingSettings, EmailProcessingLog
+from .serializers import serialize_processing_logs, PROCESSING_LOG_API_FIELDS
 from User.models import EmailMessage
 from .tasks import process_new_email_with_ai, generate_ai_reply_for_email, bulk_process_emails_with_ai
 from .ai_service import AIEmailProcessor
+from .llm_limits import LLMUnavailable
+from .stats import get_processing_stats
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+
+def _ai_settings_etag(request, *args, **kwargs):
+    """Validator for the user's AI settings, from their updated_at"""
+    updated_at = AIProcessingSettings.objects.filter(
+        user=request.user
+    ).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return f'{request.user.pk}-{updated_at.timestamp()}'
+
+
+@method_decorator(conditional_get(_ai_settings_etag), name='get')
 class AISettingsView(APIView):
     """Get and update AI processing settings for the authenticated user"""
     permission_classes = [IsAuthenticated]
@@ -175,10 +202,15 @@ class ProcessEmailWithAIView(APIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             # Trigger AI processing task
+            # The user is waiting on it, so it goes ahead of newly fetched mail
             if processing_type == 'reply_generation':
-                task = generate_ai_reply_for_email.delay(str(email_message.id))
+                task = generate_ai_reply_for_email.apply_async(
+                    (str(email_message.id),), priority=settings.TASK_PRIORITY_HIGH
+                )
             else:
-                task = process_new_email_with_ai.delay(str(email_message.id))
+                task = process_new_email_with_ai.apply_async(
+                    (str(email_message.id),), {'force': True}, priority=settings.TASK_PRIORITY_HIGH
+                )
             
             logger.info(f"🤖 Queued AI processing task {task.id} for email {email_message.subject}")
             
@@ -196,6 +228,7 @@ class ProcessEmailWithAIView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(read_from_replica, name='get')
 class GetProcessingLogsView(APIView):
     """Get AI processing logs for the user's emails"""
     permission_classes = [IsAuthenticated]
@@ -207,11 +240,12 @@ class GetProcessingLogsView(APIView):
             offset = int(request.GET.get('offset', 0))
             email_id = request.GET.get('email_id')
             processing_type = request.GET.get('processing_type')
+            fields = requested_fields(request, PROCESSING_LOG_API_FIELDS)
             
             # Build query
             logs_query = EmailProcessingLog.objects.filter(
                 email_message__email_account__user=request.user
-            ).select_related('email_message', 'email_message__email_account')
+            )
             
             # Apply filters
             if email_id:
@@ -224,29 +258,9 @@ class GetProcessingLogsView(APIView):
             total_count = logs_query.count()
             
             # Apply pagination
-            logs = logs_query.order_by('-created_at')[offset:offset + limit]
-            
-            # Format response
-            logs_data = []
-            for log in logs:
-                logs_data.append({
-                    'id': log.id,
-                    'email_subject': log.email_message.subject,
-                    'email_sender': log.email_message.sender,
-                    'processing_type': log.processing_type,
-                    'status': log.status,
-                    'ai_summary': log.ai_summary,
-                    'ai_sentiment': log.ai_sentiment,
-                    'ai_category': log.ai_category,
-                    'ai_priority': log.ai_priority,
-                    'generated_reply_subject': log.generated_reply_subject,
-                    'reply_sent': log.reply_sent,
-                    'reply_sent_at': log.reply_sent_at.isoformat() if log.reply_sent_at else None,
-                    'processing_duration': log.processing_duration,
-                    'tokens_used': log.tokens_used,
-                    'error_message': log.error_message,
-                    'created_at': log.created_at.isoformat()
-                })
+            logs_data = serialize_processing_logs(
+                logs_query.order_by('-created_at')[offset:offset + limit], fields
+            )
             
             return Response({
                 'logs': logs_data,
@@ -262,51 +276,105 @@ class GetProcessingLogsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class GenerateReplyView(APIView):
-    """Generate an AI reply for an email without sending it"""
-    permission_classes = [IsAuthenticated]
-    
-    def post(self, request, email_id):
+@csrf_exempt
+@require_POST
+@async_auth_required
+async def generate_reply(request, email_id):
+    """
+    Generate an AI reply for an email without sending it.
+    Async so a worker is not held while the model answers.
+    """
+    try:
+        # Get the email
         try:
-            # Get the email
-            try:
-                email_message = EmailMessage.objects.select_related('email_account').get(
-                    id=email_id,
-                    email_account__user=request.user
-                )
-            except EmailMessage.DoesNotExist:
-                return Response({
-                    'message': 'Email not found'
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Check if AI processing is enabled
-            ai_processor = AIEmailProcessor(user=request.user)
-            if not ai_processor.is_processing_enabled():
-                return Response({
-                    'message': 'AI processing is disabled for your account'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Generate reply using AI processor
-            result = ai_processor.process_email_with_ai(email_message, 'reply_generation')
-            
-            if result.get('status') == 'success':
-                return Response({
-                    'message': 'AI reply generated successfully',
-                    'email_id': email_id,
-                    'analysis': result.get('analysis', {}),
-                    'generated_reply': result.get('generated_reply', {})
-                })
-            else:
-                return Response({
-                    'message': f'Failed to generate AI reply: {result.get("error", "Unknown error")}',
-                    'error': result.get('error')
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-        except Exception as e:
-            logger.error(f"Error in generate reply view: {str(e)}")
-            return Response({
-                'message': f'Failed to generate AI reply: {str(e)}'
+            email_message = await EmailMessage.objects.select_related('email_account').aget(
+                id=email_id,
+                email_account__user=request.user
+            )
+        except EmailMessage.DoesNotExist:
+            return JsonResponse({
+                'message': 'Email not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # Check if AI processing is enabled
+        ai_processor = await sync_to_async(AIEmailProcessor)(user=request.user)
+        if not ai_processor.is_processing_enabled():
+            return JsonResponse({
+                'message': 'AI processing is disabled for your account'
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Generate reply using AI processor
+        result = await ai_processor.aprocess_email_with_ai(email_message, 'reply_generation')
+        
+        if result.get('status') == 'success':
+            return JsonResponse({
+                'message': 'AI reply generated successfully',
+                'email_id': email_id,
+                'analysis': result.get('analysis', {}),
+                'generated_reply': result.get('generated_reply', {})
+            }, encoder=DjangoJSONEncoder)
+        else:
+            return JsonResponse({
+                'message': f'Failed to generate AI reply: {result.get("error", "Unknown error")}',
+                'error': result.get('error')
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+    except LLMUnavailable as e:
+        response = JsonResponse({
+            'message': 'The AI provider is busy or unavailable, please try again shortly',
+            'retry_after': round(e.retry_after)
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(max(1, round(e.retry_after)))
+        return response
+    except Exception as e:
+        logger.error(f"Error in generate reply view: {str(e)}")
+        return JsonResponse({
+            'message': f'Failed to generate AI reply: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_POST
+@async_auth_required
+async def stream_reply(request, email_id):
+    """
+    Stream an AI reply draft as server-sent events while the model writes it:
+    "start", "delta" events carrying text, then "done" with the saved draft or
+    "error". Read it with fetch(); EventSource cannot send POST requests.
+    """
+    try:
+        try:
+            email_message = await EmailMessage.objects.select_related('email_account').aget(
+                id=email_id,
+                email_account__user=request.user
+            )
+        except EmailMessage.DoesNotExist:
+            return JsonResponse({
+                'message': 'Email not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        ai_processor = await sync_to_async(AIEmailProcessor)(user=request.user)
+        if not ai_processor.is_processing_enabled():
+            return JsonResponse({
+                'message': 'AI processing is disabled for your account'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        async def events():
+            # aclosing: a client disconnect closes the reply stream right away, not on garbage collection
+            async with aclosing(ai_processor.astream_reply(email_message)) as reply_events:
+                async for event_type, data in reply_events:
+                    yield sse_frame(event_type, data)
+        
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in stream reply view: {str(e)}")
+        return JsonResponse({
+            'message': f'Failed to generate AI reply: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
 
 
 class BulkProcessEmailsView(APIView):
@@ -318,12 +386,23 @@ class BulkProcessEmailsView(APIView):
             # Get parameters
             processing_type = request.data.get('processing_type', 'analysis')
             email_account_ids = request.data.get('email_account_ids')  # Optional list
+            mode = request.data.get('mode', 'interactive')  # 'batch' for non-urgent backlogs
             
             if processing_type not in ['analysis', 'reply_generation', 'auto_reply']:
                 return Response({
                     'message': 'Invalid processing type. Use "analysis", "reply_generation", or "auto_reply"'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            if mode not in ['interactive', 'batch']:
+                return Response({
+                    'message': 'Invalid mode. Use "interactive" or "batch"'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            if mode == 'batch' and not settings.AI_BATCH_API_KEY:
+                return Response({
+                    'message': 'Batch mode is not configured (AI_BATCH_API_KEY is not set)'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
             # Check if AI processing is enabled
             ai_processor = AIEmailProcessor(user=request.user)
             if not ai_processor.is_processing_enabled():
@@ -335,7 +414,8 @@ class BulkProcessEmailsView(APIView):
             task = bulk_process_emails_with_ai.delay(
                 str(request.user.id),
                 email_account_ids,
-                processing_type
+                processing_type,
+                mode
             )
             
             logger.info(f"🔄 Queued bulk AI processing task {task.id} for user {request.user.get_full_name()}")
@@ -344,6 +424,7 @@ class BulkProcessEmailsView(APIView):
                 'message': f'Bulk AI processing queued successfully',
                 'task_id': task.id,
                 'processing_type': processing_type,
+                'mode': mode,
                 'email_account_ids': email_account_ids
             })
             
@@ -354,6 +435,7 @@ class BulkProcessEmailsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(read_from_replica, name='get')
 class EmailAnalysisView(APIView):
     """Get AI analysis for a specific email"""
     permission_classes = [IsAuthenticated]
@@ -400,6 +482,8 @@ class EmailAnalysisView(APIView):
                     'reply_sent_at': processing_log.reply_sent_at.isoformat() if processing_log.reply_sent_at else None,
                     'processing_duration': processing_log.processing_duration,
                     'tokens_used': processing_log.tokens_used,
+                    'cache_hit': processing_log.cache_hit,
+                    'tokens_saved': processing_log.tokens_saved,
                     'error_message': processing_log.error_message,
                     'created_at': processing_log.created_at.isoformat()
                 }
@@ -412,64 +496,16 @@ class EmailAnalysisView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(read_from_replica, name='get')
 class AIProcessingStatsView(APIView):
     """Get AI processing statistics for the user"""
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         try:
-            from datetime import timedelta
-            from django.db.models import Count, Avg
-            
-            # Get time range (default to last 30 days)
+            # Get time range (default to last 30 days); read from the daily rollups
             days = int(request.GET.get('days', 30))
-            since_date = timezone.now() - timedelta(days=days)
-            
-            # Get processing logs for user's emails
-            logs_query = EmailProcessingLog.objects.filter(
-                email_message__email_account__user=request.user,
-                created_at__gte=since_date
-            )
-            
-            # Calculate statistics
-            total_processed = logs_query.count()
-            
-            status_stats = logs_query.values('status').annotate(
-                count=Count('status')
-            )
-            
-            processing_type_stats = logs_query.values('processing_type').annotate(
-                count=Count('processing_type')
-            )
-            
-            sentiment_stats = logs_query.exclude(
-                ai_sentiment__isnull=True
-            ).exclude(
-                ai_sentiment=''
-            ).values('ai_sentiment').annotate(
-                count=Count('ai_sentiment')
-            )
-            
-            replies_sent = logs_query.filter(reply_sent=True).count()
-            
-            avg_processing_time = logs_query.filter(
-                processing_duration__isnull=False
-            ).aggregate(avg_time=Avg('processing_duration'))['avg_time']
-            
-            total_tokens = logs_query.filter(
-                tokens_used__isnull=False
-            ).aggregate(total=Count('tokens_used'))['total'] or 0
-            
-            return Response({
-                'period_days': days,
-                'total_processed': total_processed,
-                'replies_sent': replies_sent,
-                'average_processing_time': round(avg_processing_time, 2) if avg_processing_time else 0,
-                'total_tokens_used': total_tokens,
-                'status_breakdown': list(status_stats),
-                'processing_type_breakdown': list(processing_type_stats),
-                'sentiment_breakdown': list(sentiment_stats)
-            })
+            return Response(get_processing_stats(request.user, days))
             
         except Exception as e:
             logger.error(f"Error getting processing stats: {str(e)}")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'User'
+    
+    def ready(self):
+        # Keep mailbox versions in step with account and message changes
+        from . import signals  # noqa: F401
@@ -0,0 +1,107 @@
+import base64
+import os
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from email_automation_backend.http import get_async_client
+
+GOOGLE_TOKEN_URL = 'https://oauth2.googleapis.com/token'
+GMAIL_API_URL = 'https://gmail.googleapis.com/gmail/v1/users/me'
+
+
+class GmailAPIError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def build_raw_message(from_email, to_emails, subject, body_html, body_plain=None, cc_emails=None,
+                      bcc_emails=None, in_reply_to=None, references=None):
+    """Build a MIME message and encode it the way the Gmail send endpoint expects"""
+    message = MIMEMultipart('alternative')
+    message['From'] = from_email
+    message['Subject'] = subject
+    message['To'] = ', '.join(to_emails) if isinstance(to_emails, list) else to_emails
+
+    if cc_emails and len(cc_emails) > 0:
+        message['Cc'] = ', '.join(cc_emails) if isinstance(cc_emails, list) else cc_emails
+    if bcc_emails and len(bcc_emails) > 0:
+        message['Bcc'] = ', '.join(bcc_emails) if isinstance(bcc_emails, list) else bcc_emails
+
+    # Add threading headers for replies
+    if in_reply_to:
+        message['In-Reply-To'] = in_reply_to
+    if references:
+        message['References'] = references
+
+    if body_plain:
+        message.attach(MIMEText(body_plain, 'plain', 'utf-8'))
+    if body_html:
+        message.attach(MIMEText(body_html, 'html', 'utf-8'))
+
+    return base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+
+
+async def exchange_code_for_tokens(code, redirect_uri):
+    """Exchange an OAuth authorization code for Google tokens"""
+    response = await get_async_client().post(GOOGLE_TOKEN_URL, data={
+        'client_id': os.environ.get('GOOGLE_CLIENT_ID'),
+        'client_secret': os.environ.get('GOOGLE_CLIENT_SECRET'),
+        'code': code,
+        'grant_type': 'authorization_code',
+        'redirect_uri': redirect_uri
+    })
+    if response.status_code != 200:
+        raise GmailAPIError('Failed to exchange code for tokens', response.status_code)
+    return response.json()
+
+
+async def refresh_access_token(refresh_token):
+    """Get a new Google access token from a refresh token"""
+    response = await get_async_client().post(GOOGLE_TOKEN_URL, data={
+        'client_id': os.environ.get('GOOGLE_CLIENT_ID'),
+        'client_secret': os.environ.get('GOOGLE_CLIENT_SECRET'),
+        'refresh_token': refresh_token,
+        'grant_type': 'refresh_token'
+    })
+    if response.status_code != 200:
+        raise GmailAPIError('Failed to refresh Gmail access token', response.status_code)
+    return response.json()['access_token']
+
+
+async def get_profile(access_token):
+    """Gmail profile (emailAddress, messagesTotal, ...) of the token's mailbox"""
+    response = await get_async_client().get(
+        f'{GMAIL_API_URL}/profile',
+        headers={'Authorization': f'Bearer {access_token}'}
+    )
+    if response.status_code != 200:
+        raise GmailAPIError('Failed to get Gmail profile', response.status_code)
+    return response.json()
+
+
+async def send_message(email_account, raw_message, thread_id=None):
+    """
+    Send a raw message from an email account. An expired access token is
+    refreshed once and stored on the account before retrying.
+    """
+    body = {'raw': raw_message}
+    if thread_id:
+        body['threadId'] = thread_id
+
+    client = get_async_client()
+    for attempt in range(2):
+        response = await client.post(
+            f'{GMAIL_API_URL}/messages/send',
+            json=body,
+            headers={'Authorization': f'Bearer {email_account.access_token}'}
+        )
+        if response.status_code == 401 and attempt == 0 and email_account.refresh_token:
+            email_account.access_token = await refresh_access_token(email_account.refresh_token)
+            await email_account.asave(update_fields=['access_token', 'updated_at'])
+            continue
+        break
+
+    if response.status_code != 200:
+        raise GmailAPIError(f'Gmail send failed: {response.text}', response.status_code)
+    return response.json()
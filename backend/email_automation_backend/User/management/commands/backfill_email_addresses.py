@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from User.models import EmailMessage, EmailMessageAddress
+from User.utils import record_message_addresses
+
+
+class Command(BaseCommand):
+    help = 'Record sender/recipient addresses for messages stored before the address table existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Messages loaded per batch')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        pending = EmailMessage.objects.filter(
+            ~Exists(EmailMessageAddress.objects.filter(email_message=OuterRef('pk')))
+        ).only('id', 'sender', 'recipients', 'cc', 'bcc', 'received_at').order_by('pk')
+
+        messages_done = 0
+        links_created = 0
+        last_pk = None
+        while True:
+            batch_query = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+            batch = list(batch_query[:batch_size])
+            if not batch:
+                break
+            for email_message in batch:
+                links_created += record_message_addresses(email_message)
+            messages_done += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'Processed {messages_done} messages')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {messages_done} messages with {links_created} address links'
+        ))
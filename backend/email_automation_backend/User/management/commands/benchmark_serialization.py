@@ -0,0 +1,114 @@
+import json
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from Accounts.models import User
+from email_automation_backend.renderers import FastJSONRenderer
+from User.models import EmailAccount, EmailMessage
+from User.serializers import serialize_email_list
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark inbox list serialization (model instances vs values() + fast renderer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[50, 500, 5000],
+                            help='Page sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per page size; the best run is reported')
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        repeat = max(1, options['repeat'])
+
+        # Synthetic data lives only inside this transaction and is rolled back
+        try:
+            with transaction.atomic():
+                account = self._create_fixture(max(sizes))
+                self.stdout.write(f"{'rows':>6}  {'legacy ms':>10}  {'fast ms':>9}  {'legacy us/row':>13}  {'fast us/row':>11}  {'speedup':>7}")
+                for size in sizes:
+                    legacy = self._best_of(repeat, self._legacy_page, account, size)
+                    fast = self._best_of(repeat, self._fast_page, account, size)
+                    self.stdout.write(
+                        f"{size:>6}  {legacy * 1000:>10.2f}  {fast * 1000:>9.2f}  "
+                        f"{legacy * 1e6 / size:>13.1f}  {fast * 1e6 / size:>11.1f}  {legacy / fast:>6.1f}x"
+                    )
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_fixture(self, count):
+        user = User.objects.create_user(
+            username=f'benchmark-{uuid.uuid4().hex[:8]}',
+            email=f'benchmark-{uuid.uuid4().hex[:8]}@example.com',
+            password=uuid.uuid4().hex
+        )
+        account = EmailAccount.objects.create(user=user, email_address=user.email)
+        now = timezone.now()
+        EmailMessage.objects.bulk_create([
+            EmailMessage(
+                email_account=account,
+                gmail_message_id=f'bench-{i}',
+                gmail_thread_id=f'thread-{i // 3}',
+                subject=f'Benchmark message {i}',
+                sender=f'Sender {i} <sender{i}@example.com>',
+                recipients=json.dumps([user.email, f'team{i % 7}@example.com']),
+                cc=json.dumps([f'cc{i % 5}@example.com']) if i % 2 else '',
+                body_plain='Lorem ipsum dolor sit amet. ' * 40,
+                received_at=now - timedelta(minutes=i),
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        return account
+
+    def _best_of(self, repeat, func, account, size):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(account, size)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def _legacy_page(self, account, size):
+        """The previous GetEmailsView path: model instances, per-row json.loads, stock renderer"""
+        emails = EmailMessage.objects.filter(email_account=account).select_related(
+            'email_account'
+        ).order_by('-received_at')[:size]
+        data = [
+            {
+                'id': email.id,
+                'subject': email.subject,
+                'sender': email.sender,
+                'recipients': json.loads(email.recipients) if email.recipients else [],
+                'cc': json.loads(email.cc) if email.cc else [],
+                'received_at': email.received_at.isoformat(),
+                'is_read': email.is_read,
+                'is_starred': email.is_starred,
+                'has_attachments': email.has_attachments,
+                'email_account': {
+                    'id': email.email_account.id,
+                    'email_address': email.email_account.email_address,
+                    'provider': email.email_account.provider
+                }
+            }
+            for email in emails
+        ]
+        return JSONRenderer().render({'emails': data})
+
+    def _fast_page(self, account, size):
+        """The current path: values() projection and the fast renderer"""
+        data = serialize_email_list(
+            EmailMessage.objects.filter(email_account=account).order_by('-received_at')[:size]
+        )
+        return FastJSONRenderer().render({'emails': data})
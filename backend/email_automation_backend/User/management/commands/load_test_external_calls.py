@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+from django.core.management.base import BaseCommand
+
+
+class _UpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 would make the stand-in server the bottleneck
+    request_queue_size = 1024
+
+
+def _slow_handler(latency):
+    class SlowUpstreamHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SlowUpstreamHandler
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test outbound calls the way the views make them: blocking requests calls '
+        'on a fixed pool of worker threads vs. httpx calls awaited on one event loop. '
+        'A local server stands in for Gmail/HubSpot/OpenRouter with a fixed latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Calls made per run')
+        parser.add_argument('--latency-ms', type=int, default=200,
+                            help='Simulated upstream latency per call')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Sync worker threads (gunicorn workers x threads)')
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[10, 50, 200],
+                            help='Concurrent in-flight calls for the async client')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        latency = options['latency_ms'] / 1000
+
+        server = _UpstreamServer(('127.0.0.1', 0), _slow_handler(latency))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/'
+
+        try:
+            self.stdout.write(f"{total} calls, {options['latency_ms']} ms upstream latency")
+            self.stdout.write(f"{'mode':<22}  {'wall s':>7}  {'calls/s':>8}")
+
+            sync_time = self._run_sync(url, total, options['workers'])
+            self._report(f"sync x{options['workers']} threads", total, sync_time)
+
+            for concurrency in options['concurrency']:
+                async_time = asyncio.run(self._run_async(url, total, concurrency))
+                self._report(f'async x{concurrency} in flight', total, async_time)
+                self.stdout.write(f"{'':<22}  {sync_time / async_time:>6.1f}x faster than sync")
+        finally:
+            server.shutdown()
+
+    def _report(self, label, total, elapsed):
+        self.stdout.write(f'{label:<22}  {elapsed:>7.2f}  {total / elapsed:>8.1f}')
+
+    def _run_sync(self, url, total, workers):
+        local = threading.local()
+
+        def call(_):
+            # One keep-alive session per worker thread, like a worker's requests pool
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            return local.session.get(url, timeout=30).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            statuses = list(pool.map(call, range(total)))
+        elapsed = time.perf_counter() - start
+        self._check(statuses)
+        return elapsed
+
+    async def _run_async(self, url, total, concurrency):
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def call():
+                async with semaphore:
+                    response = await client.get(url)
+                    return response.status_code
+
+            start = time.perf_counter()
+            statuses = await asyncio.gather(*(call() for _ in range(total)))
+            elapsed = time.perf_counter() - start
+        self._check(statuses)
+        return elapsed
+
+    def _check(self, statuses):
+        failed = sum(1 for code in statuses if code != 200)
+        if failed:
+            self.stderr.write(f'{failed} calls failed')
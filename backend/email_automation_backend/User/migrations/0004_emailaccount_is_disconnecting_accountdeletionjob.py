@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:12
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0003_add_has_ai_reply_field'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailaccount',
+            name='is_disconnecting',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='AccountDeletionJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('email_account_id', models.UUIDField()),
+                ('email_address', models.EmailField(max_length=254)),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('emails_total', models.IntegerField(default=0)),
+                ('emails_removed', models.IntegerField(default=0)),
+                ('fetch_logs_removed', models.IntegerField(default=0)),
+                ('processing_logs_removed', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='account_deletion_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['email_account_id'], name='User_accoun_email_a_b3d6b4_idx'), models.Index(fields=['status', 'updated_at'], name='User_accoun_status_4a7a7c_idx')],
+            },
+        ),
+    ]
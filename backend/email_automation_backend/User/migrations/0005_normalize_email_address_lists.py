@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:05
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def normalize_address_lists(apps, schema_editor):
+    """Convert raw To/Cc header strings stored by older ingests into JSON address lists"""
+    from User.utils import dump_address_list
+
+    EmailMessage = apps.get_model('User', 'EmailMessage')
+    batch = []
+    rows = (
+        EmailMessage.objects.only('id', 'recipients', 'cc')
+        .filter(
+            (Q(recipients__gt='') & ~Q(recipients__startswith='['))
+            | (Q(cc__gt='') & ~Q(cc__startswith='['))
+        )
+        .iterator(chunk_size=1000)
+    )
+    for message in rows:
+        if message.recipients and not message.recipients.startswith('['):
+            message.recipients = dump_address_list(message.recipients)
+        if message.cc and not message.cc.startswith('['):
+            message.cc = dump_address_list(message.cc)
+        batch.append(message)
+        if len(batch) >= 1000:
+            EmailMessage.objects.bulk_update(batch, ['recipients', 'cc'])
+            batch = []
+    if batch:
+        EmailMessage.objects.bulk_update(batch, ['recipients', 'cc'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0004_emailaccount_is_disconnecting_accountdeletionjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_address_lists, migrations.RunPython.noop),
+    ]
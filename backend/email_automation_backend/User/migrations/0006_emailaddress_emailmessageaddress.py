@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:20
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0005_normalize_email_address_lists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailAddress',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('display_name', models.CharField(blank=True, max_length=255)),
+                ('domain', models.CharField(db_index=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmailMessageAddress',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('from', 'From'), ('to', 'To'), ('cc', 'Cc'), ('bcc', 'Bcc')], max_length=4)),
+                ('display_name', models.CharField(blank=True, max_length=255)),
+                ('received_at', models.DateTimeField()),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_links', to='User.emailaddress')),
+                ('email_message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='address_links', to='User.emailmessage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['address', 'role', '-received_at'], name='User_emailm_address_c095a8_idx'), models.Index(fields=['address', '-received_at'], name='User_emailm_address_b7918c_idx')],
+                'unique_together': {('email_message', 'address', 'role')},
+            },
+        ),
+    ]
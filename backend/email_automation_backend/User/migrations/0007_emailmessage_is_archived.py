@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0006_emailaddress_emailmessageaddress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='is_archived',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0007_emailmessage_is_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='automated_category',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='automated_reason',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='needs_ai',
+            field=models.BooleanField(default=True),
+        ),
+    ]
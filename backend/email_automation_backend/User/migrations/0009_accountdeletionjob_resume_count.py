@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('User', '0008_emailmessage_prefilter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountdeletionjob',
+            name='resume_count',
+            field=models.IntegerField(default=0, help_text='Times the job was resumed after it failed'),
+        ),
+    ]
@@ -23,6 +23,7 @@ class EmailAccount(models.Model):
     # Settings
     is_primary = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    is_disconnecting = models.BooleanField(default=False)  # Data is being removed in the background
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -65,9 +66,16 @@ class EmailMessage(models.Model):
     importance = models.CharField(max_length=10, default='normal')
     is_read = models.BooleanField(default=False)
     is_starred = models.BooleanField(default=False)
+    is_archived = models.BooleanField(default=False)  # Removed from the Gmail inbox
     has_attachments = models.BooleanField(default=False)
     has_ai_reply = models.BooleanField(default=False)  # Whether this email has been replied to by AI
     
+    # Ingest pre-filter (see prefilter.py): automated mail category, the rule that
+    # matched, and whether the email is sent for AI processing at all
+    automated_category = models.CharField(max_length=20, blank=True)
+    automated_reason = models.CharField(max_length=255, blank=True)
+    needs_ai = models.BooleanField(default=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -81,6 +89,46 @@ class EmailMessage(models.Model):
         ]
 
 
+class EmailAddress(models.Model):
+    """Normalized email address seen in message headers"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    email = models.EmailField(unique=True)  # Stored lowercased
+    display_name = models.CharField(max_length=255, blank=True)
+    domain = models.CharField(max_length=255, db_index=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class EmailMessageAddress(models.Model):
+    """Link between a message and an address in one of its headers"""
+    
+    ROLE_CHOICES = [
+        ('from', 'From'),
+        ('to', 'To'),
+        ('cc', 'Cc'),
+        ('bcc', 'Bcc'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    email_message = models.ForeignKey(EmailMessage, on_delete=models.CASCADE, related_name='address_links')
+    address = models.ForeignKey(EmailAddress, on_delete=models.CASCADE, related_name='message_links')
+    role = models.CharField(max_length=4, choices=ROLE_CHOICES)
+    display_name = models.CharField(max_length=255, blank=True)  # Name as written on this message
+    
+    # Copied from the message so contact timelines can be read from one index
+    received_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['email_message', 'address', 'role']
+        indexes = [
+            models.Index(fields=['address', 'role', '-received_at']),
+            models.Index(fields=['address', '-received_at']),
+        ]
+
+
 class EmailFetchLog(models.Model):
     """Log of email fetching operations"""
     
@@ -110,3 +158,37 @@ class EmailFetchLog(models.Model):
             models.Index(fields=['email_account', '-created_at']),
             models.Index(fields=['fetch_type', 'status']),
         ]
+
+
+class AccountDeletionJob(models.Model):
+    """Background removal of a disconnected email account and all of its data"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='account_deletion_jobs')
+    
+    # The account row is deleted at the end of the job, so keep a plain copy of its identity
+    email_account_id = models.UUIDField()
+    email_address = models.EmailField()
+    
+    # Progress
+    status = models.CharField(max_length=20, default='pending')
+    emails_total = models.IntegerField(default=0)
+    emails_removed = models.IntegerField(default=0)
+    fetch_logs_removed = models.IntegerField(default=0)
+    processing_logs_removed = models.IntegerField(default=0)
+    
+    # Error handling
+    error_message = models.TextField(blank=True)
+    resume_count = models.IntegerField(default=0, help_text="Times the job was resumed after it failed")
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['email_account_id']),
+            models.Index(fields=['status', 'updated_at']),
+        ]
@@ -0,0 +1,85 @@
+import re
+from email.utils import parseaddr
+
+# Rule-based classification of automated mail, run at ingest from headers and
+# the sender before any LLM sees the message. Mail in a category listed in
+# AI_PREFILTER_SKIP_CATEGORIES is stored with needs_ai=False and never queued
+# for AI processing; mail in any category is never auto-replied to (RFC 3834),
+# which is what keeps auto-replies from looping with other responders.
+
+# Headers kept from a fetched message for classify_automated_mail (lowercased names)
+PREFILTER_HEADERS = (
+    'auto-submitted', 'precedence', 'list-id', 'list-unsubscribe', 'x-autoreply',
+    'x-autorespond', 'x-failed-recipients', 'return-path',
+)
+
+AUTOMATED_CATEGORIES = ('bounce', 'auto_reply', 'calendar', 'mailing_list', 'no_reply')
+
+_BOUNCE_SENDER = re.compile(r'^(mailer-daemon|postmaster)@', re.IGNORECASE)
+_BOUNCE_SUBJECT = re.compile(
+    r'^(undeliver(ed|able)|delivery status notification|mail delivery (failed|subsystem)|returned mail|failure notice)',
+    re.IGNORECASE
+)
+_AUTO_REPLY_SUBJECT = re.compile(r'^(auto(matic)?[ -]?reply|out of (the )?office|autoresponse)\b', re.IGNORECASE)
+_CALENDAR_SUBJECT = re.compile(
+    r'^(invitation|updated invitation|canceled event|cancelled event|accepted|declined|tentatively accepted'
+    r'|new event|event canceled|event cancelled)( with note)?:',
+    re.IGNORECASE
+)
+_CALENDAR_SENDER = re.compile(r'^calendar-notification@google\.com$', re.IGNORECASE)
+_NO_REPLY_LOCAL_PART = re.compile(
+    r'^(no-?reply|do-?not-?reply|donotreply|notifications?|notify|alerts?|mailer|bounces?|automated|system)([-+._].*)?$',
+    re.IGNORECASE
+)
+
+
+def classify_automated_mail(sender, subject, headers=None, mime_types=()):
+    """
+    (category, reason) for automated mail, or ('', '') for mail written by a person.
+    headers maps lowercased names from PREFILTER_HEADERS to values; mime_types
+    are the MIME types of the message's parts.
+    """
+    headers = headers or {}
+    subject = (subject or '').strip()
+    address = parseaddr(sender or '')[1].lower()
+    auto_submitted = headers.get('auto-submitted', '').strip().lower()
+    precedence = headers.get('precedence', '').strip().lower()
+
+    if 'multipart/report' in mime_types or headers.get('x-failed-recipients'):
+        return 'bounce', 'delivery report'
+    if _BOUNCE_SENDER.match(address):
+        return 'bounce', f'sender {address}'
+    if headers.get('return-path', '').strip() == '<>' and _BOUNCE_SUBJECT.match(subject):
+        return 'bounce', 'null return path'
+
+    if auto_submitted.startswith('auto-replied'):
+        return 'auto_reply', f'Auto-Submitted: {auto_submitted}'
+    if headers.get('x-autoreply') or headers.get('x-autorespond') or precedence == 'auto_reply':
+        return 'auto_reply', 'auto-responder header'
+    if _AUTO_REPLY_SUBJECT.match(subject):
+        return 'auto_reply', 'auto-reply subject'
+
+    if 'text/calendar' in mime_types or _CALENDAR_SENDER.match(address):
+        return 'calendar', 'calendar invitation'
+    if _CALENDAR_SUBJECT.match(subject) and auto_submitted:
+        return 'calendar', 'calendar notification'
+
+    if headers.get('list-id') or headers.get('list-unsubscribe'):
+        return 'mailing_list', 'List-Id' if headers.get('list-id') else 'List-Unsubscribe'
+    if precedence in ('list', 'bulk', 'junk'):
+        return 'mailing_list', f'Precedence: {precedence}'
+
+    if auto_submitted and auto_submitted != 'no':
+        return 'no_reply', f'Auto-Submitted: {auto_submitted}'
+    if _NO_REPLY_LOCAL_PART.match(address.split('@')[0]):
+        return 'no_reply', f'sender {address}'
+
+    return '', ''
+
+
+def message_mime_types(payload):
+    """MIME types of a Gmail message payload and all its nested parts"""
+    mime_types = {payload.get('mimeType', '')}
+    for part in payload.get('parts') or []:
+        mime_types |= message_mime_types(part)
+    return mime_types
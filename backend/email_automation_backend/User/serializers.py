@@ -1,5 +1,10 @@
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import Left, Length
 from rest_framework import serializers
+
+from email_automation_backend.fieldsets import select_value_fields
 from .models import EmailAccount
+from .utils import load_address_list, split_quoted_history
 
 
 class EmailAccountSerializer(serializers.ModelSerializer):
@@ -10,3 +15,186 @@ class EmailAccountSerializer(serializers.ModelSerializer):
             'is_primary', 'is_active', 'created_at'
         ]
         read_only_fields = ['id', 'created_at']
+
+
+# Lightweight serializers for list endpoints. They read values() projections
+# instead of model instances, so a page of rows never goes through model
+# construction or per-field serializer machinery.
+
+EMAIL_ACCOUNT_VALUE_FIELDS = (
+    'email_account_id', 'email_account__email_address', 'email_account__provider'
+)
+
+EMAIL_LIST_FIELDS = (
+    'id', 'subject', 'sender', 'recipients', 'cc', 'received_at',
+    'is_read', 'is_starred', 'is_archived', 'has_attachments', 'automated_category',
+) + EMAIL_ACCOUNT_VALUE_FIELDS
+
+EMAIL_CONTENT_FIELDS = EMAIL_LIST_FIELDS + (
+    'body_html', 'body_plain', 'gmail_message_id', 'gmail_thread_id', 'importance',
+)
+
+THREAD_MESSAGE_FIELDS = (
+    'id', 'subject', 'sender', 'recipients', 'cc', 'received_at', 'message_type',
+    'is_read', 'is_starred', 'has_attachments', 'parent_email_id',
+)
+
+EMAIL_CONVERSATION_FIELDS = (
+    'id', 'subject', 'sender', 'recipients', 'cc', 'received_at',
+    'message_type', 'is_read', 'body_html', 'body_plain', 'parent_email_id',
+)
+
+
+# API fields built from other columns, and the columns they need
+EMAIL_FIELD_SOURCES = {
+    'email_account': EMAIL_ACCOUNT_VALUE_FIELDS,
+    'content': ('body_html', 'body_plain'),
+    'preview': ('preview',),
+}
+
+EMAIL_BODY_FIELDS = ('body_html', 'body_plain')
+EMAIL_PREVIEW_LENGTH = 200
+# Characters of body_plain read for a thread preview; enough to get past the new
+# text of a typical reply to where its quoted history starts
+THREAD_PREVIEW_SCAN_LENGTH = 2000
+THREAD_PARTICIPANTS_LIMIT = 50
+
+
+def _api_fields(value_fields):
+    """API field names of a values() field tuple"""
+    names = [name for name in value_fields if name not in EMAIL_ACCOUNT_VALUE_FIELDS]
+    if any(name in EMAIL_ACCOUNT_VALUE_FIELDS for name in value_fields):
+        names.append('email_account')
+    return tuple(names)
+
+
+EMAIL_LIST_API_FIELDS = _api_fields(EMAIL_LIST_FIELDS) + ('preview',)
+EMAIL_CONTENT_API_FIELDS = _api_fields(EMAIL_CONTENT_FIELDS) + ('content', 'preview')
+EMAIL_CONVERSATION_API_FIELDS = _api_fields(EMAIL_CONVERSATION_FIELDS) + ('preview',)
+
+
+def _email_row(row):
+    """Turn one EmailMessage values() row into its API representation"""
+    if 'recipients' in row:
+        row['recipients'] = load_address_list(row['recipients'])
+    if 'cc' in row:
+        row['cc'] = load_address_list(row['cc'])
+    if 'email_account_id' in row:
+        row['email_account'] = {
+            'id': row.pop('email_account_id'),
+            'email_address': row.pop('email_account__email_address'),
+            'provider': row.pop('email_account__provider'),
+        }
+    if 'preview' in row:
+        row['preview'] = ' '.join(row['preview'].split())
+    return row
+
+
+def _email_rows(queryset, value_fields, fields=None, body_limit=None, with_content=False):
+    """
+    Yield API rows for an EmailMessage queryset.
+    fields: API fields requested with ?fields=; None returns the endpoint defaults.
+    body_limit: bodies are cut to this many characters in the database and
+    rows gain a body_truncated flag.
+    """
+    if fields is None:
+        selected = list(value_fields)
+        output = None
+    else:
+        selected = select_value_fields(['id'] + fields, EMAIL_FIELD_SOURCES)
+        output = ['id'] + [name for name in fields if name != 'id']
+        with_content = 'content' in fields
+    
+    expressions = {}
+    if 'preview' in selected:
+        selected.remove('preview')
+        expressions['preview'] = Left('body_plain', EMAIL_PREVIEW_LENGTH)
+    limited = []
+    if body_limit:
+        for name in EMAIL_BODY_FIELDS:
+            if name in selected:
+                selected.remove(name)
+                expressions[f'{name}_limited'] = Left(name, body_limit)
+                expressions[f'{name}_length'] = Length(name)
+                limited.append(name)
+    
+    for row in queryset.values(*selected, **expressions):
+        if limited:
+            truncated = False
+            for name in limited:
+                row[name] = row.pop(f'{name}_limited')
+                truncated = truncated or row.pop(f'{name}_length') > body_limit
+            row['body_truncated'] = truncated
+        if with_content:
+            row['content'] = row['body_html'] or row['body_plain'] or 'No content available'
+        row = _email_row(row)
+        if output is not None:
+            row = {name: row[name] for name in output + (['body_truncated'] if limited else [])}
+        yield row
+
+
+def serialize_email_list(queryset, fields=None):
+    """Serialize an EmailMessage queryset for inbox listings"""
+    return list(_email_rows(queryset, EMAIL_LIST_FIELDS, fields))
+
+
+def serialize_email_content(queryset, fields=None, body_limit=None):
+    """Serialize a single email with its bodies, or None if the queryset is empty"""
+    return next(_email_rows(queryset[:1], EMAIL_CONTENT_FIELDS, fields, body_limit, with_content=True), None)
+
+
+def serialize_email_conversation(queryset, fields=None, body_limit=None):
+    """Serialize the messages of a conversation thread"""
+    return list(_email_rows(queryset, EMAIL_CONVERSATION_FIELDS, fields, body_limit))
+
+
+def serialize_thread_summary(queryset):
+    """Message counts, date range and senders of a thread, in two queries"""
+    summary = queryset.order_by().aggregate(
+        total_messages=Count('id'),
+        unread_messages=Count('id', filter=Q(is_read=False)),
+        first_message_at=Min('received_at'),
+        last_message_at=Max('received_at'),
+    )
+    summary['participants'] = list(
+        queryset.order_by().values_list('sender', flat=True).distinct()[:THREAD_PARTICIPANTS_LIMIT]
+    )
+    return summary
+
+
+def serialize_thread_messages(queryset):
+    """
+    Serialize a page of thread messages as headers without bodies. The preview
+    is taken from the new text of each message, not from its quoted history.
+    """
+    rows = []
+    for row in queryset.values(*THREAD_MESSAGE_FIELDS, preview=Left('body_plain', THREAD_PREVIEW_SCAN_LENGTH)):
+        reply, _ = split_quoted_history(row['preview'])
+        row['preview'] = reply[:EMAIL_PREVIEW_LENGTH]
+        rows.append(_email_row(row))
+    return rows
+
+
+def serialize_thread_message_body(queryset, quoted=False):
+    """
+    Bodies of a single thread message split at its quoted history, or None if
+    the queryset is empty. Returns the new text, or with quoted=True the history.
+    """
+    row = queryset.values('id', 'body_html', 'body_plain').first()
+    if row is None:
+        return None
+    
+    body_html, quoted_html = split_quoted_history(row['body_html'], html=True)
+    body_plain, quoted_plain = split_quoted_history(row['body_plain'])
+    if quoted:
+        return {
+            'id': row['id'],
+            'quoted_html': quoted_html,
+            'quoted_plain': quoted_plain,
+        }
+    return {
+        'id': row['id'],
+        'body_html': body_html,
+        'body_plain': body_plain,
+        'has_quoted_history': bool(quoted_html or quoted_plain),
+    }
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import EmailAccount, EmailMessage
+from .utils import bump_mailbox_version
+
+
+@receiver(post_save, sender=EmailAccount)
+def email_account_saved(sender, instance, **kwargs):
+    bump_mailbox_version(instance.user_id)
+
+
+@receiver(post_save, sender=EmailMessage)
+def email_message_saved(sender, instance, **kwargs):
+    bump_mailbox_version(instance.email_account.user_id)
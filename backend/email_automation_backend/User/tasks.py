@@ -1,12 +1,20 @@
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
-from .models import EmailAccount, EmailMessage, EmailFetchLog
+from googleapiclient.errors import HttpError
+
+from email_automation_backend.events import publish_event_on_commit
+from .models import EmailAccount, EmailMessage, EmailFetchLog, AccountDeletionJob
 from .views import GmailService
+from .utils import store_fetched_email, get_sender_address
 from hubspot_integration.models import HubSpotAccount
 from hubspot_integration.services import HubSpotContactService
+from hubspot_integration.utils import is_connected
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -66,29 +74,20 @@ def fetch_all_emails_task(self):
                         
                         if not existing_email:
                             # Create new email message
-                            new_email = EmailMessage.objects.create(
-                                email_account=account,
-                                gmail_message_id=email_data['gmail_message_id'],
-                                gmail_thread_id=email_data['gmail_thread_id'],
-                                subject=email_data['subject'],
-                                sender=email_data['sender'],
-                                recipients=email_data['recipients'],
-                                cc=email_data['cc'],
-                                body_html=email_data['body_html'],
-                                body_plain=email_data['body_plain'],
-                                received_at=email_data['received_at'],
-                                has_attachments=email_data['has_attachments']
-                            )
+                            new_email = store_fetched_email(account, email_data)
                             messages_processed_for_account += 1
                             total_emails_processed += 1
                             
-                            # Trigger AI processing for the new email
-                            try:
-                                from Ai_processing.tasks import process_new_email_with_ai
-                                process_new_email_with_ai.delay(str(new_email.id))
-                                logger.info(f"🤖 Queued AI processing for new email: {new_email.subject}")
-                            except Exception as ai_error:
-                                logger.error(f"❌ Failed to queue AI processing: {str(ai_error)}")
+                            # Trigger AI processing for the new email, unless the pre-filter found it automated
+                            if not new_email.needs_ai:
+                                logger.info(f"⏭️ Skipping AI for automated email ({new_email.automated_category}): {new_email.subject}")
+                            else:
+                                try:
+                                    from Ai_processing.tasks import process_new_email_with_ai
+                                    process_new_email_with_ai.delay(str(new_email.id))
+                                    logger.info(f"🤖 Queued AI processing for new email: {new_email.subject}")
+                                except Exception as ai_error:
+                                    logger.error(f"❌ Failed to queue AI processing: {str(ai_error)}")
                             
                             # Trigger HubSpot sender sync for the new email
                             try:
@@ -224,28 +223,19 @@ def fetch_single_account_emails_task(email_account_id, fetch_type='manual'):
                 
                 if not existing_email:
                     # Create new email message
-                    new_email = EmailMessage.objects.create(
-                        email_account=account,
-                        gmail_message_id=email_data['gmail_message_id'],
-                        gmail_thread_id=email_data['gmail_thread_id'],
-                        subject=email_data['subject'],
-                        sender=email_data['sender'],
-                        recipients=email_data['recipients'],
-                        cc=email_data['cc'],
-                        body_html=email_data['body_html'],
-                        body_plain=email_data['body_plain'],
-                        received_at=email_data['received_at'],
-                        has_attachments=email_data['has_attachments']
-                    )
+                    new_email = store_fetched_email(account, email_data)
                     messages_processed += 1
                     
-                    # Trigger AI processing for the new email
-                    try:
-                        from Ai_processing.tasks import process_new_email_with_ai
-                        process_new_email_with_ai.delay(str(new_email.id))
-                        logger.info(f"🤖 Queued AI processing for new email: {new_email.subject}")
-                    except Exception as ai_error:
-                        logger.error(f"❌ Failed to queue AI processing: {str(ai_error)}")
+                    # Trigger AI processing for the new email, unless the pre-filter found it automated
+                    if not new_email.needs_ai:
+                        logger.info(f"⏭️ Skipping AI for automated email ({new_email.automated_category}): {new_email.subject}")
+                    else:
+                        try:
+                            from Ai_processing.tasks import process_new_email_with_ai
+                            process_new_email_with_ai.delay(str(new_email.id))
+                            logger.info(f"🤖 Queued AI processing for new email: {new_email.subject}")
+                        except Exception as ai_error:
+                            logger.error(f"❌ Failed to queue AI processing: {str(ai_error)}")
                     
                     # Trigger HubSpot sender sync for the new email
                     try:
@@ -332,7 +322,7 @@ def sync_email_sender_to_hubspot(email_message_id):
         # Check if user has HubSpot account connected
         try:
             hubspot_account = user.hubspot_account
-            if not hubspot_account.is_connected():
+            if not is_connected(hubspot_account):
                 logger.info(f"User {user.email} doesn't have HubSpot connected - skipping sync")
                 return {
                     'status': 'skipped',
@@ -374,6 +364,13 @@ def sync_email_sender_to_hubspot(email_message_id):
             success_msg = f"Successfully synced sender {sender_details['email']} to HubSpot"
             logger.info(success_msg)
             
+            publish_event_on_commit(user.pk, 'hubspot.contact_synced', {
+                'email_id': email_message.id,
+                'contact_email': hubspot_contact.email_address,
+                'hubspot_contact_id': hubspot_contact.hubspot_contact_id,
+                'sync_status': hubspot_contact.sync_status,
+            })
+            
             return {
                 'status': 'success',
                 'message': success_msg,
@@ -397,14 +394,210 @@ def sync_email_sender_to_hubspot(email_message_id):
         return {'status': 'error', 'message': error_msg}
 
 
+@shared_task(bind=True)
+def delete_email_account_data_task(self, job_id):
+    """
+    Task to remove a disconnected email account and all of its data.
+    Rows are deleted in small chunks, each committed on its own, so a crashed or
+    retried run simply continues with whatever is left.
+    """
+    from Ai_processing.models import EmailProcessingLog
+    
+    logger.info(f"Starting account deletion job {job_id}")
+    
+    try:
+        job = AccountDeletionJob.objects.get(id=job_id)
+    except AccountDeletionJob.DoesNotExist:
+        error_msg = f"Account deletion job {job_id} not found"
+        logger.error(error_msg)
+        return {'status': 'error', 'message': error_msg}
+    
+    if job.status == 'completed':
+        return {'status': 'completed', 'job_id': str(job.id)}
+    
+    chunk_size = settings.ACCOUNT_DELETION_CHUNK_SIZE
+    AccountDeletionJob.objects.filter(id=job.id).update(status='running', updated_at=timezone.now())
+    
+    try:
+        # Step 1: Email messages, together with their AI processing logs and any reply links
+        while True:
+            message_ids = list(
+                EmailMessage.objects.filter(email_account_id=job.email_account_id)
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not message_ids:
+                break
+            
+            with transaction.atomic():
+                EmailMessage.objects.filter(parent_email_id__in=message_ids).update(parent_email=None)
+                _, processing_logs_deleted = EmailProcessingLog.objects.filter(
+                    email_message_id__in=message_ids
+                ).delete()
+                EmailMessage.objects.filter(id__in=message_ids).delete()
+                
+                AccountDeletionJob.objects.filter(id=job.id).update(
+                    emails_removed=F('emails_removed') + len(message_ids),
+                    processing_logs_removed=F('processing_logs_removed') + processing_logs_deleted.get(
+                        EmailProcessingLog._meta.label, 0
+                    ),
+                    updated_at=timezone.now()
+                )
+        
+        # Step 2: Fetch logs
+        while True:
+            fetch_log_ids = list(
+                EmailFetchLog.objects.filter(email_account_id=job.email_account_id)
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not fetch_log_ids:
+                break
+            
+            with transaction.atomic():
+                EmailFetchLog.objects.filter(id__in=fetch_log_ids).delete()
+                AccountDeletionJob.objects.filter(id=job.id).update(
+                    fetch_logs_removed=F('fetch_logs_removed') + len(fetch_log_ids),
+                    updated_at=timezone.now()
+                )
+        
+        # Step 3: The account itself
+        EmailAccount.objects.filter(id=job.email_account_id).delete()
+        
+        AccountDeletionJob.objects.filter(id=job.id).update(
+            status='completed',
+            error_message='',
+            completed_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        job.refresh_from_db()
+        
+        logger.info(
+            f"Account deletion job {job.id} completed for {job.email_address}: "
+            f"{job.emails_removed} emails, {job.fetch_logs_removed} fetch logs, "
+            f"{job.processing_logs_removed} processing logs removed"
+        )
+        
+        return {
+            'status': 'completed',
+            'job_id': str(job.id),
+            'emails_removed': job.emails_removed,
+            'fetch_logs_removed': job.fetch_logs_removed,
+            'processing_logs_removed': job.processing_logs_removed
+        }
+        
+    except Exception as e:
+        error_msg = f"Error in account deletion job {job_id}: {str(e)}"
+        logger.error(error_msg)
+        
+        AccountDeletionJob.objects.filter(id=job.id).update(
+            status='failed',
+            error_message=str(e),
+            updated_at=timezone.now()
+        )
+        
+        if self.request.retries >= 3 and job.resume_count >= settings.ACCOUNT_DELETION_MAX_RESUMES:
+            logger.error(
+                f"Giving up on account deletion job {job.id} for {job.email_address} after "
+                f"{job.resume_count} resumes; the account stays disconnecting until it is resumed by hand"
+            )
+        
+        # Already-deleted chunks stay deleted, so a retry picks up where this run stopped
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
+def _resume_delay(resume_count):
+    """Wait before a failed deletion job is resumed again: doubles with each resume, at most a day"""
+    return min(timedelta(days=1), timedelta(minutes=settings.ACCOUNT_DELETION_STALE_MINUTES * 2 ** resume_count))
+
+
+@shared_task
+def resume_account_deletions_task():
+    """
+    Periodic task that re-queues account deletion jobs which were interrupted,
+    e.g. because the worker running them was restarted, and jobs that failed
+    after using up their retries, with backoff, up to ACCOUNT_DELETION_MAX_RESUMES
+    times. Until a job completes its account stays disconnecting and cannot be
+    connected again.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(minutes=settings.ACCOUNT_DELETION_STALE_MINUTES)
+    stale_jobs = AccountDeletionJob.objects.filter(
+        status__in=['pending', 'running'],
+        updated_at__lt=stale_before
+    ).values_list('id', flat=True)
+    
+    resumed = 0
+    for job_id in stale_jobs:
+        delete_email_account_data_task.delay(str(job_id))
+        resumed += 1
+    
+    failed_jobs = AccountDeletionJob.objects.filter(
+        status='failed',
+        resume_count__lt=settings.ACCOUNT_DELETION_MAX_RESUMES,
+        updated_at__lt=stale_before
+    ).values_list('id', 'resume_count', 'updated_at')
+    
+    for job_id, resume_count, updated_at in failed_jobs:
+        if updated_at > now - _resume_delay(resume_count):
+            continue
+        # Conditional update, so overlapping runs resume a job only once
+        claimed = AccountDeletionJob.objects.filter(id=job_id, status='failed', resume_count=resume_count).update(
+            status='pending',
+            resume_count=resume_count + 1,
+            updated_at=now
+        )
+        if claimed:
+            delete_email_account_data_task.delay(str(job_id))
+            resumed += 1
+    
+    if resumed:
+        logger.info(f"Resumed {resumed} interrupted account deletion jobs")
+    
+    return {'status': 'completed', 'jobs_resumed': resumed}
+
+
+@shared_task(bind=True)
+def sync_gmail_labels_task(self, email_account_id, gmail_message_ids, add_label_ids, remove_label_ids):
+    """
+    Task to push a bulk message action to Gmail with users.messages.batchModify.
+    Label changes are idempotent, so a retry simply resends every batch.
+    """
+    try:
+        account = EmailAccount.objects.get(id=email_account_id, is_active=True, is_disconnecting=False)
+    except EmailAccount.DoesNotExist:
+        error_msg = f"Email account {email_account_id} not found or not active"
+        logger.warning(error_msg)
+        return {'status': 'error', 'message': error_msg}
+    
+    try:
+        gmail_service = GmailService(account.access_token, account.refresh_token)
+        synced = gmail_service.batch_modify(gmail_message_ids, add_label_ids, remove_label_ids)
+        logger.info(f"Synced labels of {synced} messages to Gmail for {account.email_address}")
+        return {'status': 'success', 'messages_synced': synced}
+        
+    except HttpError as e:
+        # Permission problems (e.g. an account authorized before the gmail.modify scope) will not heal on retry
+        if e.resp.status in (401, 403) and 'rate' not in str(e).lower():
+            if 'insufficient' in str(e).lower() and 'scope' in str(e).lower():
+                error_msg = (
+                    f"{account.email_address} has not granted Gmail label changes (gmail.modify); "
+                    f"reconnect the account to sync bulk actions to Gmail"
+                )
+            else:
+                error_msg = f"Gmail rejected label sync for {account.email_address}: {str(e)}"
+            logger.error(error_msg)
+            return {'status': 'error', 'message': error_msg}
+        logger.warning(f"Gmail label sync failed for {account.email_address}, retrying: {str(e)}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+    except Exception as e:
+        logger.warning(f"Gmail label sync failed for {account.email_address}, retrying: {str(e)}")
+        raise self.retry(exc=e, countdown=60, max_retries=3)
+
+
 def extract_enhanced_sender_details(email_message):
     """
     Enhanced sender detail extraction from email message.
     Extracts name, email, company, phone, and other details from email content.
     """
-    import re
-    from email.utils import parseaddr
-    
     sender_info = {
         'email': '',
         'full_name': '',
@@ -418,21 +611,10 @@ def extract_enhanced_sender_details(email_message):
     }
     
     try:
-        # Extract email and name from sender field
-        sender = email_message.sender.strip()
-        
-        # Parse email address - handle formats like "Name <email@domain.com>" or just "email@domain.com"
-        if '<' in sender and '>' in sender:
-            # Format: "John Doe <john@example.com>"
-            name_part = sender.split('<')[0].strip().strip('"\'')
-            email_part = sender.split('<')[1].split('>')[0].strip()
-        else:
-            # Just email address or name followed by email
-            parsed_name, parsed_email = parseaddr(sender)
-            name_part = parsed_name.strip().strip('"\'')
-            email_part = parsed_email.strip() if parsed_email else sender
+        # Sender email, name and domain from the normalized address table
+        email_part, name_part, domain = get_sender_address(email_message)
         
-        sender_info['email'] = email_part
+        sender_info['email'] = email_part or email_message.sender
         sender_info['full_name'] = name_part
         
         # Parse name into first and last
@@ -445,9 +627,7 @@ def extract_enhanced_sender_details(email_message):
                 sender_info['last_name'] = ' '.join(name_parts[1:])
         
         # Extract company from email domain
-        if sender_info['email'] and '@' in sender_info['email']:
-            domain = sender_info['email'].split('@')[1].lower()
-            
+        if domain:
             # Skip common email providers
             common_providers = [
                 'gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com',
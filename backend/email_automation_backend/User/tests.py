@@ -1,3 +1,16 @@
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from .utils import _mailbox_version_key, bump_mailbox_version
+
+
+class MailboxVersionTests(TestCase):
+    def test_bump_waits_for_commit(self):
+        key = _mailbox_version_key('user-1')
+        cache.set(key, 1, None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_mailbox_version('user-1')
+            self.assertEqual(cache.get(key), 1)
+
+        self.assertEqual(cache.get(key), 2)
@@ -4,7 +4,7 @@ from . import views
 urlpatterns = [
     # Gmail OAuth endpoints
     path('auth/gmail/', views.GmailOAuthView.as_view(), name='gmail_oauth'),
-    path('auth/gmail/callback/', views.GmailOAuthCallbackView.as_view(), name='gmail_oauth_callback'),
+    path('auth/gmail/callback/', views.gmail_oauth_callback, name='gmail_oauth_callback'),
     
     # Email functionality endpoints
     path('email-accounts/', views.GetEmailAccountsView.as_view(), name='get_email_accounts'),
@@ -13,13 +13,26 @@ urlpatterns = [
     path('connect-email/', views.ConnectEmailView.as_view(), name='connect_email'),
     path('fetch-emails/', views.FetchEmailsView.as_view(), name='fetch_emails'),
     path('get-emails/', views.GetEmailsView.as_view(), name='get_emails'),
+    path('inbox-cache-stats/', views.InboxCacheStatsView.as_view(), name='inbox_cache_stats'),
+    path('contact-history/', views.ContactHistoryView.as_view(), name='contact_history'),
     path('email-content/<uuid:email_id>/', views.GetEmailContentView.as_view(), name='get_email_content'),
     path('mark-email-read/<uuid:email_id>/', views.MarkEmailAsReadView.as_view(), name='mark_email_read'),
     path('mark-all-emails-read/', views.MarkAllEmailsAsReadView.as_view(), name='mark_all_emails_read'),
+    path('bulk-email-action/', views.BulkEmailActionView.as_view(), name='bulk_email_action'),
     path('manual-email-refresh/', views.ManualEmailRefreshView.as_view(), name='manual_email_refresh'),
     path('disconnect-email-account/', views.DisconnectEmailAccountView.as_view(), name='disconnect_email_account'),
+    path('disconnect-email-account/<uuid:job_id>/status/', views.DisconnectEmailAccountStatusView.as_view(), name='disconnect_email_account_status'),
+    
+    # Real-time events (server-sent events)
+    path('events/', views.email_events_stream, name='email_events'),
+    path('events/ticket/', views.EventsTicketView.as_view(), name='email_events_ticket'),
     
     # Email reply endpoints
-    path('reply-to-email/<uuid:email_id>/', views.ReplyToEmailView.as_view(), name='reply_to_email'),
+    path('reply-to-email/<uuid:email_id>/', views.reply_to_email, name='reply_to_email'),
     path('email-replies/<uuid:email_id>/', views.GetEmailRepliesView.as_view(), name='get_email_replies'),
+    
+    # Thread view: headers page first, bodies and quoted history on demand
+    path('email-thread/<uuid:email_id>/', views.GetEmailThreadView.as_view(), name='get_email_thread'),
+    path('email-thread/message/<uuid:email_id>/', views.GetThreadMessageView.as_view(), name='get_thread_message'),
+    path('email-thread/message/<uuid:email_id>/quoted/', views.GetThreadMessageView.as_view(quoted=True), name='get_thread_message_quoted'),
 ]
@@ -0,0 +1,348 @@
+import json
+import logging
+import re
+import time
+from email.utils import formataddr, getaddresses, parseaddr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from email_automation_backend.caching import cache_is_shared
+from email_automation_backend.events import publish_event_on_commit
+from .models import EmailMessage, EmailAddress, EmailMessageAddress
+from .prefilter import classify_automated_mail
+
+logger = logging.getLogger(__name__)
+
+
+def parse_address_header(header_value):
+    """Split a raw To/Cc header into a list of formatted addresses"""
+    if not header_value:
+        return []
+
+    addresses = []
+    for name, address in getaddresses([header_value]):
+        if not address:
+            continue
+        addresses.append(formataddr((name, address)) if name else address)
+    return addresses
+
+
+def dump_address_list(addresses):
+    """Serialize an address list for storage in EmailMessage.recipients / cc"""
+    if not addresses:
+        return ''
+    if isinstance(addresses, str):
+        addresses = parse_address_header(addresses)
+    return json.dumps(addresses)
+
+
+def load_address_list(stored_value):
+    """
+    Read an address list stored on an EmailMessage.
+    New rows hold a JSON array; older rows may still hold the raw header string.
+    """
+    if not stored_value:
+        return []
+    if stored_value[0] == '[':
+        try:
+            return json.loads(stored_value)
+        except ValueError:
+            pass
+    return parse_address_header(stored_value)
+
+
+def split_address(value):
+    """Return (email, display_name) for one formatted address; email is lowercased"""
+    name, address = parseaddr(value or '')
+    name = name.strip().strip('"\'')
+    address = address.strip().lower()
+    if '@' not in address:
+        return '', name
+    return address, name
+
+
+def record_message_addresses(email_message):
+    """Normalize the From/To/Cc/Bcc headers of a stored message into the address tables"""
+    entries = {}
+    sender_email, sender_name = split_address(email_message.sender)
+    if sender_email:
+        entries[(sender_email, 'from')] = sender_name
+    for role, stored_value in (('to', email_message.recipients), ('cc', email_message.cc), ('bcc', email_message.bcc)):
+        for value in load_address_list(stored_value):
+            address, name = split_address(value)
+            if address:
+                entries.setdefault((address, role), name)
+    
+    if not entries:
+        return 0
+    
+    names = {}
+    for (address, _), name in entries.items():
+        if name:
+            names.setdefault(address, name)
+    emails = {address for address, _ in entries}
+    
+    EmailAddress.objects.bulk_create([
+        EmailAddress(email=address, display_name=names.get(address, ''), domain=address.rsplit('@', 1)[1])
+        for address in emails
+    ], ignore_conflicts=True)
+    address_ids = dict(EmailAddress.objects.filter(email__in=emails).values_list('email', 'id'))
+    
+    EmailMessageAddress.objects.bulk_create([
+        EmailMessageAddress(
+            email_message=email_message,
+            address_id=address_ids[address],
+            role=role,
+            display_name=name,
+            received_at=email_message.received_at
+        )
+        for (address, role), name in entries.items()
+    ], ignore_conflicts=True)
+    return len(entries)
+
+
+def store_fetched_email(email_account, email_data):
+    """
+    Create an EmailMessage from parsed Gmail data and record its addresses.
+    Automated mail is categorised here; its needs_ai says whether to queue AI processing.
+    """
+    automated_category, automated_reason = '', ''
+    if settings.AI_PREFILTER_ENABLED:
+        automated_category, automated_reason = classify_automated_mail(
+            email_data['sender'], email_data['subject'], email_data.get('headers'), email_data.get('mime_types', ())
+        )
+    
+    with transaction.atomic():
+        email_message = EmailMessage.objects.create(
+            email_account=email_account,
+            gmail_message_id=email_data['gmail_message_id'],
+            gmail_thread_id=email_data['gmail_thread_id'],
+            subject=email_data['subject'],
+            sender=email_data['sender'],
+            recipients=dump_address_list(email_data['recipients']),
+            cc=dump_address_list(email_data['cc']),
+            body_html=email_data['body_html'],
+            body_plain=email_data['body_plain'],
+            received_at=email_data['received_at'],
+            has_attachments=email_data['has_attachments'],
+            automated_category=automated_category,
+            automated_reason=automated_reason,
+            needs_ai=automated_category not in settings.AI_PREFILTER_SKIP_CATEGORIES
+        )
+        record_message_addresses(email_message)
+        publish_event_on_commit(email_account.user_id, 'email.received', {
+            'email_id': email_message.id,
+            'email_account_id': email_account.id,
+            'subject': email_message.subject,
+            'sender': email_message.sender,
+            'received_at': email_message.received_at,
+        })
+    return email_message
+
+
+def get_sender_address(email_message):
+    """
+    Return (email, display_name, domain) for a message's sender.
+    Reads the normalized address table and only parses the header for messages
+    that have not been recorded there yet.
+    """
+    link = (
+        EmailMessageAddress.objects.filter(email_message=email_message, role='from')
+        .select_related('address')
+        .first()
+    )
+    if link is not None:
+        return link.address.email, link.display_name or link.address.display_name, link.address.domain
+    
+    address, name = split_address(email_message.sender)
+    return address, name, address.rsplit('@', 1)[1] if address else ''
+
+
+def filter_by_address(queryset, email=None, roles=None, domain=None):
+    """Restrict an EmailMessage queryset to messages with a matching address link"""
+    links = EmailMessageAddress.objects.filter(email_message=OuterRef('pk'))
+    if email:
+        links = links.filter(address__email=email.strip().lower())
+    if domain:
+        links = links.filter(address__domain=domain.strip().lower())
+    if roles:
+        links = links.filter(role__in=roles)
+    return queryset.filter(Exists(links))
+
+
+# Where quoted history starts in a reply. Plain text: "On ... wrote:" attribution
+# lines (wrapped over at most two lines), Outlook's "Original Message" separator and header blocks, and ">" quoting.
+# HTML: the wrappers Gmail, Outlook, Apple Mail and Yahoo put around quotes.
+QUOTE_TEXT_MARKERS = (
+    re.compile(r'^[ \t]*On\s[^\n]{1,300}?(\n[^\n]{0,300}?)?\swrote:[ \t]*$', re.MULTILINE),
+    re.compile(r'^[ \t]*-{2,}\s*(Original Message|Forwarded message)\s*-{2,}', re.MULTILINE | re.IGNORECASE),
+    re.compile(r'^[ \t]*_{10,}[ \t]*\r?\n[ \t]*From:', re.MULTILINE),
+    re.compile(r'^[ \t]*From:.*\r?\n[ \t]*(Sent|Date):.*\r?\n', re.MULTILINE),
+    re.compile(r'^[ \t]*>', re.MULTILINE),
+)
+QUOTE_HTML_MARKERS = (
+    re.compile(r'<div[^>]*class="[^"]*gmail_(quote|attr)[^"]*"', re.IGNORECASE),
+    re.compile(r'<div[^>]*id="(appendonsend|divRplyFwdMsg)"', re.IGNORECASE),
+    re.compile(r'<div[^>]*class="[^"]*yahoo_quoted[^"]*"', re.IGNORECASE),
+    re.compile(r'<blockquote[^>]*type="cite"', re.IGNORECASE),
+    re.compile(r'<blockquote', re.IGNORECASE),
+)
+
+
+def split_quoted_history(body, html=False):
+    """
+    Split a message body into (reply, quoted_history) at the first quote marker.
+    quoted_history is '' when nothing is quoted. Bodies that would be left empty
+    (the message is only a quote) are returned whole.
+    """
+    if not body:
+        return body or '', ''
+    
+    markers = QUOTE_HTML_MARKERS if html else QUOTE_TEXT_MARKERS
+    starts = [match.start() for match in (marker.search(body) for marker in markers) if match]
+    if not starts:
+        return body, ''
+    
+    start = min(starts)
+    reply = body[:start]
+    if not (re.sub(r'<[^>]+>|&nbsp;', '', reply) if html else reply).strip():
+        return body, ''
+    return reply.rstrip(), body[start:]
+
+
+def _mailbox_version_key(user_id):
+    return f'mailbox_version:{user_id}'
+
+
+def get_mailbox_version(user_id):
+    """
+    Current version of a user's mailbox (accounts and messages), or None without
+    a shared cache: ingest runs in Celery workers, whose bumps a per-process
+    cache would never show the web processes.
+    Starts from the clock so a flushed cache never hands out an old version again.
+    """
+    if not cache_is_shared():
+        return None
+    key = _mailbox_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_mailbox_version(user_id):
+    """
+    Invalidate validators built from the mailbox version after a change.
+    The bump waits for the surrounding transaction to commit, so a reader that
+    sees the new version also sees the change on the primary.
+    """
+    transaction.on_commit(lambda: _incr_mailbox_version(user_id))
+
+
+def _incr_mailbox_version(user_id):
+    key = _mailbox_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+INBOX_CACHE_METRIC_KEYS = {True: 'inbox_cache:hits', False: 'inbox_cache:misses'}
+
+
+def inbox_page_cache_key(user_id, email_account_id, limit, offset):
+    """
+    Cache key for one rendered inbox page, or None if the page is not cached.
+    Keys embed the mailbox version, so any bump makes older pages unreachable;
+    without a shared cache there is no version worker writes can bump, so no
+    page is cached.
+    """
+    if limit <= 0 or offset % limit or offset // limit >= settings.INBOX_CACHE_PAGES:
+        return None
+    version = get_mailbox_version(user_id)
+    if version is None:
+        return None
+    return f"inbox_page:{user_id}:{version}:{email_account_id or 'all'}:{limit}:{offset}"
+
+
+def record_inbox_cache_result(hit):
+    """Count an inbox page cache hit or miss"""
+    key = INBOX_CACHE_METRIC_KEYS[hit]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_inbox_cache_stats():
+    """Hit/miss counters of the inbox page cache"""
+    hits = cache.get(INBOX_CACHE_METRIC_KEYS[True], 0)
+    misses = cache.get(INBOX_CACHE_METRIC_KEYS[False], 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+        'cached_pages': settings.INBOX_CACHE_PAGES,
+        'timeout_seconds': settings.INBOX_CACHE_TIMEOUT,
+    }
+
+
+# Bulk message actions: (field updates, Gmail labels to add, Gmail labels to remove)
+BULK_EMAIL_ACTIONS = {
+    'read': ({'is_read': True}, [], ['UNREAD']),
+    'unread': ({'is_read': False}, ['UNREAD'], []),
+    'star': ({'is_starred': True}, ['STARRED'], []),
+    'unstar': ({'is_starred': False}, [], ['STARRED']),
+    'archive': ({'is_archived': True}, [], ['INBOX']),
+    'unarchive': ({'is_archived': False}, ['INBOX'], []),
+}
+
+
+def apply_bulk_email_action(user_id, queryset, action):
+    """
+    Apply a bulk action to the messages of a queryset with a single UPDATE and
+    queue the matching Gmail label change. Only messages whose state actually
+    changes are touched. Returns the number of updated messages.
+    """
+    updates, add_label_ids, remove_label_ids = BULK_EMAIL_ACTIONS[action]
+    changed = queryset.exclude(**updates)
+    
+    with transaction.atomic():
+        targets = list(changed.values_list('email_account_id', 'gmail_message_id'))
+        updated_count = changed.update(updated_at=timezone.now(), **updates)
+        if not updated_count:
+            return 0
+        
+        bump_mailbox_version(user_id)
+        
+        gmail_ids_by_account = {}
+        for email_account_id, gmail_message_id in targets:
+            gmail_ids_by_account.setdefault(email_account_id, []).append(gmail_message_id)
+        transaction.on_commit(
+            lambda: queue_gmail_label_sync(gmail_ids_by_account, add_label_ids, remove_label_ids)
+        )
+    return updated_count
+
+
+def queue_gmail_label_sync(gmail_ids_by_account, add_label_ids, remove_label_ids):
+    """Queue one Gmail label sync task per account"""
+    from .tasks import sync_gmail_labels_task
+    
+    for email_account_id, gmail_message_ids in gmail_ids_by_account.items():
+        args = (str(email_account_id), gmail_message_ids, add_label_ids, remove_label_ids)
+        try:
+            sync_gmail_labels_task.delay(*args)
+        except Exception as e:
+            # Celery is not available, push the change inline
+            logger.warning(f"Could not queue Gmail label sync for account {email_account_id}, running synchronously: {str(e)}")
+            try:
+                sync_gmail_labels_task(*args)
+            except Exception as sync_error:
+                logger.error(f"Gmail label sync failed for account {email_account_id}: {str(sync_error)}")
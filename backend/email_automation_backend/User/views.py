@@ -2,17 +2,27 @@ from django.contrib.auth import authenticate
 from django.core.mail import send_mail
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import cache
 from datetime import timedelta
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
 from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils.decorators import method_decorator
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.core.serializers.json import DjangoJSONEncoder
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from asgiref.sync import sync_to_async
 
 import json
+import logging
 import os
-import requests
+from urllib.parse import urlencode
 from datetime import datetime, timezone as dt_timezone
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
@@ -20,12 +30,58 @@ from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from Accounts.authentication import aauthenticate_request, async_auth_required
 from Accounts.models import User
-from .models import EmailAccount, EmailMessage, EmailFetchLog
-from .serializers import EmailAccountSerializer
+from Accounts.tokens import issue_events_ticket
+from email_automation_backend.caching import conditional_get
+from email_automation_backend.db_router import read_from_replica
+from email_automation_backend.events import publish_event_on_commit, stream_events
+from email_automation_backend.fieldsets import requested_fields, body_limit_param
+from .models import (
+    EmailAccount, EmailMessage, EmailFetchLog, AccountDeletionJob, EmailAddress, EmailMessageAddress
+)
+from . import gmail_api
+from .gmail_api import GmailAPIError, build_raw_message
+from .serializers import (
+    EmailAccountSerializer, serialize_email_list, serialize_email_content, serialize_email_conversation,
+    serialize_thread_summary, serialize_thread_messages, serialize_thread_message_body,
+    EMAIL_LIST_API_FIELDS, EMAIL_CONTENT_API_FIELDS, EMAIL_CONVERSATION_API_FIELDS
+)
+from .utils import (
+    parse_address_header, dump_address_list, load_address_list, store_fetched_email, record_message_addresses,
+    filter_by_address, get_mailbox_version, bump_mailbox_version, inbox_page_cache_key,
+    record_inbox_cache_result, get_inbox_cache_stats, apply_bulk_email_action, BULK_EMAIL_ACTIONS
+)
+
+from .prefilter import PREFILTER_HEADERS, message_mime_types
+
+logger = logging.getLogger(__name__)
 
 
 # Gmail Utility Functions
+def _mailbox_etag(request, *args, **kwargs):
+    """
+    Validator for views that list the user's mailbox, None (no validation) without a shared cache.
+    It is taken before the view reads, so those views read from the primary: the
+    version only moves after commit, so the body is never older than its ETag.
+    """
+    version = get_mailbox_version(request.user.pk)
+    if version is None:
+        return None
+    return f'{request.user.pk}-{version}'
+
+
+def _email_content_etag(request, email_id):
+    """Validator for a single email, from its updated_at"""
+    updated_at = EmailMessage.objects.filter(
+        id=email_id,
+        email_account__user=request.user
+    ).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return f'{email_id}-{updated_at.timestamp()}'
+
+
 class GmailService:
     """Utility class for Gmail API operations"""
     
@@ -38,10 +94,10 @@ class GmailService:
             token_uri="https://oauth2.googleapis.com/token",
             client_id=os.environ.get('GOOGLE_CLIENT_ID'),
             client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
-            scopes=[
-                'https://www.googleapis.com/auth/gmail.readonly',
-                'https://www.googleapis.com/auth/gmail.send'
-            ]
+            # No scopes: a refresh then keeps whatever the account granted. Passing
+            # gmail.modify here would fail every refresh (invalid_scope) for accounts
+            # connected before it was requested.
+            scopes=None
         )
         self.service = None
     
@@ -112,6 +168,26 @@ class GmailService:
             print(f"Error fetching emails: {e}")
             return []
     
+    def batch_modify(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        """
+        Add/remove labels on many messages with users.messages.batchModify.
+        Sends at most GMAIL_BATCH_MODIFY_SIZE IDs per call; errors are raised so callers can retry.
+        """
+        if not self.service and not self.build_service():
+            raise RuntimeError('Gmail service could not be built')
+        
+        batch_size = settings.GMAIL_BATCH_MODIFY_SIZE
+        for start in range(0, len(message_ids), batch_size):
+            self.service.users().messages().batchModify(
+                userId='me',
+                body={
+                    'ids': message_ids[start:start + batch_size],
+                    'addLabelIds': add_label_ids or [],
+                    'removeLabelIds': remove_label_ids or []
+                }
+            ).execute()
+        return len(message_ids)
+    
     def _parse_email_message(self, msg):
         """Parse Gmail message into structured data"""
         try:
@@ -123,6 +199,9 @@ class GmailService:
             recipients = next((h['value'] for h in headers if h['name'] == 'To'), '')
             cc = next((h['value'] for h in headers if h['name'] == 'Cc'), '')
             date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+            prefilter_headers = {
+                h['name'].lower(): h['value'] for h in headers if h['name'].lower() in PREFILTER_HEADERS
+            }
             
             # Parse date
             try:
@@ -139,12 +218,14 @@ class GmailService:
                 'gmail_thread_id': msg.get('threadId', ''),
                 'subject': subject,
                 'sender': sender,
-                'recipients': recipients,
-                'cc': cc,
+                'recipients': parse_address_header(recipients),
+                'cc': parse_address_header(cc),
                 'body_html': body_html,
                 'body_plain': body_plain,
                 'received_at': received_at,
-                'has_attachments': self._has_attachments(msg['payload'])
+                'has_attachments': self._has_attachments(msg['payload']),
+                'headers': prefilter_headers,
+                'mime_types': message_mime_types(msg['payload'])
             }
             
         except Exception as e:
@@ -200,39 +281,10 @@ class GmailService:
                 if not self.build_service():
                     raise Exception('Failed to initialize Gmail service')
             
-            import base64
-            from email.mime.text import MIMEText
-            from email.mime.multipart import MIMEMultipart
-            
-            # Create message
-            message = MIMEMultipart('alternative')
-            message['From'] = from_email
-            message['Subject'] = subject
-            message['To'] = ', '.join(to_emails) if isinstance(to_emails, list) else to_emails
-            
-            if cc_emails and len(cc_emails) > 0:
-                message['Cc'] = ', '.join(cc_emails) if isinstance(cc_emails, list) else cc_emails
-            if bcc_emails and len(bcc_emails) > 0:
-                message['Bcc'] = ', '.join(bcc_emails) if isinstance(bcc_emails, list) else bcc_emails
-            
-            # Add threading headers for replies
-            if in_reply_to:
-                message['In-Reply-To'] = in_reply_to
-            if references:
-                message['References'] = references
-            
-            # Add plain text part
-            if body_plain:
-                text_part = MIMEText(body_plain, 'plain', 'utf-8')
-                message.attach(text_part)
-            
-            # Add HTML part
-            if body_html:
-                html_part = MIMEText(body_html, 'html', 'utf-8')
-                message.attach(html_part)
-            
-            # Convert to Gmail API format
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+            raw_message = build_raw_message(
+                from_email, to_emails, subject, body_html, body_plain, cc_emails, bcc_emails,
+                in_reply_to, references
+            )
             
             gmail_message = {
                 'raw': raw_message
@@ -350,7 +402,7 @@ class GmailOAuthView(APIView):
             # Google OAuth 2.0 configuration
             client_id = os.environ.get('GOOGLE_CLIENT_ID')
             redirect_uri = 'http://localhost:8000/api/auth/gmail/callback/'
-            scope = 'https://www.googleapis.com/auth/gmail.readonly%20https://www.googleapis.com/auth/gmail.send'
+            scope = 'https://www.googleapis.com/auth/gmail.readonly%20https://www.googleapis.com/auth/gmail.send%20https://www.googleapis.com/auth/gmail.modify'
             
             # Generate OAuth URL
             oauth_url = (
@@ -374,90 +426,73 @@ class GmailOAuthView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class GmailOAuthCallbackView(APIView):
-    permission_classes = [AllowAny]  # Allow any for OAuth callback
-    
-    def get(self, request):
-        """Handle OAuth callback from Google"""
+async def gmail_oauth_callback(request):
+    """
+    Handle OAuth callback from Google.
+    Async so the token exchange and profile lookup do not hold a worker thread.
+    """
+    try:
+        code = request.GET.get('code')
+        state = request.GET.get('state')  # We'll use this to identify the user
+        
+        if not code:
+            return JsonResponse({
+                'message': 'Authorization code not received'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Exchange code for tokens
+        redirect_uri = 'http://localhost:8000/api/auth/gmail/callback/'
         try:
-            code = request.GET.get('code')
-            state = request.GET.get('state')  # We'll use this to identify the user
-            
-            if not code:
-                return Response({
-                    'message': 'Authorization code not received'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Exchange code for tokens
-            client_id = os.environ.get('GOOGLE_CLIENT_ID')
-            client_secret = os.environ.get('GOOGLE_CLIENT_SECRET')
-            redirect_uri = 'http://localhost:8000/api/auth/gmail/callback/'
-            
-            # Token exchange request
-            token_url = 'https://oauth2.googleapis.com/token'
-            token_data = {
-                'client_id': client_id,
-                'client_secret': client_secret,
-                'code': code,
-                'grant_type': 'authorization_code',
-                'redirect_uri': redirect_uri
-            }
-            
-            response = requests.post(token_url, data=token_data)
-            if response.status_code != 200:
-                return Response({
-                    'message': 'Failed to exchange code for tokens'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            tokens = response.json()
-            access_token = tokens.get('access_token')
-            refresh_token = tokens.get('refresh_token')
-            
-            if not access_token:
-                return Response({
-                    'message': 'Access token not received'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Get user email from Gmail API
-            gmail_service = GmailService(access_token, refresh_token)
-            profile = gmail_service.get_user_profile()
-            
-            if not profile:
-                return Response({
-                    'message': 'Failed to get Gmail profile'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            gmail_email = profile.get('emailAddress', '')
-            
-            # Redirect to frontend callback page with tokens
-            from django.shortcuts import redirect
-            from urllib.parse import urlencode
-            
-            # Encode the tokens and email for the frontend
-            params = urlencode({
-                'access_token': access_token,
-                'refresh_token': refresh_token,
-                'gmail_email': gmail_email,
-                'status': 'success'
-            })
-            
-            # Redirect to frontend callback page
-            frontend_callback_url = f"http://localhost:5173/oauth-callback.html?{params}"
-            return redirect(frontend_callback_url)
-            
-        except Exception as e:
-            return Response({
-                'message': f'Failed to process OAuth callback: {str(e)}'
+            tokens = await gmail_api.exchange_code_for_tokens(code, redirect_uri)
+        except GmailAPIError:
+            return JsonResponse({
+                'message': 'Failed to exchange code for tokens'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        access_token = tokens.get('access_token')
+        refresh_token = tokens.get('refresh_token')
+        
+        if not access_token:
+            return JsonResponse({
+                'message': 'Access token not received'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Get user email from Gmail API
+        try:
+            profile = await gmail_api.get_profile(access_token)
+        except GmailAPIError:
+            return JsonResponse({
+                'message': 'Failed to get Gmail profile'
             }, status=status.HTTP_400_BAD_REQUEST)
+        
+        gmail_email = profile.get('emailAddress', '')
+        
+        # Encode the tokens and email for the frontend
+        params = urlencode({
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'gmail_email': gmail_email,
+            'status': 'success'
+        })
+        
+        # Redirect to frontend callback page
+        frontend_callback_url = f"http://localhost:5173/oauth-callback.html?{params}"
+        return redirect(frontend_callback_url)
+        
+    except Exception as e:
+        return JsonResponse({
+            'message': f'Failed to process OAuth callback: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@method_decorator(conditional_get(_mailbox_etag), name='get')
 class GetEmailAccountsView(APIView):
     """Get email accounts for the authenticated user"""
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         try:
-            email_accounts = EmailAccount.objects.filter(user=request.user)
+            email_accounts = EmailAccount.objects.filter(user=request.user, is_disconnecting=False)
             return Response({
                 'email_accounts': [
                     {
@@ -507,7 +542,7 @@ class ConnectEmailView(APIView):
                 # Initiate OAuth flow - return the OAuth URL
                 client_id = os.environ.get('GOOGLE_CLIENT_ID')
                 redirect_uri = 'http://localhost:8000/api/auth/gmail/callback/'
-                scope = 'https://www.googleapis.com/auth/gmail.readonly%20https://www.googleapis.com/auth/gmail.send'
+                scope = 'https://www.googleapis.com/auth/gmail.readonly%20https://www.googleapis.com/auth/gmail.send%20https://www.googleapis.com/auth/gmail.modify'
                 
                 # Add state parameter to identify the user
                 state = str(request.user.id)
@@ -547,6 +582,11 @@ class ConnectEmailView(APIView):
                     email_address=gmail_email
                 ).first()
                 
+                if existing_account and existing_account.is_disconnecting:
+                    return Response({
+                        'message': 'This Gmail account is still being disconnected. Please try again shortly.'
+                    }, status=status.HTTP_409_CONFLICT)
+                
                 if existing_account:
                     # Update existing account
                     existing_account.access_token = access_token
@@ -577,6 +617,7 @@ class ConnectEmailView(APIView):
                     user=request.user,
                     is_primary=True
                 ).exclude(id=email_account.id).update(is_primary=False)
+                bump_mailbox_version(request.user.pk)
                 
                 return Response({
                     'message': 'Gmail account connected successfully',
@@ -663,28 +704,19 @@ class FetchEmailsView(APIView):
                     
                     if not existing_email:
                         # Create new email message
-                        new_email = EmailMessage.objects.create(
-                            email_account=email_account,
-                            gmail_message_id=email_data['gmail_message_id'],
-                            gmail_thread_id=email_data['gmail_thread_id'],
-                            subject=email_data['subject'],
-                            sender=email_data['sender'],
-                            recipients=email_data['recipients'],
-                            cc=email_data['cc'],
-                            body_html=email_data['body_html'],
-                            body_plain=email_data['body_plain'],
-                            received_at=email_data['received_at'],
-                            has_attachments=email_data['has_attachments']
-                        )
+                        new_email = store_fetched_email(email_account, email_data)
                         messages_processed += 1
                         
-                        # Trigger AI processing for the new email
-                        try:
-                            from Ai_processing.tasks import process_new_email_with_ai
-                            process_new_email_with_ai.delay(str(new_email.id))
-                            print(f"🤖 Queued AI processing for new email: {new_email.subject}")
-                        except Exception as ai_error:
-                            print(f"❌ Failed to queue AI processing: {str(ai_error)}")
+                        # Trigger AI processing for the new email, unless the pre-filter found it automated
+                        if not new_email.needs_ai:
+                            print(f"⏭️ Skipping AI for automated email ({new_email.automated_category}): {new_email.subject}")
+                        else:
+                            try:
+                                from Ai_processing.tasks import process_new_email_with_ai
+                                process_new_email_with_ai.delay(str(new_email.id))
+                                print(f"🤖 Queued AI processing for new email: {new_email.subject}")
+                            except Exception as ai_error:
+                                print(f"❌ Failed to queue AI processing: {str(ai_error)}")
                         
                         # Trigger HubSpot sender sync for the new email
                         try:
@@ -741,6 +773,9 @@ class FetchEmailsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+# Reads stay on the primary: cached pages and the ETag are keyed by the mailbox
+# version, and a lagging replica would store an old page under a new version
+@method_decorator(conditional_get(_mailbox_etag), name='get')
 class GetEmailsView(APIView):
     """Get fetched emails for the authenticated user"""
     permission_classes = [IsAuthenticated]
@@ -752,47 +787,57 @@ class GetEmailsView(APIView):
             limit = int(request.GET.get('limit', 50))
             offset = int(request.GET.get('offset', 0))
             
+            sender = request.GET.get('sender')
+            sender_domain = request.GET.get('sender_domain')
+            recipient = request.GET.get('recipient')
+            archived = request.GET.get('archived', '').lower() in ('1', 'true')
+            fields = requested_fields(request, EMAIL_LIST_API_FIELDS)
+            
+            # Plain inbox pages are served from the per-user page cache when possible
+            cache_key = None
+            if not (sender or sender_domain or recipient or archived or fields):
+                cache_key = inbox_page_cache_key(request.user.pk, email_account_id, limit, offset)
+            if cache_key:
+                cached_page = cache.get(cache_key)
+                record_inbox_cache_result(cached_page is not None)
+                if cached_page is not None:
+                    return Response(cached_page)
+            
             # Build query
             emails_query = EmailMessage.objects.filter(
-                email_account__user=request.user
-            ).select_related('email_account')
+                email_account__user=request.user,
+                email_account__is_disconnecting=False,
+                is_archived=archived
+            )
             
             # Filter by email account if specified
             if email_account_id:
                 emails_query = emails_query.filter(email_account_id=email_account_id)
             
+            # Filter by sender / recipient using the normalized address table
+            if sender or sender_domain:
+                emails_query = filter_by_address(emails_query, email=sender, domain=sender_domain, roles=['from'])
+            if recipient:
+                emails_query = filter_by_address(emails_query, email=recipient, roles=['to', 'cc', 'bcc'])
+            
             # Get total count
             total_count = emails_query.count()
             
             # Apply pagination
-            emails = emails_query.order_by('-received_at')[offset:offset + limit]
-            
-            # Format response
-            emails_data = []
-            for email in emails:
-                emails_data.append({
-                    'id': email.id,
-                    'subject': email.subject,
-                    'sender': email.sender,
-                    'recipients': json.loads(email.recipients) if email.recipients else [],
-                    'cc': json.loads(email.cc) if email.cc else [],
-                    'received_at': email.received_at.isoformat(),
-                    'is_read': email.is_read,
-                    'is_starred': email.is_starred,
-                    'has_attachments': email.has_attachments,
-                    'email_account': {
-                        'id': email.email_account.id,
-                        'email_address': email.email_account.email_address,
-                        'provider': email.email_account.provider
-                    }
-                })
+            emails_data = serialize_email_list(
+                emails_query.order_by('-received_at')[offset:offset + limit], fields
+            )
             
-            return Response({
+            page = {
                 'emails': emails_data,
                 'total_count': total_count,
                 'limit': limit,
                 'offset': offset
-            })
+            }
+            if cache_key:
+                cache.set(cache_key, page, settings.INBOX_CACHE_TIMEOUT)
+            
+            return Response(page)
             
         except Exception as e:
             return Response({
@@ -800,6 +845,96 @@ class GetEmailsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class InboxCacheStatsView(APIView):
+    """Hit/miss metrics of the inbox page cache (global, so staff only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(get_inbox_cache_stats())
+
+
+@method_decorator(read_from_replica, name='get')
+class ContactHistoryView(APIView):
+    """Timeline of all mail from or to one address"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            email = (request.GET.get('email') or '').strip().lower()
+            limit = int(request.GET.get('limit', 50))
+            offset = int(request.GET.get('offset', 0))
+            
+            if not email:
+                return Response({
+                    'message': 'Email address is required'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                address = EmailAddress.objects.get(email=email)
+            except EmailAddress.DoesNotExist:
+                return Response({
+                    'message': 'No mail found for this address'
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            links = EmailMessageAddress.objects.filter(
+                address=address,
+                email_message__email_account__user=request.user,
+                email_message__email_account__is_disconnecting=False
+            )
+            summary = links.aggregate(
+                messages_from=Count('email_message', filter=Q(role='from'), distinct=True),
+                messages_to=Count('email_message', filter=~Q(role='from'), distinct=True),
+                first_seen=Min('received_at'),
+                last_seen=Max('received_at')
+            )
+            
+            if not summary['messages_from'] and not summary['messages_to']:
+                return Response({
+                    'message': 'No mail found for this address'
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            # The name as this user's own latest mail wrote it; EmailAddress is shared by
+            # every user and keeps whatever name was seen first
+            display_name = links.exclude(display_name='').order_by('-received_at').values_list(
+                'display_name', flat=True
+            ).first() or ''
+            
+            emails_query = filter_by_address(
+                EmailMessage.objects.filter(
+                    email_account__user=request.user,
+                    email_account__is_disconnecting=False
+                ),
+                email=email
+            )
+            emails_data = serialize_email_list(
+                emails_query.order_by('-received_at')[offset:offset + limit],
+                requested_fields(request, EMAIL_LIST_API_FIELDS)
+            )
+            
+            return Response({
+                'contact': {
+                    'email': address.email,
+                    'display_name': display_name,
+                    'domain': address.domain
+                },
+                'messages_from': summary['messages_from'],
+                'messages_to': summary['messages_to'],
+                'first_seen': summary['first_seen'],
+                'last_seen': summary['last_seen'],
+                'emails': emails_data,
+                'total_count': emails_query.count(),
+                'limit': limit,
+                'offset': offset
+            })
+            
+        except Exception as e:
+            return Response({
+                'message': f'Failed to get contact history: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@method_decorator(conditional_get(_email_content_etag), name='get')
+@method_decorator(read_from_replica, name='get')
 class GetEmailContentView(APIView):
     """Get full content of a specific email"""
     permission_classes = [IsAuthenticated]
@@ -807,39 +942,21 @@ class GetEmailContentView(APIView):
     def get(self, request, email_id):
         try:
             # Get the email
-            try:
-                email = EmailMessage.objects.select_related('email_account').get(
+            email_data = serialize_email_content(
+                EmailMessage.objects.filter(
                     id=email_id,
                     email_account__user=request.user
-                )
-            except EmailMessage.DoesNotExist:
+                ),
+                fields=requested_fields(request, EMAIL_CONTENT_API_FIELDS),
+                body_limit=body_limit_param(request)
+            )
+            if email_data is None:
                 return Response({
                     'message': 'Email not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
             # Return email content
-            return Response({
-                'id': email.id,
-                'subject': email.subject,
-                'sender': email.sender,
-                'recipients': json.loads(email.recipients) if email.recipients else [],
-                'cc': json.loads(email.cc) if email.cc else [],
-                'received_at': email.received_at.isoformat(),
-                'is_read': email.is_read,
-                'is_starred': email.is_starred,
-                'has_attachments': email.has_attachments,
-                'body_html': email.body_html,
-                'body_plain': email.body_plain,
-                'content': email.body_html or email.body_plain or 'No content available',
-                'gmail_message_id': email.gmail_message_id,
-                'gmail_thread_id': email.gmail_thread_id,
-                'importance': email.importance,
-                'email_account': {
-                    'id': email.email_account.id,
-                    'email_address': email.email_account.email_address,
-                    'provider': email.email_account.provider
-                }
-            })
+            return Response(email_data)
             
         except Exception as e:
             return Response({
@@ -864,14 +981,13 @@ class MarkEmailAsReadView(APIView):
                     'message': 'Email not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Mark as read
-            email.is_read = True
-            email.save(update_fields=['is_read', 'updated_at'])
+            # Mark as read, here and in Gmail
+            apply_bulk_email_action(request.user.pk, EmailMessage.objects.filter(pk=email.pk), 'read')
             
             return Response({
                 'message': 'Email marked as read successfully',
                 'email_id': email.id,
-                'is_read': email.is_read
+                'is_read': True
             })
             
         except Exception as e:
@@ -901,11 +1017,8 @@ class MarkAllEmailsAsReadView(APIView):
                     'emails_updated': 0
                 })
             
-            # Mark all as read
-            updated_count = unread_emails.update(
-                is_read=True,
-                updated_at=timezone.now()
-            )
+            # Mark all as read, here and in Gmail
+            updated_count = apply_bulk_email_action(request.user.pk, unread_emails, 'read')
             
             return Response({
                 'message': f'Successfully marked {updated_count} emails as read',
@@ -918,6 +1031,68 @@ class MarkAllEmailsAsReadView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkEmailActionView(APIView):
+    """Apply read/unread, star/unstar or archive to a list of emails or to every email matching a filter"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        try:
+            action = request.data.get('action')
+            email_ids = request.data.get('email_ids')
+            filters = request.data.get('filter')
+            
+            if action not in BULK_EMAIL_ACTIONS:
+                return Response({
+                    'message': f"Invalid action. Choose one of: {', '.join(BULK_EMAIL_ACTIONS)}"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            if (email_ids is None) == (filters is None):
+                return Response({
+                    'message': 'Provide either email_ids or filter'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            emails_query = EmailMessage.objects.filter(
+                email_account__user=request.user,
+                email_account__is_disconnecting=False
+            )
+            
+            if email_ids is not None:
+                if not isinstance(email_ids, list) or not email_ids:
+                    return Response({
+                        'message': 'email_ids must be a non-empty list'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                emails_query = emails_query.filter(id__in=email_ids)
+            else:
+                if not isinstance(filters, dict):
+                    return Response({
+                        'message': 'filter must be an object'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                if filters.get('email_account_id'):
+                    emails_query = emails_query.filter(email_account_id=filters['email_account_id'])
+                for field in ('is_read', 'is_starred', 'is_archived'):
+                    if field in filters:
+                        emails_query = emails_query.filter(**{field: bool(filters[field])})
+                if filters.get('sender') or filters.get('sender_domain'):
+                    emails_query = filter_by_address(
+                        emails_query, email=filters.get('sender'), domain=filters.get('sender_domain'), roles=['from']
+                    )
+                if filters.get('recipient'):
+                    emails_query = filter_by_address(emails_query, email=filters['recipient'], roles=['to', 'cc', 'bcc'])
+            
+            updated_count = apply_bulk_email_action(request.user.pk, emails_query, action)
+            
+            return Response({
+                'message': f'Applied {action} to {updated_count} emails',
+                'action': action,
+                'emails_updated': updated_count
+            })
+            
+        except Exception as e:
+            return Response({
+                'message': f'Failed to apply bulk action: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ManualEmailRefreshView(APIView):
     """Manually trigger email refresh for all user's email accounts"""
     permission_classes = [IsAuthenticated]
@@ -943,9 +1118,9 @@ class ManualEmailRefreshView(APIView):
             for account in email_accounts:
                 try:
                     # Trigger the Celery task
-                    task = fetch_single_account_emails_task.delay(
-                        str(account.id), 
-                        'manual'
+                    task = fetch_single_account_emails_task.apply_async(
+                        (str(account.id), 'manual'),
+                        priority=settings.TASK_PRIORITY_HIGH
                     )
                     task_results.append({
                         'account_id': str(account.id),
@@ -974,8 +1149,30 @@ class ManualEmailRefreshView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _deletion_job_payload(job):
+    """Progress summary returned by the disconnect endpoints"""
+    progress = 100 if job.status == 'completed' else 0
+    if job.status != 'completed' and job.emails_total:
+        progress = min(99, int(job.emails_removed * 100 / job.emails_total))
+    
+    return {
+        'job_id': str(job.id),
+        'email_account_id': str(job.email_account_id),
+        'disconnected_account': job.email_address,
+        'status': job.status,
+        'progress': progress,
+        'emails_total': job.emails_total,
+        'emails_removed': job.emails_removed,
+        'fetch_logs_removed': job.fetch_logs_removed,
+        'processing_logs_removed': job.processing_logs_removed,
+        'error_message': job.error_message,
+        'created_at': job.created_at.isoformat(),
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
 class DisconnectEmailAccountView(APIView):
-    """Disconnect a Gmail account and delete all associated data properly"""
+    """Disconnect a Gmail account and remove its data in the background"""
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
@@ -998,347 +1195,360 @@ class DisconnectEmailAccountView(APIView):
                     'message': 'Email account not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Store email address for response message
-            email_address = email_account.email_address
-            
-            # Use database transaction to ensure atomicity
+            # Hide the account right away and hand the actual deletion to a worker.
+            # Re-posting for an account that is already disconnecting re-queues its job.
             with transaction.atomic():
-                # Step 1: Count associated data before deletion for reporting
-                emails_count = EmailMessage.objects.filter(email_account=email_account).count()
-                fetch_logs_count = EmailFetchLog.objects.filter(email_account=email_account).count()
+                email_account.is_active = False
+                email_account.is_disconnecting = True
+                email_account.access_token = None
+                email_account.refresh_token = None
+                email_account.save(update_fields=[
+                    'is_active', 'is_disconnecting', 'access_token', 'refresh_token', 'updated_at'
+                ])
                 
-                print(f"Starting deletion for account {email_address}")
-                print(f"Found {emails_count} emails and {fetch_logs_count} fetch logs")
+                job = AccountDeletionJob.objects.filter(
+                    email_account_id=email_account.id,
+                    status__in=['pending', 'running', 'failed']
+                ).first()
                 
-                # Step 2: Delete AI processing logs first (they depend on EmailMessage)
-                processing_logs_count = 0
-                try:
-                    from Ai_processing.models import EmailProcessingLog
-                    processing_logs = EmailProcessingLog.objects.filter(
-                        email_message__email_account=email_account
+                if job is None:
+                    job = AccountDeletionJob.objects.create(
+                        user=request.user,
+                        email_account_id=email_account.id,
+                        email_address=email_account.email_address,
+                        emails_total=EmailMessage.objects.filter(email_account=email_account).count()
                     )
-                    processing_logs_count = processing_logs.count()
-                    
-                    if processing_logs_count > 0:
-                        # Delete in batches to avoid issues
-                        deleted_processing_logs = 0
-                        while True:
-                            batch = list(processing_logs[:100])
-                            if not batch:
-                                break
-                            EmailProcessingLog.objects.filter(id__in=[log.id for log in batch]).delete()
-                            deleted_processing_logs += len(batch)
-                            print(f"Deleted {len(batch)} processing logs (total: {deleted_processing_logs})")
-                        
-                        print(f"Deleted {processing_logs_count} AI processing logs")
-                except ImportError:
-                    print("AI processing module not available")
-                except Exception as e:
-                    print(f"Error deleting AI processing logs: {e}")
-                
-                # Step 3: Handle self-referencing EmailMessage relationships with raw SQL
-                # This is the most robust way to handle complex parent_email relationships
-                try:
-                    from django.db import connection
-                    with connection.cursor() as cursor:
-                        # First, clear ALL parent_email references that point to messages from this account
-                        cursor.execute("""
-                            UPDATE User_emailmessage 
-                            SET parent_email_id = NULL 
-                            WHERE parent_email_id IN (
-                                SELECT id FROM User_emailmessage WHERE email_account_id = %s
-                            )
-                        """, [str(email_account.id)])
-                        parent_refs_cleared = cursor.rowcount
-                        print(f"Cleared {parent_refs_cleared} parent_email references using raw SQL")
-                        
-                        # Also clear parent_email references for messages in this account
-                        cursor.execute("""
-                            UPDATE User_emailmessage 
-                            SET parent_email_id = NULL 
-                            WHERE email_account_id = %s AND parent_email_id IS NOT NULL
-                        """, [str(email_account.id)])
-                        self_refs_cleared = cursor.rowcount
-                        print(f"Cleared {self_refs_cleared} self-references using raw SQL")
-                        
-                except Exception as e:
-                    print(f"Error clearing parent_email references with raw SQL: {e}")
-                    # Fallback to Django ORM
-                    account_emails = EmailMessage.objects.filter(email_account=email_account)
-                    
-                    # Clear parent_email references where parent belongs to this account
-                    parent_refs_cleared = EmailMessage.objects.filter(
-                        parent_email__in=account_emails
-                    ).update(parent_email=None)
-                    print(f"Cleared {parent_refs_cleared} parent_email references with ORM")
-                    
-                    # Also clear parent_email references for emails in this account
-                    self_refs_cleared = account_emails.filter(
-                        parent_email__isnull=False
-                    ).update(parent_email=None)
-                    print(f"Cleared {self_refs_cleared} self-references with ORM")
-                
-                # Step 4: Delete EmailFetchLog records in batches
-                fetch_logs = EmailFetchLog.objects.filter(email_account=email_account)
-                deleted_fetch_logs = 0
-                batch_size = 200
-                while True:
-                    batch = list(fetch_logs[:batch_size])
-                    if not batch:
-                        break
-                    EmailFetchLog.objects.filter(id__in=[log.id for log in batch]).delete()
-                    deleted_fetch_logs += len(batch)
-                    if deleted_fetch_logs % 1000 == 0:
-                        print(f"Deleted {deleted_fetch_logs} fetch logs so far...")
-                
-                print(f"Deleted {deleted_fetch_logs} fetch logs")
-                
-                # Step 5: Delete EmailMessage records in small batches
-                deleted_emails = 0
-                batch_size = 50  # Small batch size for safety
-                
-                while True:
-                    email_batch = list(EmailMessage.objects.filter(email_account=email_account)[:batch_size])
-                    if not email_batch:
-                        break
-                    
-                    try:
-                        # Double-check that parent_email is None for all messages in batch
-                        EmailMessage.objects.filter(
-                            id__in=[e.id for e in email_batch],
-                            parent_email__isnull=False
-                        ).update(parent_email=None)
-                        
-                        # Delete this batch
-                        EmailMessage.objects.filter(id__in=[e.id for e in email_batch]).delete()
-                        deleted_emails += len(email_batch)
-                        
-                        if deleted_emails % 100 == 0:
-                            print(f"Deleted {deleted_emails} emails so far...")
-                            
-                    except Exception as e:
-                        print(f"Error deleting email batch: {e}")
-                        # Try to delete one by one
-                        for email in email_batch:
-                            try:
-                                email.parent_email = None
-                                email.save()
-                                email.delete()
-                                deleted_emails += 1
-                            except Exception as email_error:
-                                print(f"Failed to delete email {email.id}: {email_error}")
-                
-                print(f"Deleted {deleted_emails} emails")
-                
-                # Step 6: Finally delete the EmailAccount
-                email_account.delete()
-                print(f"Deleted email account: {email_address}")
-                
-                return Response({
-                    'message': f'Successfully disconnected {email_address}',
-                    'details': {
-                        'disconnected_account': email_address,
-                        'emails_removed': emails_count,
-                        'fetch_logs_removed': fetch_logs_count,
-                        'processing_logs_removed': processing_logs_count
-                    }
-                })
+                elif job.status == 'failed':
+                    job.status = 'pending'
+                    job.error_message = ''
+                    job.save(update_fields=['status', 'error_message', 'updated_at'])
             
-        except Exception as e:
-            # Log the full error for debugging
-            import traceback
-            error_msg = str(e)
-            full_trace = traceback.format_exc()
-            print(f"Error disconnecting email account: {error_msg}")
-            print(f"Full traceback: {full_trace}")
+            from .tasks import delete_email_account_data_task
+            try:
+                delete_email_account_data_task.delay(str(job.id))
+            except Exception as e:
+                # The pending job is saved; resume_account_deletions_task queues it once the broker is back
+                logger.error(f"Could not queue deletion job {job.id}, leaving it for the resume task: {str(e)}")
             
-            # Provide more helpful error message
-            if "FOREIGN KEY constraint failed" in error_msg:
-                error_msg = "There are still database references preventing deletion. This is a database constraint issue."
+            return Response({
+                'message': f'Disconnecting {email_account.email_address}. Associated data is being removed in the background.',
+                'details': _deletion_job_payload(job)
+            }, status=status.HTTP_202_ACCEPTED)
             
+        except Exception as e:
+            logger.error(f"Error disconnecting email account: {str(e)}")
             return Response({
-                'message': f'Failed to disconnect email account: {error_msg}'
+                'message': f'Failed to disconnect email account: {str(e)}'
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ReplyToEmailView(APIView):
-    """Reply to an email"""
+class DisconnectEmailAccountStatusView(APIView):
+    """Report progress of a background account disconnect"""
     permission_classes = [IsAuthenticated]
     
-    def post(self, request, email_id):
+    def get(self, request, job_id):
+        try:
+            job = AccountDeletionJob.objects.get(id=job_id, user=request.user)
+        except AccountDeletionJob.DoesNotExist:
+            return Response({
+                'message': 'Disconnect job not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'message': f'Disconnect of {job.email_address} is {job.status}',
+            'details': _deletion_job_payload(job)
+        })
+
+
+def _store_sent_reply(user_id, original_email, reply_message_data, send_result):
+    """Store a sent reply with its addresses and tell the user's open dashboards"""
+    email_account = original_email.email_account
+    reply_email = EmailMessage.objects.create(
+        email_account=email_account,
+        gmail_message_id=send_result.get('id', ''),
+        gmail_thread_id=send_result.get('threadId', original_email.gmail_thread_id),
+        subject=reply_message_data['subject'],
+        sender=email_account.email_address,
+        recipients=dump_address_list(reply_message_data['to_emails']),
+        cc=dump_address_list(reply_message_data['cc_emails']),
+        body_html=reply_message_data['body_html'],
+        body_plain=reply_message_data['body_plain'],
+        received_at=timezone.now(),
+        message_type='reply',
+        parent_email=original_email,
+        conversation_id=original_email.gmail_thread_id,
+        in_reply_to=original_email.gmail_message_id,
+        references=reply_message_data['references'],
+        is_read=True  # Our own sent emails are marked as read
+    )
+    record_message_addresses(reply_email)
+    publish_event_on_commit(user_id, 'email.reply_sent', {
+        'email_id': original_email.id,
+        'reply_id': reply_email.id,
+        'subject': reply_email.subject,
+        'automated': False,
+    })
+    return reply_email
+
+
+@csrf_exempt
+@require_POST
+@async_auth_required
+async def reply_to_email(request, email_id):
+    """
+    Reply to an email.
+    Async so waiting on Gmail (and a token refresh) does not hold a worker thread.
+    """
+    try:
+        # Get the original email
+        try:
+            original_email = await EmailMessage.objects.select_related('email_account').aget(
+                id=email_id,
+                email_account__user=request.user
+            )
+        except EmailMessage.DoesNotExist:
+            return JsonResponse({
+                'message': 'Original email not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # Get reply data
+        data = json.loads(request.body or b'{}')
+        reply_text = data.get('reply_text')
+        reply_type = data.get('reply_type', 'reply')  # 'reply' or 'reply_all'
+        
+        if not reply_text:
+            return JsonResponse({
+                'message': 'Reply text is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if reply_type not in ['reply', 'reply_all']:
+            return JsonResponse({
+                'message': 'Invalid reply type. Use "reply" or "reply_all"'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Check if we have valid tokens for the email account
+        email_account = original_email.email_account
+        if not email_account.access_token:
+            return JsonResponse({
+                'message': 'No access token available for this email account'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Prepare original email data for reply
+        original_email_data = {
+            'subject': original_email.subject,
+            'sender': original_email.sender,
+            'recipients': load_address_list(original_email.recipients),
+            'cc': load_address_list(original_email.cc),
+            'body_html': original_email.body_html,
+            'body_plain': original_email.body_plain,
+            'gmail_message_id': original_email.gmail_message_id,
+            'gmail_thread_id': original_email.gmail_thread_id,
+            'references': original_email.references
+        }
+        
+        # Create reply message
+        reply_message_data = GmailService(
+            email_account.access_token,
+            email_account.refresh_token
+        ).create_reply_message(original_email_data, reply_text, reply_type)
+        
+        if not reply_message_data:
+            return JsonResponse({
+                'message': 'Failed to create reply message'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        # Send the reply
+        try:
+            raw_message = build_raw_message(
+                from_email=email_account.email_address,
+                to_emails=reply_message_data['to_emails'],
+                subject=reply_message_data['subject'],
+                body_html=reply_message_data['body_html'],
+                body_plain=reply_message_data['body_plain'],
+                cc_emails=reply_message_data['cc_emails'],
+                in_reply_to=reply_message_data['in_reply_to'],
+                references=reply_message_data['references']
+            )
+            send_result = await gmail_api.send_message(email_account, raw_message, reply_message_data['thread_id'])
+        except Exception as send_error:
+            logger.error(f"Error sending reply email: {str(send_error)}")
+            return JsonResponse({
+                'message': f'Failed to send reply email: {str(send_error)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if not send_result:
+            return JsonResponse({
+                'message': 'Failed to send reply email - no result returned from Gmail API'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        # Store the reply in our database
+        reply_email = await sync_to_async(_store_sent_reply)(
+            request.user.pk, original_email, reply_message_data, send_result
+        )
+        
+        return JsonResponse({
+            'message': 'Reply sent successfully',
+            'reply_id': reply_email.id,
+            'gmail_message_id': send_result.get('id', ''),
+            'thread_id': send_result.get('threadId', ''),
+            'recipients': reply_message_data['to_emails'],
+            'cc_recipients': reply_message_data['cc_emails']
+        }, encoder=DjangoJSONEncoder)
+        
+    except Exception as e:
+        return JsonResponse({
+            'message': f'Failed to send reply: {str(e)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@method_decorator(read_from_replica, name='get')
+class GetEmailRepliesView(APIView):
+    """Get all replies for a specific email thread"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, email_id):
         try:
             # Get the original email
             try:
-                original_email = EmailMessage.objects.select_related('email_account').get(
+                original_email = EmailMessage.objects.only('gmail_thread_id').get(
                     id=email_id,
                     email_account__user=request.user
                 )
             except EmailMessage.DoesNotExist:
                 return Response({
-                    'message': 'Original email not found'
+                    'message': 'Email not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Get reply data
-            reply_text = request.data.get('reply_text')
-            reply_type = request.data.get('reply_type', 'reply')  # 'reply' or 'reply_all'
-            
-            if not reply_text:
-                return Response({
-                    'message': 'Reply text is required'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            if reply_type not in ['reply', 'reply_all']:
-                return Response({
-                    'message': 'Invalid reply type. Use "reply" or "reply_all"'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check if we have valid tokens for the email account
-            email_account = original_email.email_account
-            if not email_account.access_token:
-                return Response({
-                    'message': 'No access token available for this email account'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            # Get all emails in the same conversation/thread
+            thread_emails = EmailMessage.objects.filter(
+                email_account__user=request.user,
+                gmail_thread_id=original_email.gmail_thread_id
+            ).order_by('received_at')
             
-            # Initialize Gmail service
-            gmail_service = GmailService(
-                email_account.access_token,
-                email_account.refresh_token
+            # Format response; ?fields= and ?body_limit= keep long threads small
+            emails_data = serialize_email_conversation(
+                thread_emails,
+                fields=requested_fields(request, EMAIL_CONVERSATION_API_FIELDS),
+                body_limit=body_limit_param(request)
             )
             
-            # Prepare original email data for reply
-            original_email_data = {
-                'subject': original_email.subject,
-                'sender': original_email.sender,
-                'recipients': json.loads(original_email.recipients) if original_email.recipients else [],
-                'cc': json.loads(original_email.cc) if original_email.cc else [],
-                'body_html': original_email.body_html,
-                'body_plain': original_email.body_plain,
-                'gmail_message_id': original_email.gmail_message_id,
-                'gmail_thread_id': original_email.gmail_thread_id,
-                'references': original_email.references
-            }
-            
-            # Create reply message
-            reply_message_data = gmail_service.create_reply_message(
-                original_email_data, 
-                reply_text, 
-                reply_type
-            )
+            return Response({
+                'original_email_id': email_id,
+                'thread_id': original_email.gmail_thread_id,
+                'conversation_emails': emails_data,
+                'total_emails': len(emails_data)
+            })
             
-            if not reply_message_data:
+        except Exception as e:
+            return Response({
+                'message': f'Failed to get email replies: {str(e)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@method_decorator(read_from_replica, name='get')
+class GetEmailThreadView(APIView):
+    """
+    Thread metadata and one page of message headers with previews.
+    Bodies are loaded per message with GetThreadMessageView.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, email_id):
+        try:
+            limit = min(int(request.GET.get('limit', 20)), 100)
+            offset = int(request.GET.get('offset', 0))
+            if limit <= 0 or offset < 0:
                 return Response({
-                    'message': 'Failed to create reply message'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                    'message': 'limit must be positive and offset not negative'
+                }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Send the reply
+            # Any message of the thread identifies it
             try:
-                send_result = gmail_service.send_email(
-                    from_email=email_account.email_address,
-                    to_emails=reply_message_data['to_emails'],
-                    subject=reply_message_data['subject'],
-                    body_html=reply_message_data['body_html'],
-                    body_plain=reply_message_data['body_plain'],
-                    cc_emails=reply_message_data['cc_emails'],
-                    in_reply_to=reply_message_data['in_reply_to'],
-                    references=reply_message_data['references'],
-                    thread_id=reply_message_data['thread_id']
+                email = EmailMessage.objects.only('gmail_thread_id', 'subject').get(
+                    id=email_id,
+                    email_account__user=request.user
                 )
-            except Exception as send_error:
-                print(f"Error sending reply email: {str(send_error)}")
-                import traceback
-                traceback.print_exc()
-                return Response({
-                    'message': f'Failed to send reply email: {str(send_error)}'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            if not send_result:
+            except EmailMessage.DoesNotExist:
                 return Response({
-                    'message': 'Failed to send reply email - no result returned from Gmail API'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                    'message': 'Email not found'
+                }, status=status.HTTP_404_NOT_FOUND)
             
-            # Store the reply in our database
-            reply_email = EmailMessage.objects.create(
-                email_account=email_account,
-                gmail_message_id=send_result.get('id', ''),
-                gmail_thread_id=send_result.get('threadId', original_email.gmail_thread_id),
-                subject=reply_message_data['subject'],
-                sender=email_account.email_address,
-                recipients=json.dumps(reply_message_data['to_emails']),
-                cc=json.dumps(reply_message_data['cc_emails']) if reply_message_data['cc_emails'] else '',
-                body_html=reply_message_data['body_html'],
-                body_plain=reply_message_data['body_plain'],
-                received_at=timezone.now(),
-                message_type='reply',
-                parent_email=original_email,
-                conversation_id=original_email.gmail_thread_id,
-                in_reply_to=original_email.gmail_message_id,
-                references=reply_message_data['references'],
-                is_read=True  # Our own sent emails are marked as read
+            thread_emails = EmailMessage.objects.filter(
+                email_account__user=request.user,
+                gmail_thread_id=email.gmail_thread_id
+            )
+            summary = serialize_thread_summary(thread_emails)
+            messages = serialize_thread_messages(
+                thread_emails.order_by('received_at')[offset:offset + limit]
             )
             
             return Response({
-                'message': 'Reply sent successfully',
-                'reply_id': reply_email.id,
-                'gmail_message_id': send_result.get('id', ''),
-                'thread_id': send_result.get('threadId', ''),
-                'recipients': reply_message_data['to_emails'],
-                'cc_recipients': reply_message_data['cc_emails']
+                'thread_id': email.gmail_thread_id,
+                'subject': email.subject,
+                **summary,
+                'messages': messages,
+                'limit': limit,
+                'offset': offset,
+                'has_more': offset + len(messages) < summary['total_messages']
             })
             
         except Exception as e:
             return Response({
-                'message': f'Failed to send reply: {str(e)}'
+                'message': f'Failed to get email thread: {str(e)}'
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class GetEmailRepliesView(APIView):
-    """Get all replies for a specific email thread"""
+@method_decorator(read_from_replica, name='get')
+class GetThreadMessageView(APIView):
+    """
+    Body of one thread message with its quoted history collapsed.
+    quoted=True (the .../quoted/ route) returns the collapsed history instead.
+    """
     permission_classes = [IsAuthenticated]
+    quoted = False
     
     def get(self, request, email_id):
         try:
-            # Get the original email
-            try:
-                original_email = EmailMessage.objects.select_related('email_account').get(
+            body = serialize_thread_message_body(
+                EmailMessage.objects.filter(
                     id=email_id,
                     email_account__user=request.user
-                )
-            except EmailMessage.DoesNotExist:
+                ),
+                quoted=self.quoted
+            )
+            if body is None:
                 return Response({
                     'message': 'Email not found'
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # Get all emails in the same conversation/thread
-            thread_emails = EmailMessage.objects.filter(
-                email_account__user=request.user,
-                gmail_thread_id=original_email.gmail_thread_id
-            ).order_by('received_at')
-            
-            # Format response
-            emails_data = []
-            for email in thread_emails:
-                emails_data.append({
-                    'id': email.id,
-                    'subject': email.subject,
-                    'sender': email.sender,
-                    'recipients': json.loads(email.recipients) if email.recipients else [],
-                    'cc': json.loads(email.cc) if email.cc else [],
-                    'received_at': email.received_at.isoformat(),
-                    'message_type': email.message_type,
-                    'is_read': email.is_read,
-                    'body_html': email.body_html,
-                    'body_plain': email.body_plain,
-                    'parent_email_id': email.parent_email.id if email.parent_email else None
-                })
-            
-            return Response({
-                'original_email_id': email_id,
-                'thread_id': original_email.gmail_thread_id,
-                'conversation_emails': emails_data,
-                'total_emails': len(emails_data)
-            })
+            return Response(body)
             
         except Exception as e:
             return Response({
-                'message': f'Failed to get email replies: {str(e)}'
+                'message': f'Failed to get email body: {str(e)}'
             }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class EventsTicketView(APIView):
+    """Short-lived ticket for opening the event stream, which only accepts credentials in its URL"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        return Response({
+            'ticket': issue_events_ticket(request.user),
+            'expires_in': settings.JWT_EVENTS_TICKET_LIFETIME
+        })
+
+
+async def email_events_stream(request):
+    """Server-sent event stream of new mail, AI results, sent replies and HubSpot syncs for one user"""
+    user = await aauthenticate_request(request, allow_query_ticket=True)
+    if user is None:
+        return JsonResponse({
+            'message': 'Authentication credentials were not provided or are invalid'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    
+    response = StreamingHttpResponse(stream_events(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
@@ -0,0 +1,5 @@
+# Load the Celery app with Django, so tasks queued from web processes use its
+# broker settings and queue routes
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
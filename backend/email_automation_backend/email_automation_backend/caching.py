@@ -0,0 +1,45 @@
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+
+
+def cache_is_shared(alias='default'):
+    """
+    Whether a cache is seen by every process (web and Celery workers).
+    The LocMem fallback used without CACHE_REDIS_URL is per process, so state a
+    worker writes there (a mailbox version, say) never reaches the web processes.
+    """
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def conditional_get(etag_func):
+    """
+    ETag validation for a polled GET view.
+    etag_func(request, *args, **kwargs) returns a cheap validator, or None to skip
+    validation. When the client's If-None-Match still matches, a 304 is returned
+    without running the view. Successful responses carry the ETag and are marked
+    private and always revalidated.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            etag = etag_func(request, *args, **kwargs)
+            if etag is None:
+                return view_func(request, *args, **kwargs)
+
+            etag = quote_etag(etag)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                response.headers.setdefault('ETag', etag)
+
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapped_view
+
+    return decorator
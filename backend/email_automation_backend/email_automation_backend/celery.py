@@ -1,4 +1,5 @@
 import os
+import time
 from celery import Celery
 from django.conf import settings
 
@@ -21,6 +22,14 @@ app.conf.beat_schedule = {
         'task': 'User.tasks.fetch_all_emails_task',
         'schedule': 20.0,  # Run every 20 seconds
     },
+    'resume-account-deletions-every-5-minutes': {
+        'task': 'User.tasks.resume_account_deletions_task',
+        'schedule': 300.0,  # Run every 5 minutes
+    },
+    'poll-ai-batches': {
+        'task': 'Ai_processing.tasks.poll_ai_batches',
+        'schedule': settings.AI_BATCH_POLL_SECONDS,
+    },
 }
 
 app.conf.timezone = 'UTC'
@@ -28,3 +37,11 @@ app.conf.timezone = 'UTC'
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+
+@app.task
+def queue_probe(sent_at, work_seconds=0):
+    """Seconds the probe waited in its queue; measure_queue_latency sends these"""
+    waited = time.time() - sent_at
+    time.sleep(work_seconds)
+    return waited
@@ -0,0 +1,63 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Database alias that reads should use for the current request, if any
+_read_alias = ContextVar('read_db_alias', default=None)
+
+
+def _sticky_key(user_id):
+    return f'db_primary_sticky:{user_id}'
+
+
+def mark_primary_sticky(user):
+    """Send this user's reads to the primary for a short while after they wrote something"""
+    if user is not None and user.is_authenticated and settings.DATABASE_READ_REPLICAS:
+        cache.set(_sticky_key(user.pk), True, settings.READ_REPLICA_STICKY_SECONDS)
+
+
+def choose_replica(user=None):
+    """Pick a replica alias for a read-only request, or None to stay on the primary"""
+    replicas = settings.DATABASE_READ_REPLICAS
+    if not replicas:
+        return None
+    if user is not None and user.is_authenticated and cache.get(_sticky_key(user.pk)):
+        return None
+    return random.choice(replicas)
+
+
+def read_from_replica(view_func):
+    """
+    Route the ORM reads of a read-only view to a replica.
+    Writes always go to the primary, and users who just wrote read from the primary too.
+    """
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        alias = choose_replica(getattr(request, 'user', None))
+        if alias is None:
+            return view_func(request, *args, **kwargs)
+
+        token = _read_alias.set(alias)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+
+    return wrapped_view
+
+
+class ReadReplicaRouter:
+    """Sends reads inside read_from_replica views to a replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
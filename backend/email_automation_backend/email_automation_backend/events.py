@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _channel(user_id):
+    return f'user_events:{user_id}'
+
+
+def sse_frame(event_type, data):
+    """One server-sent event"""
+    return f"event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _sse_frame(message):
+    """Format a published message as a server-sent event"""
+    event = json.loads(message)
+    return sse_frame(event['type'], event['data'])
+
+
+class InProcessBroker:
+    """
+    Fans events out to streams served by this process.
+    Only useful in development, when tasks run in the same process as the server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+
+broker = InProcessBroker()
+_redis_client = None
+
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(settings.EVENTS_REDIS_URL)
+    return _redis_client
+
+
+def publish_event(user_id, event_type, data=None):
+    """Push an event to every open stream of a user. Failures are logged, never raised."""
+    message = json.dumps({'type': event_type, 'data': data or {}}, cls=DjangoJSONEncoder)
+    try:
+        if settings.EVENTS_REDIS_URL:
+            _get_redis_client().publish(_channel(user_id), message)
+        else:
+            broker.publish(_channel(user_id), message)
+    except Exception as e:
+        logger.warning(f"Failed to publish {event_type} event for user {user_id}: {str(e)}")
+
+
+def publish_event_on_commit(user_id, event_type, data=None):
+    """Publish once the current transaction commits, so clients never fetch rows that are not there yet"""
+    transaction.on_commit(lambda: publish_event(user_id, event_type, data))
+
+
+async def stream_events(user_id):
+    """Async iterator of server-sent event frames for one user, with keep-alive comments"""
+    channel = _channel(user_id)
+    heartbeat = settings.EVENTS_HEARTBEAT_SECONDS
+
+    if settings.EVENTS_REDIS_URL:
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(settings.EVENTS_REDIS_URL)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            yield ': connected\n\n'
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _sse_frame(message['data'])
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+    else:
+        subscriber = broker.subscribe(channel)
+        try:
+            yield ': connected\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber[1].get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _sse_frame(message)
+        finally:
+            broker.unsubscribe(channel, subscriber)
@@ -0,0 +1,57 @@
+# Sparse fieldsets for list and detail endpoints: clients pass ?fields=a,b,c and
+# only those fields are read from the database and returned.
+
+
+class FieldSelectionError(ValueError):
+    pass
+
+
+def requested_fields(request, available):
+    """
+    Field names requested with ?fields=, in request order, or None when the
+    parameter is absent. Raises FieldSelectionError for unknown names.
+    """
+    raw = request.GET.get('fields')
+    if raw is None:
+        return None
+
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if name and name not in fields:
+            fields.append(name)
+
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise FieldSelectionError(
+            f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(available)}"
+        )
+    return fields
+
+
+def select_value_fields(fields, sources=None):
+    """
+    values() names needed to build the requested API fields.
+    sources maps API fields that are built from other columns to those columns.
+    """
+    sources = sources or {}
+    selected = []
+    for name in fields:
+        for value_field in sources.get(name, (name,)):
+            if value_field not in selected:
+                selected.append(value_field)
+    return selected
+
+
+def body_limit_param(request):
+    """Positive ?body_limit= value, or None"""
+    raw = request.GET.get('body_limit')
+    if not raw:
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise FieldSelectionError('body_limit must be a positive integer')
+    if limit <= 0:
+        raise FieldSelectionError('body_limit must be a positive integer')
+    return limit
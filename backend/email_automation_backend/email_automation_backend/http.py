@@ -0,0 +1,54 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+
+# One pooled client per event loop: httpx clients cannot be shared across loops,
+# and under the ASGI server every request runs on the same loop
+_clients = weakref.WeakKeyDictionary()
+
+
+_sync_client = None
+_sync_client_pid = None
+_sync_client_lock = threading.Lock()
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE
+    )
+
+
+def get_sync_client():
+    """
+    Process-wide httpx.Client with pooled keep-alive connections, for sync code
+    (views, Celery tasks). A forked worker builds its own instead of sharing the parent's sockets.
+    """
+    global _sync_client, _sync_client_pid
+    pid = os.getpid()
+    if _sync_client is None or _sync_client_pid != pid or _sync_client.is_closed:
+        with _sync_client_lock:
+            if _sync_client is None or _sync_client_pid != pid or _sync_client.is_closed:
+                _sync_client = httpx.Client(
+                    timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT_SECONDS),
+                    limits=_limits()
+                )
+                _sync_client_pid = pid
+    return _sync_client
+
+
+def get_async_client():
+    """Shared httpx.AsyncClient for the running event loop, with pooled keep-alive connections"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT_SECONDS),
+            limits=_limits()
+        )
+        _clients[loop] = client
+    return client
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from .db_router import mark_primary_sticky
+
+try:
+    import brotli
+except ImportError:  # Fall back to gzip
+    brotli = None
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaStickinessMiddleware(MiddlewareMixin):
+    """After a user's own write, keep their reads on the primary so they see it immediately"""
+
+    def process_response(self, request, response):
+        # DRF copies the authenticated user back onto the Django request
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_primary_sticky(getattr(request, 'user', None))
+        return response
+
+
+def _accepted_encodings(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses larger than COMPRESSION_MIN_SIZE with brotli, when it is
+    installed and accepted, or gzip. Streaming responses such as the event
+    stream are passed through untouched so events are not held back.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = _accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+            compressed = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+            compressed = compress_string(response.content)
+        else:
+            return response
+
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(response.content))
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed body is no longer byte-identical to what a strong ETag promised
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'email_automation_backend.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'email_automation_backend.middleware.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'email_automation_backend.urls'
@@ -93,6 +95,62 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma separated database names (sqlite paths locally). Each one
+# becomes a 'replicaN' alias used by views decorated with read_from_replica.
+DATABASE_READ_REPLICAS = []
+for replica_index, replica_name in enumerate(
+    [name.strip() for name in os.getenv('DATABASE_REPLICAS', '').split(',') if name.strip()], start=1
+):
+    DATABASES[f'replica{replica_index}'] = {
+        'ENGINE': DATABASES['default']['ENGINE'],
+        'NAME': replica_name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_READ_REPLICAS.append(f'replica{replica_index}')
+
+DATABASE_ROUTERS = ['email_automation_backend.db_router.ReadReplicaRouter']
+
+# Seconds a user's reads stay on the primary after one of their own writes
+READ_REPLICA_STICKY_SECONDS = int(os.getenv('READ_REPLICA_STICKY_SECONDS', '10'))
+
+# Rendered inbox pages cached per user (first N pages, invalidated by mailbox version).
+# Only used with a shared cache (CACHE_REDIS_URL).
+INBOX_CACHE_PAGES = int(os.getenv('INBOX_CACHE_PAGES', '3'))
+INBOX_CACHE_TIMEOUT = int(os.getenv('INBOX_CACHE_TIMEOUT', '300'))
+
+# LLM results cached by content hash: seconds since last use, and entries kept by
+# the in-process fallback (least recently used go first)
+LLM_CACHE_TIMEOUT = int(os.getenv('LLM_CACHE_TIMEOUT', '604800'))  # 7 days
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+
+# Cache (shared between processes when Redis is configured). For the "llm" cache
+# Redis should run with maxmemory-policy allkeys-lru.
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        },
+        'llm': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+            'KEY_PREFIX': 'llm',
+            'TIMEOUT': LLM_CACHE_TIMEOUT,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'llm': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'llm-results',
+            'TIMEOUT': LLM_CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': LLM_CACHE_MAX_ENTRIES, 'CULL_FREQUENCY': 10},
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -198,17 +256,100 @@ OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
 # JWT Configuration
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)
 JWT_ACCESS_TOKEN_LIFETIME = int(os.getenv('JWT_ACCESS_TOKEN_LIFETIME', '3600'))  # 1 hour
-JWT_REFRESH_TOKEN_LIFETIME = int(os.getenv('JWT_REFRESH_TOKEN_LIFETIME', '86400'))  # 1 day
+JWT_REFRESH_TOKEN_LIFETIME = int(os.getenv('JWT_REFRESH_TOKEN_LIFETIME', '2592000'))  # 30 days
+# Seconds an event stream ticket (the only credential accepted in the stream URL) stays valid
+JWT_EVENTS_TICKET_LIFETIME = int(os.getenv('JWT_EVENTS_TICKET_LIFETIME', '60'))
+# Without a shared cache, seconds a process may go before reloading revoked access tokens
+JWT_REVOCATION_RELOAD_SECONDS = int(os.getenv('JWT_REVOCATION_RELOAD_SECONDS', '5'))
+# Seconds a rotated refresh token may be presented again (two tabs refreshing at once)
+# without being treated as leaked
+JWT_REFRESH_REUSE_GRACE = int(os.getenv('JWT_REFRESH_REUSE_GRACE', '60'))
+
+# Seconds a resolved user (with company, HubSpot account, AI settings) stays cached for authentication.
+# Only used with a shared cache (CACHE_REDIS_URL).
+AUTH_CACHE_TIMEOUT = int(os.getenv('AUTH_CACHE_TIMEOUT', '60'))
+
+# Seconds a user's AI processing settings stay cached; saves invalidate them right away
+AI_SETTINGS_CACHE_TIMEOUT = int(os.getenv('AI_SETTINGS_CACHE_TIMEOUT', '300'))
+
+# Analyse an email and draft its reply in one LLM call instead of two
+AI_COMBINED_REPLY_MODE = os.getenv('AI_COMBINED_REPLY_MODE', 'True').lower() == 'true'
+# Ask the provider for JSON mode (response_format=json_object); models that
+# reject it are asked again without it
+AI_JSON_RESPONSE_FORMAT = os.getenv('AI_JSON_RESPONSE_FORMAT', 'True').lower() == 'true'
+
+# Email bodies are cleaned for prompts (HTML to text, no quoted history,
+# signatures or disclaimers) and cut to this many tokens, keeping the head,
+# tail and key lines; `manage.py measure_prompt_inputs` shows the savings
+AI_PROMPT_PREPROCESSING = os.getenv('AI_PROMPT_PREPROCESSING', 'True').lower() == 'true'
+AI_PROMPT_BODY_TOKEN_BUDGET = int(os.getenv('AI_PROMPT_BODY_TOKEN_BUDGET', '1500'))
+
+# Reuse the analysis of a near-identical email (templated mail) processed in the
+# last NEAR_DUPLICATE_WINDOW_DAYS. Distances are SimHash bits out of 64 and at
+# most 5, the largest the six-band index is guaranteed to find.
+NEAR_DUPLICATE_REUSE = os.getenv('NEAR_DUPLICATE_REUSE', 'True').lower() == 'true'
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '5'))
+NEAR_DUPLICATE_MIN_WORDS = int(os.getenv('NEAR_DUPLICATE_MIN_WORDS', '30'))
+NEAR_DUPLICATE_WINDOW_DAYS = int(os.getenv('NEAR_DUPLICATE_WINDOW_DAYS', '30'))
+NEAR_DUPLICATE_MAX_CANDIDATES = int(os.getenv('NEAR_DUPLICATE_MAX_CANDIDATES', '50'))
+
+# AI processing in Celery workers: emails processed at once per worker process
+# (run AI workers with -P threads so tasks share the engine), and processing
+# logs written per transaction in bulk runs
+AI_ENGINE_CONCURRENCY = int(os.getenv('AI_ENGINE_CONCURRENCY', '16'))
+AI_ENGINE_WRITE_BATCH_SIZE = int(os.getenv('AI_ENGINE_WRITE_BATCH_SIZE', '20'))
+
+# Ingest pre-filter for automated mail (User/prefilter.py): categories whose
+# emails are never sent to the LLM. Automated mail is never auto-replied to.
+AI_PREFILTER_ENABLED = os.getenv('AI_PREFILTER_ENABLED', 'True').lower() == 'true'
+AI_PREFILTER_SKIP_CATEGORIES = [
+    category.strip() for category in
+    os.getenv('AI_PREFILTER_SKIP_CATEGORIES', 'bounce,auto_reply,calendar,mailing_list,no_reply').split(',')
+    if category.strip()
+]
+
+# Shared limiter for calls to the LLM provider, per provider key: requests and
+# tokens per minute (0 turns a limit off), how long a call may wait for
+# capacity before it is deferred, and attempts per call on 429s and outages
+AI_RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.getenv('AI_RATE_LIMIT_REQUESTS_PER_MINUTE', '500'))
+AI_RATE_LIMIT_TOKENS_PER_MINUTE = int(os.getenv('AI_RATE_LIMIT_TOKENS_PER_MINUTE', '200000'))
+AI_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('AI_RATE_LIMIT_MAX_WAIT_SECONDS', '20'))
+AI_LLM_MAX_ATTEMPTS = int(os.getenv('AI_LLM_MAX_ATTEMPTS', '3'))
+# Circuit breaker: outage errors in a row that open it, and its cooldown, which
+# doubles on every reopening up to the maximum. Tasks deferred while it is open
+# retry up to AI_UNAVAILABLE_MAX_RETRIES times.
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '5'))
+AI_CIRCUIT_COOLDOWN_SECONDS = int(os.getenv('AI_CIRCUIT_COOLDOWN_SECONDS', '30'))
+AI_CIRCUIT_MAX_COOLDOWN_SECONDS = int(os.getenv('AI_CIRCUIT_MAX_COOLDOWN_SECONDS', '600'))
+AI_UNAVAILABLE_MAX_RETRIES = int(os.getenv('AI_UNAVAILABLE_MAX_RETRIES', '20'))
+
+# Offline batch mode for bulk processing (mode='batch'): requests go to an
+# OpenAI-compatible batch API (OpenRouter has none; point AI_BATCH_BASE_URL at
+# `manage.py mock_batch_server` to test locally). Failed requests are
+# resubmitted until AI_BATCH_MAX_ATTEMPTS. Batch mode is refused without its own
+# AI_BATCH_API_KEY (OPENAI_API_KEY holds the OpenRouter key, not one for this API).
+AI_BATCH_API_KEY = os.getenv('AI_BATCH_API_KEY', '')
+AI_BATCH_BASE_URL = os.getenv('AI_BATCH_BASE_URL', 'https://api.openai.com/v1')
+AI_BATCH_MODEL = os.getenv('AI_BATCH_MODEL', 'gpt-4o-mini')
+AI_BATCH_COMPLETION_WINDOW = os.getenv('AI_BATCH_COMPLETION_WINDOW', '24h')
+AI_BATCH_MAX_EMAILS = int(os.getenv('AI_BATCH_MAX_EMAILS', '5000'))
+AI_BATCH_MAX_ATTEMPTS = int(os.getenv('AI_BATCH_MAX_ATTEMPTS', '3'))
+AI_BATCH_POLL_SECONDS = float(os.getenv('AI_BATCH_POLL_SECONDS', '300'))
 
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'Accounts.authentication.AccessTokenAuthentication',
+        'Accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'email_automation_backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50
 }
@@ -221,9 +362,77 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Celery queues: each kind of work has its own queue and worker pool, so bulk
+# AI runs or a HubSpot backlog never sit in front of an auto-reply. Worker
+# commands per queue are at the top of requirements.txt. Tasks not listed
+# here go to the maintenance queue.
+CELERY_TASK_DEFAULT_QUEUE = 'maintenance'
+CELERY_TASK_ROUTES = {
+    'User.tasks.fetch_all_emails_task': {'queue': 'fetch'},
+    'User.tasks.fetch_single_account_emails_task': {'queue': 'fetch'},
+    'Ai_processing.tasks.process_new_email_with_ai': {'queue': 'ai_interactive'},
+    'Ai_processing.tasks.generate_ai_reply_for_email': {'queue': 'ai_interactive'},
+    'Ai_processing.tasks.bulk_process_emails_with_ai': {'queue': 'ai_bulk'},
+    'Ai_processing.tasks.poll_ai_batches': {'queue': 'ai_bulk'},
+    'Ai_processing.tasks.send_automated_reply': {'queue': 'outbound'},
+    'User.tasks.sync_gmail_labels_task': {'queue': 'outbound'},
+    'User.tasks.sync_email_sender_to_hubspot': {'queue': 'crm'},
+    'hubspot_integration.tasks.sync_email_sender_to_hubspot': {'queue': 'crm'},
+    'hubspot_integration.tasks.bulk_sync_contacts_to_hubspot': {'queue': 'crm'},
+    'hubspot_integration.tasks.refresh_hubspot_tokens': {'queue': 'crm'},
+}
+
+# Priorities within a queue; with the Redis broker lower numbers are served first.
+# Work a user is waiting on (a button in the dashboard) is queued as high.
+TASK_PRIORITY_HIGH = 0
+TASK_PRIORITY_NORMAL = 3
+TASK_PRIORITY_LOW = 6
+CELERY_TASK_DEFAULT_PRIORITY = TASK_PRIORITY_NORMAL
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': [TASK_PRIORITY_HIGH, TASK_PRIORITY_NORMAL, TASK_PRIORITY_LOW],
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # Unacknowledged tasks are redelivered after this long, so it must exceed the
+    # longest task (a bulk AI run)
+    'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', '3600')),
+}
+
+# Tasks are acknowledged once they finish, so a worker that dies mid-task hands
+# it to another worker; tasks that must not run twice opt out (send_automated_reply).
+# One task reserved per worker slot keeps long tasks from hoarding short ones.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # Celery Beat Settings
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Outgoing HTTP (Google, HubSpot, LLM): one pooled client per process for sync code
+# and one per event loop for async views
+HTTP_CLIENT_TIMEOUT_SECONDS = float(os.getenv('HTTP_CLIENT_TIMEOUT_SECONDS', '30'))
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv('HTTP_CLIENT_MAX_CONNECTIONS', '100'))
+HTTP_CLIENT_MAX_KEEPALIVE = int(os.getenv('HTTP_CLIENT_MAX_KEEPALIVE', '20'))
+
+# Real-time events (server-sent events). Without a Redis URL events are only
+# delivered to streams served by the publishing process, which suits development.
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', '')
+EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+
+# Email account disconnect: rows deleted per committed chunk, and how long a
+# deletion job may go without progress before it is re-queued
+ACCOUNT_DELETION_CHUNK_SIZE = int(os.getenv('ACCOUNT_DELETION_CHUNK_SIZE', '500'))
+ACCOUNT_DELETION_STALE_MINUTES = int(os.getenv('ACCOUNT_DELETION_STALE_MINUTES', '10'))
+# Failed jobs are resumed after STALE_MINUTES * 2^resumes (at most a day), up to this many times
+ACCOUNT_DELETION_MAX_RESUMES = int(os.getenv('ACCOUNT_DELETION_MAX_RESUMES', '8'))
+
+# Response compression: bodies smaller than this are sent as-is; brotli is used
+# when installed and accepted by the client, gzip otherwise
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+
+# Bulk message actions: message IDs per Gmail users.messages.batchModify call (API maximum is 1000)
+GMAIL_BATCH_MODIFY_SIZE = int(os.getenv('GMAIL_BATCH_MODIFY_SIZE', '1000'))
+
 # Logging Configuration
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_DIR = os.getenv('LOG_DIR', 'logs')
@@ -7,5 +7,5 @@ class HubspotIntegrationConfig(AppConfig):
     verbose_name = 'HubSpot Integration'
     
     def ready(self):
-        # App ready - no model patching needed with simplified approach
-        pass
+        # Keep the daily contact sync rollups current
+        from . import signals  # noqa: F401
@@ -96,3 +96,13 @@ class HubSpotOAuthCallbackSerializer(serializers.Serializer):
     state = serializers.CharField(required=False)
     error = serializers.CharField(required=False)
     error_description = serializers.CharField(required=False)
+
+
+def serialize_contacts(queryset):
+    """Serialize HubSpot contacts for list responses from a values() projection"""
+    return list(queryset.values(*HubSpotContactSerializer.Meta.fields))
+
+
+def serialize_sync_logs(queryset, fields=None):
+    """Serialize HubSpot sync logs for list responses from a values() projection"""
+    return list(queryset.values(*(fields or HubSpotSyncLogSerializer.Meta.fields)))
@@ -1,4 +1,5 @@
 import requests
+import httpx
 import logging
 from datetime import datetime, timedelta
 from django.conf import settings
@@ -7,6 +8,9 @@ from urllib.parse import urlencode
 import time
 from .models import HubSpotAccount, HubSpotContact, HubSpotSyncLog
 from .utils import log_success, log_failure, is_token_expired, is_connected
+from User.utils import get_sender_address
+from email_automation_backend.http import get_async_client
+from Ai_processing.stats import get_contact_sync_counts
 
 logger = logging.getLogger(__name__)
 
@@ -39,34 +43,49 @@ class HubSpotOAuthService:
             
         return f"{self.auth_url}?{urlencode(params)}"
     
+    def _code_exchange_data(self, authorization_code):
+        return {
+            'grant_type': 'authorization_code',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'redirect_uri': self.redirect_uri,
+            'code': authorization_code
+        }
+    
+    def _code_exchange_result(self, token_data):
+        return {
+            'access_token': token_data.get('access_token'),
+            'refresh_token': token_data.get('refresh_token'),
+            'expires_in': token_data.get('expires_in', 3600),
+            'token_type': token_data.get('token_type'),
+            'hub_id': token_data.get('hub_id'),
+            'hub_domain': token_data.get('hub_domain')
+        }
+    
     def exchange_code_for_tokens(self, authorization_code):
         """Exchange authorization code for access and refresh tokens"""
         try:
-            data = {
-                'grant_type': 'authorization_code',
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'redirect_uri': self.redirect_uri,
-                'code': authorization_code
-            }
-            
-            response = requests.post(self.token_url, data=data)
+            response = requests.post(self.token_url, data=self._code_exchange_data(authorization_code))
             response.raise_for_status()
             
-            token_data = response.json()
-            return {
-                'access_token': token_data.get('access_token'),
-                'refresh_token': token_data.get('refresh_token'),
-                'expires_in': token_data.get('expires_in', 3600),
-                'token_type': token_data.get('token_type'),
-                'hub_id': token_data.get('hub_id'),
-                'hub_domain': token_data.get('hub_domain')
-            }
+            return self._code_exchange_result(response.json())
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to exchange code for tokens: {str(e)}")
             raise Exception(f"OAuth token exchange failed: {str(e)}")
     
+    async def aexchange_code_for_tokens(self, authorization_code):
+        """Async exchange_code_for_tokens over the pooled HTTP client"""
+        try:
+            response = await get_async_client().post(self.token_url, data=self._code_exchange_data(authorization_code))
+            response.raise_for_status()
+            
+            return self._code_exchange_result(response.json())
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to exchange code for tokens: {str(e)}")
+            raise Exception(f"OAuth token exchange failed: {str(e)}")
+    
     def refresh_access_token(self, refresh_token):
         """Refresh access token using refresh token"""
         try:
@@ -103,6 +122,19 @@ class HubSpotOAuthService:
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get account info: {str(e)}")
             raise Exception(f"Failed to get account info: {str(e)}")
+    
+    async def aget_account_info(self, access_token):
+        """Async get_account_info over the pooled HTTP client"""
+        try:
+            headers = {'Authorization': f'Bearer {access_token}'}
+            response = await get_async_client().get(f"{self.base_url}/account-info/v3/details", headers=headers)
+            response.raise_for_status()
+            
+            return response.json()
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to get account info: {str(e)}")
+            raise Exception(f"Failed to get account info: {str(e)}")
 
 
 class HubSpotAPIService:
@@ -361,8 +393,8 @@ class HubSpotContactService:
         """Sync email sender information to HubSpot"""
         try:
             # Extract sender information
-            sender_email = email_message.sender
-            sender_name = self._extract_sender_name(email_message)
+            sender_email, sender_name, _ = get_sender_address(email_message)
+            sender_email = sender_email or email_message.sender
             first_name, last_name = self._parse_name(sender_name)
             company_name = self._extract_company_from_email(sender_email)
             
@@ -430,13 +462,7 @@ class HubSpotContactService:
     
     def _extract_sender_name(self, email_message):
         """Extract sender name from email message"""
-        # Try to extract name from sender field if it contains both name and email
-        sender = email_message.sender
-        if '<' in sender and '>' in sender:
-            # Format: "John Doe <john@example.com>"
-            name_part = sender.split('<')[0].strip().strip('"\'')
-            return name_part if name_part else ''
-        return ''
+        return get_sender_address(email_message)[1]
     
     def _parse_name(self, full_name):
         """Parse full name into first and last name"""
@@ -474,22 +500,9 @@ class HubSpotContactService:
     
     def get_sync_statistics(self):
         """Get synchronization statistics for this user"""
-        total_contacts = self.hubspot_account.contacts.count()
-        synced_contacts = self.hubspot_account.contacts.filter(
-            sync_status='synced'
-        ).count()
-        failed_contacts = self.hubspot_account.contacts.filter(
-            sync_status='failed'
-        ).count()
-        pending_contacts = self.hubspot_account.contacts.filter(
-            sync_status='pending'
-        ).count()
-        
+        # Counts come from the daily rollups, not from scanning contacts
         return {
-            'total_contacts': total_contacts,
-            'synced_contacts': synced_contacts,
-            'failed_contacts': failed_contacts,
-            'pending_contacts': pending_contacts,
+            **get_contact_sync_counts(self.user),
             'last_sync': self.hubspot_account.last_sync_at
         }
     
@@ -0,0 +1,54 @@
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from Ai_processing.stats import CONTACT_METRIC_PREFIX, record_daily_stats
+from .models import HubSpotAccount, HubSpotContact
+
+
+def _account_user_id(hubspot_account_id):
+    return HubSpotAccount.objects.filter(pk=hubspot_account_id).values_list('user_id', flat=True).first()
+
+
+@receiver(pre_save, sender=HubSpotContact)
+def contact_before_save(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        instance._stored_sync_status = None
+        return
+    instance._stored_sync_status = (
+        HubSpotContact.objects.filter(pk=instance.pk).values_list('sync_status', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=HubSpotContact)
+def contact_saved(sender, instance, raw=False, **kwargs):
+    """Move the contact between the per-status counters of today's rollup"""
+    if raw:
+        return
+    before = getattr(instance, '_stored_sync_status', None)
+    if before == instance.sync_status:
+        return
+    
+    deltas = {f'{CONTACT_METRIC_PREFIX}{instance.sync_status}': 1}
+    if before is not None:
+        deltas[f'{CONTACT_METRIC_PREFIX}{before}'] = -1
+    user_id = _account_user_id(instance.hubspot_account_id)
+    if user_id is not None:
+        record_daily_stats(user_id, timezone.localdate(), deltas)
+
+
+@receiver(post_delete, sender=HubSpotContact)
+def contact_deleted(sender, instance, **kwargs):
+    user_id = _account_user_id(instance.hubspot_account_id)
+    if user_id is None:
+        return
+    
+    def remove_from_rollup():
+        # Contacts usually go with their user, whose rollups are then gone too
+        try:
+            record_daily_stats(user_id, timezone.localdate(), {f'{CONTACT_METRIC_PREFIX}{instance.sync_status}': -1})
+        except IntegrityError:
+            pass
+    
+    transaction.on_commit(remove_from_rollup)
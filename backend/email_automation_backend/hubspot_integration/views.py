@@ -1,9 +1,12 @@
 import logging
 import uuid
-import requests
 from datetime import timedelta
 from django.utils import timezone
 from django.shortcuts import redirect
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
@@ -13,14 +16,41 @@ from .models import HubSpotAccount, HubSpotContact, HubSpotSyncLog
 from .serializers import (
     HubSpotAccountSerializer, HubSpotContactSerializer, HubSpotSyncLogSerializer,
     HubSpotConnectionStatusSerializer, HubSpotSyncStatsSerializer,
-    HubSpotOAuthInitSerializer, HubSpotOAuthCallbackSerializer
+    HubSpotOAuthInitSerializer, HubSpotOAuthCallbackSerializer,
+    serialize_contacts, serialize_sync_logs
 )
 from .services import HubSpotOAuthService, HubSpotContactService
 from .utils import is_connected, is_token_expired
+from email_automation_backend.caching import conditional_get
+from email_automation_backend.fieldsets import requested_fields, FieldSelectionError
+from email_automation_backend.db_router import read_from_replica
+from email_automation_backend.http import get_async_client
+from Ai_processing.stats import get_contact_stats_version
+from Accounts.authentication import async_auth_required
 
 logger = logging.getLogger(__name__)
 
 
+def _hubspot_status_etag(request, *args, **kwargs):
+    """Validator for the connection status, from the account's updated_at and token expiry"""
+    account = HubSpotAccount.objects.filter(user=request.user).values(
+        'updated_at', 'token_expires_at'
+    ).first()
+    if account is None:
+        return None
+    expired = not account['token_expires_at'] or timezone.now() >= account['token_expires_at']
+    return f"{request.user.pk}-{account['updated_at'].timestamp()}-{int(expired)}"
+
+
+def _sync_statistics_etag(request, *args, **kwargs):
+    """Validator for sync statistics, from the last change to the contact rollups"""
+    account_etag = _hubspot_status_etag(request)
+    if account_etag is None:
+        return None
+    last_updated = get_contact_stats_version(request.user)
+    return f"{account_etag}-{last_updated.timestamp() if last_updated else 0}"
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def debug_oauth_logs(request):
@@ -70,6 +100,8 @@ def hubspot_debug_oauth_url(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_hubspot_status_etag)
+@read_from_replica
 def hubspot_status(request):
     """Get user's HubSpot connection status"""
     try:
@@ -169,16 +201,19 @@ def init_hubspot_oauth(request):
         )
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def test_hubspot_connection(request):
-    """Test HubSpot connection and return detailed status information"""
+@require_GET
+@async_auth_required
+async def test_hubspot_connection(request):
+    """
+    Test HubSpot connection and return detailed status information.
+    Async so the HubSpot round trip does not hold a worker thread.
+    """
     try:
         # Check if user has HubSpot account
         try:
-            hubspot_account = request.user.hubspot_account
+            hubspot_account = await sync_to_async(getattr)(request.user, 'hubspot_account')
         except HubSpotAccount.DoesNotExist:
-            return Response({
+            return JsonResponse({
                 'connected': False,
                 'error': 'No HubSpot account found',
                 'error_type': 'no_account',
@@ -207,7 +242,7 @@ def test_hubspot_connection(request):
                 'recommendation': 'Reconnect your HubSpot account',
                 'next_step': 'Call /api/hubspot/oauth/init/ to reconnect'
             })
-            return Response(connection_info)
+            return JsonResponse(connection_info, encoder=DjangoJSONEncoder)
         
         # Test API connectivity
         try:
@@ -215,8 +250,8 @@ def test_hubspot_connection(request):
             api_service = HubSpotAPIService(hubspot_account)
             
             # Try to make a simple API call to test connectivity
-            headers = api_service._get_headers()
-            response = requests.get(
+            headers = await sync_to_async(api_service._get_headers)()
+            response = await get_async_client().get(
                 f"{api_service.base_url}/crm/v3/objects/contacts",
                 headers=headers,
                 params={'limit': 1}
@@ -243,11 +278,11 @@ def test_hubspot_connection(request):
                 'recommendation': 'API test failed - token may be invalid or scopes insufficient'
             })
         
-        return Response(connection_info)
+        return JsonResponse(connection_info, encoder=DjangoJSONEncoder)
         
     except Exception as e:
         logger.error(f"Failed to test HubSpot connection for user {request.user.email}: {str(e)}")
-        return Response({
+        return JsonResponse({
             'connected': False,
             'error': 'Connection test failed',
             'error_type': 'test_error',
@@ -255,10 +290,9 @@ def test_hubspot_connection(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['GET'])
-@permission_classes([])  # No authentication required for OAuth callback
-def hubspot_oauth_callback(request):
-    """Handle HubSpot OAuth callback"""
+@require_GET  # No authentication required for OAuth callback
+async def hubspot_oauth_callback(request):
+    """Handle HubSpot OAuth callback (async, the token exchange and account lookup are awaited)"""
     try:
         # Extract callback parameters
         code = request.GET.get('code')
@@ -279,8 +313,8 @@ def hubspot_oauth_callback(request):
             return redirect(f"{settings.FRONTEND_URL}/dashboard?hubspot_error=no_code")
         
         # Validate state parameter with improved handling
-        session_state = request.session.get('hubspot_oauth_state')
-        session_user_id = request.session.get('hubspot_oauth_user')
+        session_state = await request.session.aget('hubspot_oauth_state')
+        session_user_id = await request.session.aget('hubspot_oauth_user')
         
         logger.info(f"State validation - Session state: {session_state}, Callback state: {state}")
         
@@ -331,20 +365,20 @@ def hubspot_oauth_callback(request):
         # Get user
         from Accounts.models import User
         try:
-            user = User.objects.get(id=user_id)
+            user = await User.objects.aget(id=user_id)
         except User.DoesNotExist:
             logger.error(f"User {user_id} not found")
             return redirect(f"{settings.FRONTEND_URL}/dashboard?hubspot_error=user_not_found")
         
         # Exchange code for tokens
         oauth_service = HubSpotOAuthService()
-        token_data = oauth_service.exchange_code_for_tokens(code)
+        token_data = await oauth_service.aexchange_code_for_tokens(code)
         
         # Get account information
-        account_info = oauth_service.get_account_info(token_data['access_token'])
+        account_info = await oauth_service.aget_account_info(token_data['access_token'])
         
         # Create or update HubSpot account
-        hubspot_account, created = HubSpotAccount.objects.get_or_create(
+        hubspot_account, created = await HubSpotAccount.objects.aget_or_create(
             user=user,
             defaults={
                 'hubspot_user_id': account_info.get('user', ''),
@@ -368,11 +402,11 @@ def hubspot_oauth_callback(request):
             hubspot_account.refresh_token = token_data['refresh_token']
             hubspot_account.token_expires_at = timezone.now() + timedelta(seconds=token_data.get('expires_in', 3600))
             hubspot_account.status = 'connected'
-            hubspot_account.save()
+            await hubspot_account.asave()
         
         # Clean up session
-        request.session.pop('hubspot_oauth_state', None)
-        request.session.pop('hubspot_oauth_user', None)
+        await request.session.apop('hubspot_oauth_state', None)
+        await request.session.apop('hubspot_oauth_user', None)
         
         logger.info(f"Successfully connected HubSpot account for user {user.email}")
         
@@ -415,6 +449,7 @@ def disconnect_hubspot(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def get_hubspot_contacts(request):
     """Get user's HubSpot contacts"""
     try:
@@ -427,15 +462,14 @@ def get_hubspot_contacts(request):
         start = (page - 1) * page_size
         end = start + page_size
         
-        paginated_contacts = contacts[start:end]
-        serializer = HubSpotContactSerializer(paginated_contacts, many=True)
+        total = contacts.count()
         
         return Response({
-            'contacts': serializer.data,
-            'total': contacts.count(),
+            'contacts': serialize_contacts(contacts[start:end]),
+            'total': total,
             'page': page,
             'page_size': page_size,
-            'has_next': end < contacts.count()
+            'has_next': end < total
         })
         
     except HubSpotAccount.DoesNotExist:
@@ -453,6 +487,8 @@ def get_hubspot_contacts(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get(_sync_statistics_etag)
+@read_from_replica
 def get_sync_statistics(request):
     """Get HubSpot synchronization statistics"""
     try:
@@ -497,11 +533,13 @@ def get_sync_statistics(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_from_replica
 def get_sync_logs(request):
     """Get HubSpot synchronization logs"""
     try:
         hubspot_account = request.user.hubspot_account
         logs = hubspot_account.sync_logs.all().order_by('-created_at')
+        fields = requested_fields(request, HubSpotSyncLogSerializer.Meta.fields)
         
         # Pagination
         page_size = int(request.GET.get('page_size', 20))
@@ -509,15 +547,14 @@ def get_sync_logs(request):
         start = (page - 1) * page_size
         end = start + page_size
         
-        paginated_logs = logs[start:end]
-        serializer = HubSpotSyncLogSerializer(paginated_logs, many=True)
+        total = logs.count()
         
         return Response({
-            'logs': serializer.data,
-            'total': logs.count(),
+            'logs': serialize_sync_logs(logs[start:end], fields),
+            'total': total,
             'page': page,
             'page_size': page_size,
-            'has_next': end < logs.count()
+            'has_next': end < total
         })
         
     except HubSpotAccount.DoesNotExist:
@@ -525,6 +562,8 @@ def get_sync_logs(request):
             {'error': 'No HubSpot account found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    except FieldSelectionError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         logger.error(f"Failed to get sync logs for user {request.user.email}: {str(e)}")
         return Response(
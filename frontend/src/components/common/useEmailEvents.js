@@ -0,0 +1,98 @@
+import { useEffect, useRef } from 'react'
+import ENV from '../../../config'
+
+const EVENT_TYPES = [
+  'email.received',
+  'email.reply_sent',
+  'ai.analysis_completed',
+  'hubspot.contact_synced'
+]
+
+const MAX_REOPEN_ATTEMPTS = 3
+
+// EventSource cannot send headers, so the stream is opened with a short-lived
+// ticket in its URL instead of the access token
+const fetchTicket = async () => {
+  const response = await fetch(`${ENV.API_BASE_URL}/api/events/ticket/`, {
+    method: 'POST',
+    headers: {
+      'Authorization': `Token ${localStorage.getItem('authToken')}`
+    }
+  })
+  if (!response.ok) {
+    throw new Error('Could not get an event stream ticket')
+  }
+  const data = await response.json()
+  return data.ticket
+}
+
+// Subscribes to the server-sent event stream for the logged in user.
+// The browser reconnects on its own if the connection drops; once the ticket
+// has expired the server rejects the reconnect and the stream closes, so it is
+// reopened with a new ticket.
+const useEmailEvents = (onEvent) => {
+  const handlerRef = useRef(onEvent)
+
+  useEffect(() => {
+    handlerRef.current = onEvent
+  }, [onEvent])
+
+  useEffect(() => {
+    if (!localStorage.getItem('authToken') || typeof EventSource === 'undefined') {
+      return undefined
+    }
+
+    let source = null
+    let closed = false
+    let failures = 0
+
+    const listener = (event) => {
+      try {
+        handlerRef.current(event.type, JSON.parse(event.data))
+      } catch (error) {
+        console.error('Failed to handle event:', error)
+      }
+    }
+
+    const open = async () => {
+      let ticket
+      try {
+        ticket = await fetchTicket()
+      } catch (error) {
+        console.error('Failed to open event stream:', error)
+        return
+      }
+      if (closed) {
+        return
+      }
+      source = new EventSource(
+        `${ENV.API_BASE_URL}/api/events/?ticket=${encodeURIComponent(ticket)}`
+      )
+      EVENT_TYPES.forEach((type) => source.addEventListener(type, listener))
+      source.onopen = () => {
+        failures = 0
+      }
+      source.onerror = () => {
+        // Give up after a few rejected reopens, so a broken server does not spin tickets
+        if (source.readyState !== EventSource.CLOSED || closed || failures >= MAX_REOPEN_ATTEMPTS) {
+          return
+        }
+        failures += 1
+        EVENT_TYPES.forEach((type) => source.removeEventListener(type, listener))
+        setTimeout(open, failures * 1000)
+      }
+    }
+
+    open()
+
+    return () => {
+      closed = true
+      if (source) {
+        EVENT_TYPES.forEach((type) => source.removeEventListener(type, listener))
+        source.close()
+      }
+    }
+  }, [])
+}
+
+export default useEmailEvents
@@ -2,9 +2,12 @@ import { StrictMode } from 'react'
 import { createRoot } from 'react-dom/client'
 import { Provider } from 'react-redux'
 import store from './redux/store.js'
+import { installAuthFetch } from './redux/authFetch.js'
 import './index.css'
 import App from './App.jsx'
 
+installAuthFetch(store)
+
 createRoot(document.getElementById('root')).render(
   <StrictMode>
     <Provider store={store}>
@@ -10,6 +10,7 @@ import CurrentEmployees from '../../components/admin/CurrentEmployees'
 import InviteEmployee from '../../components/admin/InviteEmployee'
 import HubSpotIntegration from '../../components/hubspot/HubSpotIntegration'
 import ENV from '../../../config'
+import useEmailEvents from '../../components/common/useEmailEvents'
 
 const AdminDashboard = () => {
   const dispatch = useDispatch()
@@ -37,6 +38,13 @@ const AdminDashboard = () => {
     fetchEmails()
   }, [])
 
+  // New mail and reply updates are pushed by the server instead of polled
+  useEmailEvents((type) => {
+    if (type === 'email.received' || type === 'email.reply_sent') {
+      fetchEmails()
+    }
+  })
+
   const fetchEmailAccounts = async () => {
     try {
       console.log('Fetching email accounts...')
@@ -9,6 +9,7 @@ import EmailList from '../../components/reusable/EmailList'
 import AlertMessage from '../../components/reusable/AlertMessage'
 import HubSpotIntegration from '../../components/hubspot/HubSpotIntegration'
 import ENV from '../../../config'
+import useEmailEvents from '../../components/common/useEmailEvents'
 
 const EmployeeDashboard = () => {
   const dispatch = useDispatch()
@@ -30,6 +31,13 @@ const EmployeeDashboard = () => {
     fetchEmails()
   }, [])
 
+  // New mail and reply updates are pushed by the server instead of polled
+  useEmailEvents((type) => {
+    if (type === 'email.received' || type === 'email.reply_sent') {
+      fetchEmails()
+    }
+  })
+
   const fetchEmailAccounts = async () => {
     try {
       console.log('Fetching email accounts...')
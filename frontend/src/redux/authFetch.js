@@ -0,0 +1,61 @@
+import ENV from '../../config'
+import { refreshAuthToken } from './authSlice'
+
+// Access tokens are short-lived, so an API call answered with 401 refreshes the
+// token once (shared by every call failing at the same time) and is retried
+// with the new one. If the refresh fails the user is logged out.
+
+let store = null
+let pendingRefresh = null
+
+const NO_REFRESH_PATHS = ['/api/accounts/auth/login/', '/api/accounts/auth/refresh/', '/api/accounts/auth/logout/']
+
+// Refresh the access token; resolves to the new token, rejects if the session is over
+const refreshAccessToken = () => {
+  if (!pendingRefresh) {
+    pendingRefresh = store
+      .dispatch(refreshAuthToken())
+      .unwrap()
+      .then((data) => data.token)
+      .finally(() => {
+        pendingRefresh = null
+      })
+  }
+  return pendingRefresh
+}
+
+const withToken = (init, token) => {
+  const headers = new Headers(init.headers)
+  const [scheme] = (headers.get('Authorization') || 'Token').split(' ')
+  headers.set('Authorization', `${scheme} ${token}`)
+  return { ...init, headers }
+}
+
+const shouldRefresh = (input, init) => {
+  const url = typeof input === 'string' ? input : input.url
+  if (!url.startsWith(ENV.API_BASE_URL) || NO_REFRESH_PATHS.some((path) => url.includes(path))) {
+    return false
+  }
+  return new Headers(init?.headers).has('Authorization') && !!localStorage.getItem('refreshToken')
+}
+
+// Wrap window.fetch once at startup so every component's API calls get the refresh
+export const installAuthFetch = (appStore) => {
+  store = appStore
+  const originalFetch = window.fetch.bind(window)
+
+  window.fetch = async (input, init = {}) => {
+    const response = await originalFetch(input, init)
+    if (response.status !== 401 || !shouldRefresh(input, init)) {
+      return response
+    }
+
+    let token
+    try {
+      token = await refreshAccessToken()
+    } catch {
+      return response
+    }
+    return originalFetch(input, withToken(init, token))
+  }
+}
@@ -135,6 +135,11 @@ export const refreshAuthToken = createAsyncThunk(
       })
 
       if (!response.ok) {
+        // Another tab refreshed with the same token first; use the pair it stored
+        const currentRefreshToken = localStorage.getItem('refreshToken')
+        if (currentRefreshToken && currentRefreshToken !== refreshToken) {
+          return { token: localStorage.getItem('authToken'), refresh_token: currentRefreshToken }
+        }
         localStorage.removeItem('authToken')
         localStorage.removeItem('refreshToken')
         return rejectWithValue('Token refresh failed')